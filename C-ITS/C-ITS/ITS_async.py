@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# #################################################
+## ASYNCIO RUNTIME - the data link and transport & network layers run as coroutines on one asyncio
+# event loop, in a single thread, instead of one thread per entity. Facilities, application and
+# in-vehicle threads are unchanged: they exchange messages with the loop through LoopQueue objects.
+# Several nodes may share the same loop, provided that each one has its own queues and loc_table.
+#################################################
+import asyncio
+from data_link.multicast import *
+from transport_network.geonetworking import *
+
+#------------------------------------------------------------------------------------------------
+# network_coroutines - coroutines of the data link and transport & network layers of one node
+#		geonetwork_txd_queue, multicast_txd_queue, multicast_rxd_queue, beacon_rxd_queue: LoopQueue objects
+#		geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue: queues read by the facilities threads
+#		table, lock: node's loc_table and its lock (default: module loc_table)
+#		transport: None for the multicast socket, or an in-process transport (e.g. MediumPort)
+#		channel_status: dictionary where the channel load measurements are published
+#		geo_groups: True to use the geographic multicast groups (see geogroups.py)
+#		rx_stats, rcvbuf_max: dictionary where the socket drop counters are published, receive buffer ceiling
+#		stale_stats, max_age: dictionary where the messages discarded for being too old are counted, max-age budgets
+#		rx_ready, tx_ready: Events set when the reception and transmission sockets are open
+#		fused: True if multicast_rxd_queue and beacon_rxd_queue are Dispatcher objects (fused reception 
+#		       pipeline): geonetwork_rxd and beacon_rxd are not run
+#------------------------------------------------------------------------------------------------
+def network_coroutines(node, coordinates, geonetwork_txd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue,
+		multicast_txd_queue, multicast_rxd_queue, beacon_rxd_queue, codec=DEFAULT_CODEC, table=None, lock=None, transport=None,
+		channel_status=None, geo_groups=False, rx_stats=None, rcvbuf_max=RCVBUF_MAX, stale_stats=None, fused=False, rx_ready=None, tx_ready=None,
+		max_age=MAX_AGE):
+	coroutines = [
+		geonetwork_txd_async(node, geonetwork_txd_queue, multicast_txd_queue, coordinates, table),
+		beacon_txd_async(node, coordinates, multicast_txd_queue),
+		check_loc_table_async(node, table, lock),
+		multicast_rxd_async(node, multicast_rxd_queue, beacon_rxd_queue, drop_own_frames, transport, channel_status, geo_groups, coordinates,
+			rx_stats, rcvbuf_max, rx_ready),
+		multicast_txd_async(node, multicast_txd_queue, codec, coordinates, transport, TRAFFIC_CLASSES, geo_groups, tx_ready),
+	]
+	if not fused:
+		coroutines.append(geonetwork_rxd_async(node, multicast_rxd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue, stale_stats,
+			coordinates, table, multicast_txd_queue, max_age))
+		coroutines.append(beacon_rxd_async(node, beacon_rxd_queue, table, lock))
+	return coroutines
+
+#------------------------------------------------------------------------------------------------
+# Thread - event_loop - runs the coroutines on the loop once all threads are started
+#------------------------------------------------------------------------------------------------
+def event_loop(node, start_flag, loop, coroutines):
+
+	start_flag.wait()
+	print('STATUS: Ready to start - THREAD: event_loop - NODE: {}'.format(node),'\n')
+
+	asyncio.set_event_loop(loop)
+	try:
+		loop.run_until_complete(asyncio.gather(*coroutines))
+	finally:
+		loop.close()
+	return
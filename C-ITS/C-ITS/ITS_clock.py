@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# #################################################
+## CLOCK - time source of every layer. Threads read the time with now() and wait with sleep(), and the queues
+# block on Condition objects of the clock, so the same code runs on:
+#	RealClock    - wall clock (default)
+#	VirtualClock - discrete-event simulation: time only advances when every thread of the simulation is blocked
+#	               (sleeping or waiting on a queue), straight to the next wakeup. Wakeups are fired one at a
+#	               time, in (time, order of registration) order, so a scenario runs as fast as the CPU allows
+#	               and repeated runs follow the same sequence of events.
+# The clock must be installed (set_clock) before the queues and the threads of the nodes are created.
+# Note: threads of a virtual simulation must only block on the clock (sleep, queues, clock Events) - e.g.
+#       nodes use an in-process RadioMedium instead of sockets and run in headless mode.
+#################################################
+import time
+import heapq
+import threading
+from collections import deque
+
+
+#------------------------------------------------------------------------------------------------
+# RealClock - wall clock
+#------------------------------------------------------------------------------------------------
+class RealClock:
+
+	def time(self):
+		return time.time()
+
+	def sleep(self, seconds):
+		time.sleep(seconds)
+
+	def Condition(self, lock=None):
+		return threading.Condition(lock)
+
+	def Event(self):
+		return threading.Event()
+
+
+#------------------------------------------------------------------------------------------------
+# _Waiter - a thread blocked on the virtual clock, released by a notification or by its timer
+#------------------------------------------------------------------------------------------------
+class _Waiter:
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.lock.acquire()
+		self.fired = False
+		self.timed_out = False
+
+
+#------------------------------------------------------------------------------------------------
+# _Attachment - thread-local mark of a thread of the simulation; released when the thread ends (returns or
+#		fails), so that a finished thread is no longer counted as running
+#------------------------------------------------------------------------------------------------
+class _Attachment:
+
+	def __init__(self, clock):
+		self.clock = clock
+
+	def __del__(self):
+		self.clock.detach()
+
+
+#------------------------------------------------------------------------------------------------
+# VirtualClock - discrete-event scheduler
+#		running   - threads of the simulation that are not blocked. A thread joins the simulation the first
+#		            time it blocks on the clock (e.g. on the start_flag of the node); from then on every
+#		            wakeup counts it as running until it blocks again or ends.
+#		timers    - heap of (time, sequence, waiter): sleeps and timeouts
+#		start(start_flag, participants, until) - release the threads once all of them wait on start_flag and
+#		            run the scheduler thread, up to the virtual time until (None - no limit)
+#		done      - threading Event set when the simulation reaches until
+#------------------------------------------------------------------------------------------------
+class VirtualClock:
+
+	def __init__(self, start=0.0):
+		self.now = start
+		self.lock = threading.Lock()
+		self.idle = threading.Condition(self.lock)
+		self.local = threading.local()
+		self.running = 0
+		self.timers = []
+		self.sequence = 0
+		self.events = 0
+		self.until = None
+		self.done = threading.Event()
+
+	def time(self):
+		return self.now
+
+	def block(self, waiter, timeout=None):
+		# called by the thread about to block on waiter.lock
+		with self.lock:
+			if getattr(self.local, 'attachment', None) is not None:
+				self.running -= 1
+			else:
+				self.local.attachment = _Attachment(self)
+			if timeout is not None:
+				self.sequence += 1
+				heapq.heappush(self.timers, (self.now + max(timeout, 0), self.sequence, waiter))
+			if self.running == 0:
+				self.idle.notify()
+
+	def detach(self):
+		with self.lock:
+			self.running -= 1
+			if self.running == 0:
+				self.idle.notify()
+
+	def wake(self, waiter, timed_out=False):
+		# release a waiter, if it was not released yet - (out) True if it was released by this call
+		with self.lock:
+			return self._wake(waiter, timed_out)
+
+	def _wake(self, waiter, timed_out):
+		if waiter.fired:
+			return False
+		waiter.fired = True
+		waiter.timed_out = timed_out
+		self.running += 1
+		waiter.lock.release()
+		return True
+
+	def sleep(self, seconds):
+		waiter = _Waiter()
+		self.block(waiter, seconds)
+		waiter.lock.acquire()
+
+	def Condition(self, lock=None):
+		return VirtualCondition(self, lock)
+
+	def Event(self):
+		return VirtualEvent(self)
+
+	def start(self, start_flag, participants, until=None, timeout=None):
+		deadline = None if timeout is None else time.time() + timeout
+		while start_flag.waiting() < participants:
+			if (deadline is not None) and time.time() > deadline:
+				raise RuntimeError('{} of {} threads started'.format(start_flag.waiting(), participants))
+			time.sleep(0.001)
+		self.until = until
+		start_flag.set()
+		t = threading.Thread(target=self.scheduler, daemon=True)
+		t.start()
+		return t
+
+	def scheduler(self):
+		with self.lock:
+			while True:
+				while self.running > 0 or not self.timers:
+					self.idle.wait()
+				deadline, sequence, waiter = self.timers[0]
+				if (self.until is not None) and deadline > self.until:
+					self.now = self.until
+					self.done.set()
+					return
+				heapq.heappop(self.timers)
+				if waiter.fired:
+					continue
+				self.now = max(self.now, deadline)
+				self.events += 1
+				self._wake(waiter, True)
+
+
+#------------------------------------------------------------------------------------------------
+# VirtualCondition - threading.Condition whose waits are accounted by the virtual clock. A notification
+#		counts the threads it wakes as running before they are scheduled by the OS, so the clock never
+#		advances while a message is being handed over.
+#------------------------------------------------------------------------------------------------
+class VirtualCondition:
+
+	def __init__(self, clock, lock=None):
+		self.clock = clock
+		self._lock = threading.RLock() if lock is None else lock
+		self.acquire = self._lock.acquire
+		self.release = self._lock.release
+		self._waiters = deque()
+
+	def __enter__(self):
+		return self._lock.__enter__()
+
+	def __exit__(self, *args):
+		return self._lock.__exit__(*args)
+
+	def wait(self, timeout=None):
+		waiter = _Waiter()
+		self._waiters.append(waiter)
+		self.clock.block(waiter, timeout)
+		self._lock.release()
+		try:
+			waiter.lock.acquire()
+		finally:
+			self._lock.acquire()
+		if waiter.timed_out:
+			try:
+				self._waiters.remove(waiter)
+			except ValueError:
+				pass
+		return not waiter.timed_out
+
+	def wait_for(self, predicate, timeout=None):
+		endtime = None if timeout is None else self.clock.time() + timeout
+		result = predicate()
+		while not result:
+			if endtime is not None:
+				timeout = endtime - self.clock.time()
+				if timeout <= 0:
+					break
+			self.wait(timeout)
+			result = predicate()
+		return result
+
+	def notify(self, n=1):
+		woken = 0
+		while self._waiters and woken < n:
+			if self.clock.wake(self._waiters.popleft()):
+				woken += 1
+
+	def notify_all(self):
+		self.notify(len(self._waiters))
+
+
+#------------------------------------------------------------------------------------------------
+# VirtualEvent - threading.Event on a VirtualCondition (e.g. start_flag of the nodes)
+#------------------------------------------------------------------------------------------------
+class VirtualEvent:
+
+	def __init__(self, clock):
+		self.cond = VirtualCondition(clock, threading.Lock())
+		self.flag = False
+
+	def is_set(self):
+		return self.flag
+
+	def waiting(self):
+		with self.cond:
+			return len(self.cond._waiters)
+
+	def set(self):
+		with self.cond:
+			self.flag = True
+			self.cond.notify_all()
+
+	def clear(self):
+		with self.cond:
+			self.flag = False
+
+	def wait(self, timeout=None):
+		with self.cond:
+			if not self.flag:
+				self.cond.wait(timeout)
+			return self.flag
+
+
+# #####################################################################################################
+# installed clock - used by the functions below
+_clock = RealClock()
+
+def set_clock(clock):
+	global _clock
+	_clock = clock
+
+def get_clock():
+	return _clock
+
+#------------------------------------------------------------------------------------------------
+# now, sleep, Condition, Event - time.time, time.sleep, threading.Condition and threading.Event of the installed clock
+#------------------------------------------------------------------------------------------------
+def now():
+	return _clock.time()
+
+def sleep(seconds):
+	_clock.sleep(seconds)
+
+def Condition(lock=None):
+	return _clock.Condition(lock)
+
+def Event():
+	return _clock.Event()
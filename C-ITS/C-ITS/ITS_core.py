@@ -1,279 +1,491 @@
-#!/usr/bin/env python
-from socket import *
-import sys, time
-from threading import Thread, Event
-from Queue import *
-import argparse
-
-# PROTOCOL STACK - One folder per layer of VANET protocol stack. It may include more than one entity. Each entity is a different thread.
-# VANET protocol stack data link layer - multicast communication - basic emulation of logical and link layer communication.
-from data_link.multicast import *
-
-# VANET protocol stack transport & network layer - it may include: topology management, information dissemination within a ROI, location-based routing
-from transport_network.geonetworking import *
-
-# VANET protocol stack facilities layer (common services to all applications)- it may include: cooperative awareness messages, event management message
-from facilities.common_services import *
-
-# VANET protocol stack application layer - application business logic
-from application.application import *
-
-# OBU-interface with vehicles - it may include: car motor control funtions, other sensors/actuator interfaces, location information
-from in_vehicle_network.car_control import *
-
-# RSU interface with legacy systems - it may include: traffic light control funtions, other sensors/actuator interfaces, location information
-from rsu_legacy_systems.rsu_control import *
-
-# QUEUES - used to tranfer messages between adjacent layers of the protocol stack
-my_system_rxd_queue=Queue()
-movement_control_txd_queue=Queue()
-my_system_txd_queue=Queue()
-
-ca_service_txd_queue=Queue()
-den_service_txd_queue=Queue()
-services_rxd_queue=Queue()
-
-
-geonetwork_txd_queue=Queue()
-geonetwork_rxd_ca_queue=Queue()
-geonetwork_rxd_den_queue=Queue()
-beacon_rxd_queue=Queue()
-
-multicast_txd_queue=Queue()
-multicast_rxd_queue=Queue()
-
-# EVENTS  -  flags used to coordinate threads activities
-# start_flag - set when all threads started to triggered the execution of each thread logic
-start_flag=Event()
-
-
-# VARIABLES  -  shared by different threads
-# coordinates - dictionary with node's location in the format (x,y,time)
-# obd_2_interface - dictionary with the vehicle's dynamic in the format (speed, direction, heading)
-coordinates = dict()
-obd_2_interface = dict()
-
-# INPUT ARGUMENTS
-# node_id
-# node's coordinates - x, y
-# car speed - speed
-# car direction - backward (´b') or forward('f')
-# car heading - heading (H or V)
-# test type - type of debug messages that are usefull for your test - 
-##################################################
-## MAIN-ITS_core
-##################################################
-def main(argv):
-	global obd_2_interface, coordinates, obu_list, route
-
-	##
-	# OBU list item format:
-	# (obu id, x, y, time, originating rsu, route ,time of expiration)
-	##
-
-	parser = argparse.ArgumentParser(description='Process initialization.')
-	parser.add_argument('node', type=int, nargs=1, help='nodeID')
-	parser.add_argument('coordinateX', nargs=1 , type=int, help='x coordinate value')
-	parser.add_argument('coordinateY', nargs=1, type=int, help='y coordinate value')
-	parser.add_argument('velocity', nargs=1 , type=int, help='velocity value between 0 and 100')
-	parser.add_argument('direction', nargs=1, type=str, help='direction f/b')
-	parser.add_argument('heading', nargs=1, type=str, help='heading O/E/N/S')
-
-	parser.add_argument('--RSU', action='store_const', const=1, help='Run as a RSU')
-	parser.add_argument('--OBU', action='store_const', const=2, help='Run as an OBU')
-
-	parser.add_argument('--C1', action='store_const', const=1, help='C1 Route')
-	parser.add_argument('--C2', action='store_const', const=2, help='C2 Route')
-
-	args = parser.parse_args()
-	print(args)
-	command=input('Press enter to start')
-	if (len(argv)<7):
-		print('ERROR: Missing arguments: node number pos_x pos_y speed direction heading')
-		sys.exit()
-	else:
-		node_id = argv[1]
-		coordinates = {'x':int(argv[2]), 'y':int(argv[3]), 't': repr(time.time())}
-		obd_2_interface = {'speed': int(argv[4]), 'direction': argv[5], 'heading': argv[6], 'status': "0"}
-		obu_list = []
-		route = []
-		node_type = "RSU" if args.RSU == 1 else "OBU"
-		if args.RSU == 1:
-			# RSU
-			print('Starting RSU...')
-		elif args.OBU == 2:
-			# OBU
-			print('Starting OBU...')
-		if args.C1 == 1:
-			# C1
-			print('Initializing with C1 and Route((0,0),(4,0))')
-			route = [(0, 0), (4, 0)]
-		elif args.C2 == 2:
-			# C2
-			print('Initializing with C2 and Route((3,0),(0,0))')
-			route = [(3, 0), (0, 0)]
-
-	threads=[]
-
-
-	try:
-
-		##################################################
-		#  Arguments common to all threads:
-		#      node_id: node identification
-		#      startFlag: status event that indicates that all threads were launched and can start execution
-		##################################################
-
-		##################################################
-		#     Application layer threads
-		##################################################
-
-		# Thread - application_txd: send data from user/cars/legacy systems
-		# Arguments - coordinates: last known coordinates
-		#             my_system_rxd_queue: queue to send data to my_system that is relevant for business logic decision-process 
-		# 			  ca_service_txd_queue: queue to send data to ca_services_txd
-		#             den_service_txd_queue: queue to send data to den_services_txd
-		t=Thread(target=application_txd, args=(node_id, node_type, start_flag, my_system_rxd_queue, ca_service_txd_queue, den_service_txd_queue, my_system_txd_queue, obu_list,))
-		t.start()
-		threads.append(t)
-	
-
-		# Thread - application_rxd: receive data from services_rxd, process it and send it to the user/cars/legacy systems
-		# Arguments - car movement: controls the car movement
-		#           - services_rxd_queue: queue to get data from ca_service_rxd or den_service_rxd
-		#             my_system_rxd_queue: queue to send data to my_system that is relevant for business logic decision-process 
-		t=Thread(target=application_rxd, args=(node_id, start_flag, services_rxd_queue, my_system_rxd_queue,))
-		t.start()
-		threads.append(t)
-	
-
-		# Thread - my_system: business logic 
-		# Arguments - my_system_rxd_queue: queue to receive data from other application layer threads relevant for business logic decision-process 
-		#           - movement_control_txd_queue: queue to send commands to control vehicles movement
-		#			- my_system_txd_queue: queue to send data to other application layer threads
-		t=Thread(target=my_system, args=(node_id, node_type, start_flag, coordinates, obd_2_interface, my_system_rxd_queue, movement_control_txd_queue, my_system_txd_queue, obu_list,route,))
-		t.start()
-		threads.append(t)
-	
-
-		##################################################
-		#     Facilities layer threads
-		##################################################
-
-		# Thread - ca_service_txd: receive data from application_txd, generates cooperative awaraness and sends the CA message to the geonetwork_txd
-		# Arguments - coordinates: last known coordinates
-		#             ca_services_txd_queue: queue to get data from application_txd
-		#             geonetwork_txd_queue: queue to send data to geonetwork_txd
-		t=Thread(target=ca_service_txd, args=(node_id, node_type, start_flag, coordinates, obd_2_interface, ca_service_txd_queue, geonetwork_txd_queue,obu_list,route,))
-		t.start()
-		threads.append(t)
-
-		# Thread - ca_service_rxd: receive data from geonetwork_rxd, process the CA message and send the result to the application_rxd
-		# Arguments - geonetwork_rxd_ca_queue: queue to get data from geonetwork_rxd
-		#             ca_service_rxd_queue: queue to send data to application_rxd
-		t=Thread(target=ca_service_rxd, args=(node_id, start_flag, geonetwork_rxd_ca_queue, services_rxd_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread -  den_service_txd: receive data from application_txd, generates events and sends the DEN message to the geonetwork_txd
-		# Arguments - coordinates: last known coordinates
-		#             den_services_txd_queue: queue to get data from application_txd
-		# #           geonetwork_txd_queue: queue to send data to geonetwork_txd
-		t=Thread(target=den_service_txd, args=(node_id, node_type, start_flag, coordinates, obd_2_interface, den_service_txd_queue, geonetwork_txd_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread - den_service_rxd: receive data from geonetwork_rxd, process the DEN message and send the result to the application_rxd
-		# Arguments - geonetwork_rxd_den_queue: queue to get data from geonetwork_rxd
-		#             services_rxd_queue: queue to send data to application_rxd
-		#             services_txd_queue: queue to relay data to geonetwork_txd in case of multi-hop communication
-		t=Thread(target=den_service_rxd, args=(node_id, start_flag, geonetwork_rxd_den_queue, services_rxd_queue,))
-		t.start()
-		threads.append(t)
-
-		##################################################
-		#     Transport and network layer threads
-		##################################################
-
-		# Thread - geonetwork_txd: receive data from geoenetwork_txd, process the geonetwork information and send the result to the multicast_rxd
-		# Arguments - geonetwork_txd_queue: queue to get data from ca_service_txd or den_service_txd
-		#             multicast_txd_queue: queue to send data to multicast_txd
-		t=Thread(target=geonetwork_txd, args=(node_id, start_flag, geonetwork_txd_queue, multicast_txd_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread- geonetwork_rxd: receive data from multicast_rxd, process the geonetwork information and send the result to the services_rxd
-		# Arguments - multicast_rxd_queue: queue to get data from multicast_txd
-		#             geonetwork_rxd_queue: queue to send data to services_rxd, after being processed
-		t=Thread(target=geonetwork_rxd, args=(node_id, start_flag, multicast_rxd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread - beacon_txd: periodical generation of beacons
-		# Arguments - coordinates: last known coordinates
-		#             multicast_txd_queue: queue to send beacons to multicast_txd
-		t=Thread(target=beacon_txd, args=(node_id, start_flag, coordinates, multicast_txd_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread- geonetwork_rxd: receive data from multicast_rxd, process the geonetwork information and send the result to the services_rxd
-		# Arguments - multicast_rxd_queue: queue to get data from multicast_rxd
-		#             geonetwork_rxd_queue: queue to send data to services_rxd, after being processed
-		t=Thread(target=beacon_rxd, args=(node_id, start_flag, beacon_rxd_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread- check_loc_table: check loc_table_entries and deleted outdated entries
-		# Arguments - no additional argument
-		t=Thread(target=check_loc_table, args=(node_id, start_flag,))
-		t.start()
-		threads.append(t)
-
-
-		##################################################
-		#     Link layer threads
-		##################################################
-
-		# Thread - multicast_rxd: receive data from multicast socket, process and send the result to the geonetwork_rxd, after being processed, if needed
-		# Arguments - multicast_rxd_queue: queue to send data to geonetwork_rxd
-		#            beacon_rxd_queue: queue to send data to beacon_rxd
-		t=Thread(target=multicast_rxd, args=(node_id, start_flag, multicast_rxd_queue, beacon_rxd_queue,))
-		t.start()
-		threads.append(t)
-
-		# Thread - multicast_txd: receive data from geonetwork_txd and send it to the multicast socket
-		# Arguments - multicast_txd_queue: queue to get data from transmission from geonetwork_txd
-		t=Thread(target=multicast_txd, args=(node_id, start_flag, multicast_txd_queue,))
-		t.start()
-		threads.append(t)
-
-		##################################################
-		#     In-vehicles threads
-		##################################################
-
-		# Thread- update_position: update the node coordinates (x,y) to emulate the GPS device
-		# Arguments -  coordinates: dictionay with (x,y) coordinates and time instant t of measurement
-		#           - obd_2_interface: dictionary with movement information of the car
-		t=Thread(target=update_location, args=(node_id, start_flag, coordinates, obd_2_interface,))
-		t.start()
-		threads.append(t)
-
-		# Thread- update_position: update the node coordinates (x,y) to emulate the GPS device
-		# Arguments -  coordinates: dictionay with (x,y) coordinates and time instant t of measurement
-		#           - car_movement: dictionary with movement information of the car
-		t=Thread(target=movement_control, args=(node_id, start_flag, coordinates, obd_2_interface, movement_control_txd_queue,))
-		t.start()
-		threads.append(t)
-
-		start_flag.set()
-
-	except:
-		#exit the program if there is an error when opening one of the threads
-		print('STATUS: Error opening one of the threads -  NODE: {}'.format(node_id),'\n')
-		for t in threads:
-			t.join()
-			sys.exit()
-	return
-
-if __name__=="__main__":
-	main(sys.argv[0:])
+#!/usr/bin/env python
+from socket import *
+import sys, time
+from threading import Thread, Event, Lock
+from Queue import *
+import argparse
+import asyncio
+import multiprocessing
+
+# PROTOCOL STACK - One folder per layer of VANET protocol stack. It may include more than one entity. Each entity is a different thread.
+# VANET protocol stack data link layer - multicast communication - basic emulation of logical and link layer communication.
+from data_link.multicast import *
+
+# VANET protocol stack transport & network layer - it may include: topology management, information dissemination within a ROI, location-based routing
+from transport_network.geonetworking import *
+
+# VANET protocol stack facilities layer (common services to all applications)- it may include: cooperative awareness messages, event management message
+from facilities.common_services import *
+
+# VANET protocol stack application layer - application business logic
+from application.application import *
+
+# OBU-interface with vehicles - it may include: car motor control funtions, other sensors/actuator interfaces, location information
+from in_vehicle_network.car_control import *
+
+# RSU interface with legacy systems - it may include: traffic light control funtions, other sensors/actuator interfaces, location information
+from rsu_legacy_systems.rsu_control import *
+
+# asyncio runtime - data link and transport & network layers as coroutines of one event loop
+from ITS_async import *
+
+# clock - wall clock, or virtual clock of a simulation (see ITS_clock.py)
+from ITS_clock import now
+
+# shared-memory channel - transport of the data link for nodes running on the same host
+from data_link.shmchannel import ShmPort, CHANNEL_NAME
+
+# split node mode - data link and transport & network layers in a second process, connected by shared-memory rings
+from ITS_split import *
+
+# QUEUES - used to tranfer messages between adjacent layers of the protocol stack, created for each node by start_node
+# Queues are bounded, with an overflow policy suited to their traffic (see OVERFLOW_POLICIES in Queue.py):
+#		drop_oldest - periodic data (beacons, CA messages): stale items are shed first
+#		block       - DEN messages, car control and queues shared by CA and DEN messages: the producer waits
+# Items discarded by a queue are counted in its dropped attribute.
+# Received beacons and CA messages supersede each other: the reception queues keep only the latest one of each
+# station (CoalescingQueue with station_key), so their backlog is bounded by the number of stations.
+PERIODIC_QUEUE_SIZE = 64
+EVENT_QUEUE_SIZE = 256
+
+# EVENTS  -  flags used to coordinate threads activities
+# start_flag - set when all threads started to triggered the execution of each thread logic
+start_flag=Event()
+# READY_TIMEOUT - maximum time (seconds) to wait for the sockets of a node to be open (readiness barrier)
+READY_TIMEOUT = 5
+
+# INPUT ARGUMENTS
+# node_id
+# node's coordinates - x, y
+# car speed - speed
+# car direction - backward (´b') or forward('f')
+# car heading - heading (H or V)
+# test type - type of debug messages that are usefull for your test - 
+##################################################
+## create_parser - parser of the input arguments of a node
+##################################################
+def create_parser():
+	parser = argparse.ArgumentParser(description='Process initialization.')
+	parser.add_argument('node', type=int, nargs=1, help='nodeID')
+	parser.add_argument('coordinateX', nargs=1 , type=int, help='x coordinate value')
+	parser.add_argument('coordinateY', nargs=1, type=int, help='y coordinate value')
+	parser.add_argument('velocity', nargs=1 , type=int, help='velocity value between 0 and 100')
+	parser.add_argument('direction', nargs=1, type=str, help='direction f/b')
+	parser.add_argument('heading', nargs=1, type=str, help='heading O/E/N/S')
+
+	parser.add_argument('--RSU', action='store_const', const=1, help='Run as a RSU')
+	parser.add_argument('--OBU', action='store_const', const=2, help='Run as an OBU')
+
+	parser.add_argument('--C1', action='store_const', const=1, help='C1 Route')
+	parser.add_argument('--C2', action='store_const', const=2, help='C2 Route')
+
+	parser.add_argument('--codec', choices=sorted(CODECS), default=DEFAULT_CODEC, help='wire codec used to send messages (json for debugging)')
+	parser.add_argument('--rx-mode', choices=RX_MODES, default=DEFAULT_RX_MODE, help='multicast reception mode')
+	parser.add_argument('--geo-groups', action='store_true', help='use one multicast group per map cell and join only the groups around the node')
+	parser.add_argument('--runtime', choices=('threads', 'asyncio'), default='threads', help='run data link and geonetworking layers as threads or as coroutines of one event loop')
+	parser.add_argument('--pipeline', choices=('queues', 'fused'), default='queues', help='reception pipeline: one thread per layer or on_receive handlers called by multicast_rxd')
+	parser.add_argument('--headless', action='store_true', help='run without user interface: no start prompt, CA interval from --ca-interval and RSU events from user_event_queue')
+	parser.add_argument('--ca-interval', type=float, default=1, help='CA generation interval (seconds) in headless mode')
+	parser.add_argument('--transport', choices=('multicast', 'shm'), default='multicast', help='frames exchanged through the multicast socket or through the shared-memory channel of the host (co-located nodes)')
+	parser.add_argument('--shm-channel', default=CHANNEL_NAME, help='name of the shared-memory channel (shm transport)')
+	parser.add_argument('--split', action='store_true', help='run the data link and geonetworking layers in a second process, connected to the upper layers by shared-memory rings')
+	parser.add_argument('--rcvbuf-max', type=int, default=RCVBUF_MAX, help='ceiling (bytes) of the reception socket buffer, grown when the kernel drops datagrams')
+
+	return parser
+
+##################################################
+## start_node - create the queues, the shared variables and the threads of one node. Several nodes may run in the 
+#		same process (see ITS_launcher.py): each one has its own queues, variables and loc_table.
+#		args: input arguments of the node (see create_parser)
+#		start_flag: Event that starts the execution of the node's threads
+#		loop: asyncio event loop (asyncio runtime) - it may be shared by several nodes
+#		layers: threads to be started - 'all', 'network' (data link and transport & network layers) or 
+#		        'application' (facilities, application and in-vehicle layers)
+#		shared: variables, rings and events shared by the two processes of a split node (see ITS_split.py)
+#		medium: RadioMedium where the node is attached, instead of the multicast socket (see medium.py)
+#		(out) - dictionary with the node's id, threads, coroutines to be run on the loop (asyncio runtime),
+#		        readiness flags and shared variables
+##################################################
+def start_node(args, start_flag, loop=None, layers='all', shared=None, medium=None):
+
+	##
+	# OBU list item format:
+	# (obu id, x, y, time, originating rsu, route ,time of expiration)
+	##
+	node_id = str(args.node[0])
+	obu_list = []
+	route = []
+	node_type = "RSU" if args.RSU == 1 else "OBU"
+	if args.RSU == 1:
+		# RSU
+		print('Starting RSU...')
+	elif args.OBU == 2:
+		# OBU
+		print('Starting OBU...')
+	if args.C1 == 1:
+		# C1
+		print('Initializing with C1 and Route((0,0),(4,0))')
+		route = [(0, 0), (4, 0)]
+	elif args.C2 == 2:
+		# C2
+		print('Initializing with C2 and Route((3,0),(0,0))')
+		route = [(3, 0), (0, 0)]
+
+	# VARIABLES  -  shared by different threads
+	# coordinates - dictionary with node's location in the format (x,y,time)
+	# obd_2_interface - dictionary with the vehicle's dynamic in the format (speed, direction, heading)
+	# channel_status - dictionary with the channel load measured by the data link in the format (cbr, frames_per_sec, bytes_per_sec, t)
+	# rx_stats - dictionary with the reception socket drop counters in the format (drops, drops_per_sec, rx_queue, rcvbuf, rcvbuf_grown, t)
+	# stale_stats - dictionary with the received messages discarded for being too old, per thread and msg_type
+	# loc_table, lock_loc_table - node's neighbour table, with its grid index (see spatial.py), and its lock
+	coordinates = {'x': args.coordinateX[0], 'y': args.coordinateY[0], 't': repr(now())}
+	obd_2_interface = {'speed': args.velocity[0], 'direction': args.direction[0], 'heading': args.heading[0], 'status': "0"}
+	channel_status = dict()
+	rx_stats = dict()
+	stale_stats = dict()
+	loc_table = LocTable()
+	lock_loc_table = Lock()
+
+	# rx_ready, tx_ready - set by multicast_rxd/multicast_txd when their sockets are open (readiness barrier)
+	rx_ready=Event()
+	tx_ready=Event()
+
+	# QUEUES
+	my_system_rxd_queue=CoalescingQueue(EVENT_QUEUE_SIZE, 'block', station_key)
+	movement_control_txd_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+	my_system_txd_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+
+	ca_service_txd_queue=Queue(PERIODIC_QUEUE_SIZE, 'drop_oldest')
+	den_service_txd_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+	services_rxd_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+
+	geonetwork_txd_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+	geonetwork_rxd_ca_queue=CoalescingQueue(PERIODIC_QUEUE_SIZE, 'drop_oldest', station_key)
+	geonetwork_rxd_den_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+	beacon_rxd_queue=CoalescingQueue(PERIODIC_QUEUE_SIZE, 'drop_oldest', station_key)
+
+	multicast_txd_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+	multicast_rxd_queue=CoalescingQueue(EVENT_QUEUE_SIZE, 'block', station_key)
+
+	# user_event_queue - events of the user read by the RSU in headless mode, instead of asking the user
+	user_event_queue=Queue(EVENT_QUEUE_SIZE, 'block')
+
+	# split node mode - the queues between the geonetworking and facilities layers are shared-memory rings,
+	#		coordinates and channel_status are shared records (see ITS_split.py)
+	if shared is not None:
+		coordinates = shared['coordinates']
+		channel_status = shared['channel_status']
+		rx_ready = shared['rx_ready']
+		tx_ready = shared['tx_ready']
+		geonetwork_txd_queue = shared['geonetwork_txd_queue']
+		geonetwork_rxd_ca_queue = shared['geonetwork_rxd_ca_queue']
+		geonetwork_rxd_den_queue = shared['geonetwork_rxd_den_queue']
+	upper = layers in ('all', 'application')
+	lower = layers in ('all', 'network')
+
+	# den_relay_state - duplicate cache and contention timers of the multi-hop DEN relay (see DenRelay in services.py)
+	den_relay_state = DenRelay(node_id, coordinates)
+
+	# max_age - max-age budgets of the received messages: the CA budget follows the DCC interval (see rx_max_age in services.py)
+	max_age = rx_max_age(channel_status)
+
+	# transport - None for the multicast socket, the node's port on the shared-memory channel of the host (see shmchannel.py)
+	#		or the node's port on the simulated radio medium
+	transport=None
+	if lower and medium is not None:
+		transport=medium.attach(node_id, coordinates)
+	elif lower and args.transport == 'shm':
+		transport=ShmPort(node_id, args.shm_channel)
+
+	# asyncio runtime - queues read by the coroutines are handed over to the event loop
+	#		Queues with the block policy keep their bound: threads putting into them wait for a free slot and 
+	#		coroutines await put_async. Items put by the loop itself without awaiting (received frames, forwarded
+	#		geocast/geo unicast messages) are dropped and counted when the queue is full.
+	coroutines=[]
+	if args.runtime == 'asyncio':
+		geonetwork_txd_queue=LoopQueue(loop, EVENT_QUEUE_SIZE, 'block')
+		multicast_txd_queue=LoopQueue(loop, EVENT_QUEUE_SIZE, 'block')
+		multicast_rxd_queue=LoopQueue(loop, EVENT_QUEUE_SIZE, 'block', station_key)
+		beacon_rxd_queue=LoopQueue(loop, PERIODIC_QUEUE_SIZE, 'drop_oldest', station_key)
+
+	# fused reception pipeline - multicast_rxd calls the on_receive handlers of the upper layers, in its own thread,
+	#		instead of relaying messages through the geonetwork_rxd, beacon_rxd, ca_service_rxd, den_service_rxd and 
+	#		application_rxd threads. Pass-through stages are elided: CA and DEN messages are put directly on 
+	#		my_system_rxd_queue (without blocking - they are dropped and counted when it is full) and beacons 
+	#		update the loc_table.
+	if args.pipeline == 'fused':
+		services_on_receive=application_on_receive(node_id, my_system_rxd_queue)
+		multicast_rxd_queue=Dispatcher(geonetwork_on_receive(node_id, ca_service_on_receive(node_id, services_on_receive, stale_stats, max_age), 
+			den_service_on_receive(node_id, services_on_receive, den_relay_state), coordinates, loc_table, multicast_txd_queue, stale_stats, max_age))
+		beacon_rxd_queue=Dispatcher(beacon_on_receive(node_id, loc_table, lock_loc_table))
+
+	threads=[]
+
+
+	##################################################
+	#  Arguments common to all threads:
+	#      node_id: node identification
+	#      startFlag: status event that indicates that all threads were launched and can start execution
+	##################################################
+
+	if upper:
+		##################################################
+		#     Application layer threads
+		##################################################
+
+		# Thread - application_txd: send data from user/cars/legacy systems
+		# Arguments - coordinates: last known coordinates
+		#             my_system_rxd_queue: queue to send data to my_system that is relevant for business logic decision-process 
+		# 			  ca_service_txd_queue: queue to send data to ca_services_txd
+		#             den_service_txd_queue: queue to send data to den_services_txd
+		#             ca_interval, user_event_queue: CA generation interval and user events in headless mode
+		t=Thread(target=application_txd, args=(node_id, node_type, start_flag, my_system_rxd_queue, ca_service_txd_queue, den_service_txd_queue, my_system_txd_queue, obu_list,
+			args.ca_interval if args.headless else None, user_event_queue if args.headless else None,))
+		t.start()
+		threads.append(t)
+
+
+		# queues pipeline only - see the fused reception pipeline above
+		if args.pipeline == 'queues':
+			# Thread - application_rxd: receive data from services_rxd, process it and send it to the user/cars/legacy systems
+			# Arguments - car movement: controls the car movement
+			#           - services_rxd_queue: queue to get data from ca_service_rxd or den_service_rxd
+			#             my_system_rxd_queue: queue to send data to my_system that is relevant for business logic decision-process 
+			t=Thread(target=application_rxd, args=(node_id, start_flag, services_rxd_queue, my_system_rxd_queue,))
+			t.start()
+			threads.append(t)
+
+
+		# Thread - my_system: business logic 
+		# Arguments - my_system_rxd_queue: queue to receive data from other application layer threads relevant for business logic decision-process 
+		#           - movement_control_txd_queue: queue to send commands to control vehicles movement
+		#			- my_system_txd_queue: queue to send data to other application layer threads
+		#			- stale_stats, max_age: dictionary where the messages discarded for being too old are counted, max-age budgets
+		t=Thread(target=my_system, args=(node_id, node_type, start_flag, coordinates, obd_2_interface, my_system_rxd_queue, movement_control_txd_queue, my_system_txd_queue, obu_list,route, stale_stats, max_age,))
+		t.start()
+		threads.append(t)
+
+
+		##################################################
+		#     Facilities layer threads
+		##################################################
+
+		# Thread - ca_service_txd: receive data from application_txd, generates cooperative awaraness and sends the CA message to the geonetwork_txd
+		# Arguments - coordinates: last known coordinates
+		#             ca_services_txd_queue: queue to get data from application_txd
+		#             geonetwork_txd_queue: queue to send data to geonetwork_txd
+		#             channel_status: channel load, used to adapt the CA generation interval (DCC)
+		t=Thread(target=ca_service_txd, args=(node_id, node_type, start_flag, coordinates, obd_2_interface, ca_service_txd_queue, geonetwork_txd_queue,obu_list,route, channel_status,))
+		t.start()
+		threads.append(t)
+
+		# queues pipeline only - see the fused reception pipeline above
+		if args.pipeline == 'queues':
+			# Thread - ca_service_rxd: receive data from geonetwork_rxd, process the CA message and send the result to the application_rxd
+			# Arguments - geonetwork_rxd_ca_queue: queue to get data from geonetwork_rxd
+			#             ca_service_rxd_queue: queue to send data to application_rxd
+			#             stale_stats, max_age: dictionary where the messages discarded for being too old are counted, max-age budgets
+			t=Thread(target=ca_service_rxd, args=(node_id, start_flag, geonetwork_rxd_ca_queue, services_rxd_queue, stale_stats, max_age,))
+			t.start()
+			threads.append(t)
+
+		# Thread -  den_service_txd: receive data from application_txd, generates events and sends the DEN message to the geonetwork_txd
+		# Arguments - coordinates: last known coordinates
+		#             den_services_txd_queue: queue to get data from application_txd
+		# #           geonetwork_txd_queue: queue to send data to geonetwork_txd
+		t=Thread(target=den_service_txd, args=(node_id, node_type, start_flag, coordinates, obd_2_interface, den_service_txd_queue, geonetwork_txd_queue,))
+		t.start()
+		threads.append(t)
+
+		# queues pipeline only - see the fused reception pipeline above
+		if args.pipeline == 'queues':
+			# Thread - den_service_rxd: receive data from geonetwork_rxd, process the DEN message and send the result to the application_rxd
+			# Arguments - geonetwork_rxd_den_queue: queue to get data from geonetwork_rxd
+			#             services_rxd_queue: queue to send data to application_rxd
+			#             den_relay_state: duplicate cache and contention timers of the DEN relay
+			t=Thread(target=den_service_rxd, args=(node_id, start_flag, geonetwork_rxd_den_queue, services_rxd_queue, den_relay_state,))
+			t.start()
+			threads.append(t)
+
+		# Thread - den_relay: relay DEN messages to the geonetwork_txd, in case of multi-hop communication
+		# Arguments - den_relay_state: DENs waiting for their contention delay
+		#             geonetwork_txd_queue: queue to send data to geonetwork_txd
+		t=Thread(target=den_relay, args=(node_id, start_flag, den_relay_state, geonetwork_txd_queue,))
+		t.start()
+		threads.append(t)
+
+	if lower and args.runtime == 'asyncio':
+		##################################################
+		#     Transport and network layer and link layer coroutines - see ITS_async.py
+		##################################################
+
+		# Coroutines: geonetwork_txd, geonetwork_rxd, beacon_txd, beacon_rxd, check_loc_table, multicast_rxd and 
+		#          multicast_txd, to be run by the event_loop thread of the loop
+		coroutines=network_coroutines(node_id, coordinates, geonetwork_txd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue,
+			multicast_txd_queue, multicast_rxd_queue, beacon_rxd_queue, args.codec, table=loc_table, lock=lock_loc_table, transport=transport,
+			channel_status=channel_status, geo_groups=args.geo_groups, rx_stats=rx_stats, rcvbuf_max=args.rcvbuf_max, stale_stats=stale_stats,
+			fused=(args.pipeline == 'fused'), rx_ready=rx_ready, tx_ready=tx_ready, max_age=max_age)
+
+	elif lower:
+		##################################################
+		#     Transport and network layer threads
+		##################################################
+
+		# Thread - geonetwork_txd: receive data from geoenetwork_txd, process the geonetwork information and send the result to the multicast_rxd
+		# Arguments - geonetwork_txd_queue: queue to get data from ca_service_txd or den_service_txd
+		#             multicast_txd_queue: queue to send data to multicast_txd
+		#             coordinates, loc_table: node's position and neighbours, to route geocast and geo unicast messages
+		t=Thread(target=geonetwork_txd, args=(node_id, start_flag, geonetwork_txd_queue, multicast_txd_queue, coordinates, loc_table,))
+		t.start()
+		threads.append(t)
+
+		# queues pipeline only - see the fused reception pipeline above
+		if args.pipeline == 'queues':
+			# Thread- geonetwork_rxd: receive data from multicast_rxd, process the geonetwork information and send the result to the services_rxd
+			# Arguments - multicast_rxd_queue: queue to get data from multicast_txd
+			#             geonetwork_rxd_queue: queue to send data to services_rxd, after being processed
+			#             stale_stats, max_age: dictionary where the messages discarded for being too old are counted, max-age budgets
+			#             coordinates, loc_table, multicast_txd_queue: node's position and neighbours, and the queue where 
+			#             geocast and geo unicast messages are forwarded
+			t=Thread(target=geonetwork_rxd, args=(node_id, start_flag, multicast_rxd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue, stale_stats,
+				coordinates, loc_table, multicast_txd_queue, max_age,))
+			t.start()
+			threads.append(t)
+
+		# Thread - beacon_txd: periodical generation of beacons
+		# Arguments - coordinates: last known coordinates
+		#             multicast_txd_queue: queue to send beacons to multicast_txd
+		t=Thread(target=beacon_txd, args=(node_id, start_flag, coordinates, multicast_txd_queue,))
+		t.start()
+		threads.append(t)
+
+		# queues pipeline only - see the fused reception pipeline above
+		if args.pipeline == 'queues':
+			# Thread- geonetwork_rxd: receive data from multicast_rxd, process the geonetwork information and send the result to the services_rxd
+			# Arguments - multicast_rxd_queue: queue to get data from multicast_rxd
+			#             geonetwork_rxd_queue: queue to send data to services_rxd, after being processed
+			t=Thread(target=beacon_rxd, args=(node_id, start_flag, beacon_rxd_queue, loc_table, lock_loc_table,))
+			t.start()
+			threads.append(t)
+
+		# Thread- check_loc_table: check loc_table_entries and deleted outdated entries
+		# Arguments - loc_table, lock_loc_table: node's loc_table and its lock
+		t=Thread(target=check_loc_table, args=(node_id, start_flag, loc_table, lock_loc_table,))
+		t.start()
+		threads.append(t)
+
+
+		##################################################
+		#     Link layer threads
+		##################################################
+
+		# Thread - multicast_rxd: receive data from multicast socket, process and send the result to the geonetwork_rxd, after being processed, if needed
+		# Arguments - multicast_rxd_queue: queue to send data to geonetwork_rxd
+		#            beacon_rxd_queue: queue to send data to beacon_rxd
+		#            rx_filter: frame header filter
+		#            rx_mode: socket reception mode (copy or zerocopy)
+		#            transport: None for the multicast socket, or the node's ShmPort or MediumPort
+		#            channel_status: dictionary where the channel load is published
+		#            geo_groups, coordinates: join the multicast groups of the map cells around the node
+		#            rx_stats, rcvbuf_max: dictionary where the socket drop counters are published and receive buffer ceiling
+		#            rx_ready: set when the socket is bound
+		t=Thread(target=multicast_rxd, args=(node_id, start_flag, multicast_rxd_queue, beacon_rxd_queue, drop_own_frames, args.rx_mode, transport, channel_status, args.geo_groups, coordinates,
+			rx_stats, args.rcvbuf_max, rx_ready,))
+		t.start()
+		threads.append(t)
+
+		# Thread - multicast_txd: receive data from geonetwork_txd and send it to the multicast socket
+		# Arguments - multicast_txd_queue: queue to get data from transmission from geonetwork_txd
+		#             codec: wire codec used to serialize the messages
+		#             coordinates: last known coordinates, sent on the frame header
+		#             transport: None for the multicast socket, or the node's ShmPort or MediumPort
+		#             geo_groups: send to the multicast group of the node's map cell
+		#             tx_ready: set when the socket is open
+		t=Thread(target=multicast_txd, args=(node_id, start_flag, multicast_txd_queue, args.codec, coordinates, transport, TRAFFIC_CLASSES, args.geo_groups, tx_ready,))
+		t.start()
+		threads.append(t)
+
+	if upper:
+		##################################################
+		#     In-vehicles threads
+		##################################################
+
+		# Thread- update_position: update the node coordinates (x,y) to emulate the GPS device
+		# Arguments -  coordinates: dictionay with (x,y) coordinates and time instant t of measurement
+		#           - obd_2_interface: dictionary with movement information of the car
+		t=Thread(target=update_location, args=(node_id, start_flag, coordinates, obd_2_interface,))
+		t.start()
+		threads.append(t)
+
+		# Thread- update_position: update the node coordinates (x,y) to emulate the GPS device
+		# Arguments -  coordinates: dictionay with (x,y) coordinates and time instant t of measurement
+		#           - car_movement: dictionary with movement information of the car
+		t=Thread(target=movement_control, args=(node_id, start_flag, coordinates, obd_2_interface, movement_control_txd_queue,))
+		t.start()
+		threads.append(t)
+
+	return {'node_id': node_id, 'node_type': node_type, 'threads': threads, 'coroutines': coroutines, 'rx_ready': rx_ready, 'tx_ready': tx_ready,
+		'coordinates': coordinates, 'channel_status': channel_status, 'rx_stats': rx_stats, 'stale_stats': stale_stats, 'loc_table': loc_table,
+		'user_event_queue': user_event_queue}
+
+##################################################
+## Process - network_process - data link and transport & network layers of a split node
+#		shared: see split_node_shared in ITS_split.py - created by the application process before starting this one
+##################################################
+def network_process(args, shared):
+	start_node(args, shared['start_flag'], layers='network', shared=shared)
+	return
+
+##################################################
+## MAIN-ITS_core
+##################################################
+def main(argv):
+	start_time = time.time()
+
+	parser = create_parser()
+	args = parser.parse_args(argv[1:])
+	if args.split and (args.runtime != 'threads' or args.pipeline != 'queues'):
+		parser.error('--split requires --runtime threads and --pipeline queues')
+	print(args)
+	if not args.headless:
+		command=input('Press enter to start')
+
+	loop = asyncio.new_event_loop() if args.runtime == 'asyncio' else None
+	threads=[]
+	node_id = str(args.node[0])
+
+	try:
+		if args.split:
+			# Process - network_process: data link and transport & network layers, started before any thread of this process
+			shared = split_node_shared(args)
+			multiprocessing.Process(target=network_process, args=(args, shared,), daemon=True).start()
+			node = start_node(args, shared['start_flag'], layers='application', shared=shared)
+			shared['start_flag'].set()
+		else:
+			node = start_node(args, start_flag, loop)
+		threads = node['threads']
+
+		if loop is not None:
+			# Thread - event_loop: runs the coroutines of the transport and network layer and link layer on the asyncio event loop
+			t=Thread(target=event_loop, args=(node_id, start_flag, loop, node['coroutines'],))
+			t.start()
+			threads.append(t)
+
+		start_flag.set()
+
+		# readiness barrier - threads wait on start_flag; the node is serving once its sockets are open
+		if node['rx_ready'].wait(READY_TIMEOUT) and node['tx_ready'].wait(READY_TIMEOUT):
+			print('STATUS: Node ready - NODE: {}'.format(node_id),' - startup time: {:.3f} s'.format(time.time() - start_time),'\n')
+		else:
+			print('ERROR: Sockets not ready after {} s - NODE: {}'.format(READY_TIMEOUT, node_id),'\n')
+
+	except:
+		#exit the program if there is an error when opening one of the threads
+		print('STATUS: Error opening one of the threads -  NODE: {}'.format(node_id),'\n')
+		for t in threads:
+			t.join()
+			sys.exit()
+	return
+
+if __name__=="__main__":
+	main(sys.argv[0:])
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# #################################################
+## SCENARIO LAUNCHER - runs the nodes of a scenario file, sharded over a pool of worker processes (one per
+# core by default). Each worker runs its nodes in headless mode (see start_node in ITS_core.py), sharing one
+# asyncio event loop for the nodes that use the asyncio runtime, and reports its CPU and memory usage to the
+# launcher every REPORT_INTERVAL seconds. The output of the nodes of each worker goes to its log file.
+# Scenario file (JSON):
+#	{"defaults": {"velocity": 10, "direction": "f", "heading": "E", "ca_interval": 1},
+#	 "nodes": [{"node": 1, "type": "RSU", "x": 0, "y": 0},
+#	           {"node": 2, "type": "OBU", "x": 10, "y": 0, "route": "C1", "ca_interval": 0.5}],
+#	 "fleet": {"count": 1000, "type": "OBU", "first_node": 100, "area": [0, 0, 1000, 1000], "route": "C2", "seed": 1}}
+#	nodes - list of nodes; type RSU or OBU, route C1 or C2 (optional)
+#	fleet - (optional) nodes generated at random positions of area [x0, y0, x1, y1], reproducible for a given seed
+#	Any other input argument of ITS_core.py may be set in defaults or per node, with '_' in place of '-'
+#	(e.g. "rx_mode": "zerocopy", "geo_groups": true).
+#	medium - (optional) arguments of the RadioMedium of a simulation, e.g. {"tx_range": 100, "loss": 0.1, "seed": 1}
+# Simulation (--virtual-time): all the nodes run in one worker, attached to a simulated RadioMedium, on a
+# VirtualClock (see ITS_clock.py) - duration seconds of virtual time are run as fast as the CPU allows.
+# usage: python ITS_launcher.py scenario.json [--workers N] [--duration seconds] [--log-dir dir] [--virtual-time]
+#################################################
+import os, sys, time
+import json
+import random
+import resource
+import argparse
+import asyncio
+import multiprocessing
+from threading import Thread, Event, active_count
+
+from ITS_core import create_parser, start_node, READY_TIMEOUT
+from ITS_async import event_loop
+from ITS_clock import VirtualClock, set_clock
+from data_link.medium import RadioMedium
+
+# input arguments of the nodes not set by the scenario file - the asyncio runtime and the fused reception pipeline
+# use the fewest threads per node
+SCENARIO_DEFAULTS = {'velocity': 0, 'direction': 'f', 'heading': 'E', 'runtime': 'asyncio', 'pipeline': 'fused'}
+# positional arguments of ITS_core.py, in order, and scenario keys that are not input arguments
+POSITIONAL_ARGS = ('node', 'x', 'y', 'velocity', 'direction', 'heading')
+NODE_KEYS = POSITIONAL_ARGS + ('type', 'route')
+
+# interval between usage reports (seconds) and unit of ru_maxrss (kilobytes on Linux, bytes on macOS)
+REPORT_INTERVAL = 5.0
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+# virtual time of the start of a simulation (seconds)
+SIMULATION_EPOCH = 0.0
+
+
+#------------------------------------------------------------------------------------------------
+# scenario_nodes - list of nodes of a scenario: nodes list followed by the generated fleet, with the defaults applied
+#------------------------------------------------------------------------------------------------
+def scenario_nodes(scenario):
+	defaults = dict(SCENARIO_DEFAULTS)
+	defaults.update(scenario.get('defaults', {}))
+	nodes = [dict(defaults, **node) for node in scenario.get('nodes', [])]
+
+	fleet = scenario.get('fleet')
+	if fleet:
+		rng = random.Random(fleet.get('seed', 0))
+		x0, y0, x1, y1 = fleet.get('area', [0, 0, 100, 100])
+		first_node = fleet.get('first_node', max([node['node'] for node in nodes], default=0) + 1)
+		generated = {key: value for key, value in fleet.items() if key not in ('count', 'first_node', 'area', 'seed')}
+		for i in range(fleet['count']):
+			nodes.append(dict(defaults, node=first_node + i, x=rng.randint(x0, x1), y=rng.randint(y0, y1), **generated))
+	return nodes
+
+#------------------------------------------------------------------------------------------------
+# node_argv - input arguments of ITS_core.py for a node of the scenario (always headless)
+#------------------------------------------------------------------------------------------------
+def node_argv(node):
+	argv = [str(node[key]) for key in POSITIONAL_ARGS]
+	argv.append('--RSU' if node.get('type', 'OBU') == 'RSU' else '--OBU')
+	if node.get('route'):
+		argv.append('--' + node['route'])
+	for key, value in node.items():
+		if key in NODE_KEYS or value is None or value is False:
+			continue
+		argv.append('--' + key.replace('_', '-'))
+		if value is not True:
+			argv.append(str(value))
+	argv.append('--headless')
+	return argv
+
+#------------------------------------------------------------------------------------------------
+# shard - split the nodes in (at most) workers contiguous shards of balanced size
+#------------------------------------------------------------------------------------------------
+def shard(nodes, workers):
+	workers = max(1, min(workers, len(nodes)))
+	return [nodes[i*len(nodes)//workers:(i+1)*len(nodes)//workers] for i in range(workers)]
+
+
+#------------------------------------------------------------------------------------------------
+# Process - worker: starts the nodes of one shard and reports its usage to the launcher
+#		report_queue: multiprocessing queue of reports, tuples (report type, worker, pid, ...):
+#		              ('ready', worker, pid, ready nodes, nodes, startup time)
+#		              ('usage', worker, pid, cpu time, cpu percent, max rss in bytes, threads)
+#		log_dir: directory of the log files (None - output of the nodes is not redirected)
+#------------------------------------------------------------------------------------------------
+def worker(worker_id, argvs, report_queue, log_dir=None):
+	start_time = time.time()
+	if log_dir is not None:
+		log = open(os.path.join(log_dir, 'worker-{}.log'.format(worker_id)), 'w', buffering=1)
+		sys.stdout = sys.stderr = log
+
+	parser = create_parser()
+	nodes_args = [parser.parse_args(argv) for argv in argvs]
+	start_flag = Event()
+	loop = asyncio.new_event_loop() if any(args.runtime == 'asyncio' for args in nodes_args) else None
+	nodes = [start_node(args, start_flag, loop) for args in nodes_args]
+
+	if loop is not None:
+		# Thread - event_loop: runs the coroutines of all the nodes of the worker on one event loop
+		coroutines = [coroutine for node in nodes for coroutine in node['coroutines']]
+		Thread(target=event_loop, args=('worker-{}'.format(worker_id), start_flag, loop, coroutines,), daemon=True).start()
+
+	start_flag.set()
+
+	deadline = time.time() + READY_TIMEOUT
+	ready = 0
+	for node in nodes:
+		if node['rx_ready'].wait(max(0, deadline - time.time())) and node['tx_ready'].wait(max(0, deadline - time.time())):
+			ready += 1
+		else:
+			print('ERROR: Sockets not ready after {} s - NODE: {}'.format(READY_TIMEOUT, node['node_id']),'\n')
+	report_queue.put(('ready', worker_id, os.getpid(), ready, len(nodes), time.time() - start_time))
+
+	last_cpu = 0.0
+	last = start_time
+	while True:
+		time.sleep(REPORT_INTERVAL)
+		now = time.time()
+		usage = resource.getrusage(resource.RUSAGE_SELF)
+		cpu = usage.ru_utime + usage.ru_stime
+		report_queue.put(('usage', worker_id, os.getpid(), cpu, 100*(cpu - last_cpu)/(now - last), usage.ru_maxrss*MAXRSS_UNIT, active_count()))
+		last_cpu = cpu
+		last = now
+
+#------------------------------------------------------------------------------------------------
+# Process - simulate: runs the nodes on a VirtualClock until duration seconds of virtual time
+#		The nodes use the threads runtime and exchange frames through a RadioMedium built with medium_args.
+#		report_queue: ('done', 0, pid, virtual time, wall time, events fired by the clock)
+#------------------------------------------------------------------------------------------------
+def simulate(argvs, report_queue, duration, medium_args=None, log_dir=None):
+	start_time = time.time()
+	if log_dir is not None:
+		log = open(os.path.join(log_dir, 'simulation.log'), 'w', buffering=1)
+		sys.stdout = sys.stderr = log
+
+	clock = VirtualClock(SIMULATION_EPOCH)
+	set_clock(clock)
+	parser = create_parser()
+	nodes_args = [parser.parse_args(argv + ['--runtime', 'threads']) for argv in argvs]
+	medium = RadioMedium(**(medium_args or {}))
+	start_flag = clock.Event()
+	nodes = [start_node(args, start_flag, medium=medium) for args in nodes_args]
+
+	clock.start(start_flag, sum(len(node['threads']) for node in nodes), until=SIMULATION_EPOCH + duration, timeout=READY_TIMEOUT)
+	clock.done.wait()
+	report_queue.put(('done', 0, os.getpid(), clock.time() - SIMULATION_EPOCH, time.time() - start_time, clock.events))
+	return
+
+#------------------------------------------------------------------------------------------------
+# print_usage - per-process usage table
+#------------------------------------------------------------------------------------------------
+def print_usage(shards, ready, usage):
+	print('{:>6} {:>8} {:>6} {:>6} {:>9} {:>7} {:>9} {:>8}'.format('worker', 'pid', 'nodes', 'ready', 'cpu (s)', 'cpu %', 'rss (MB)', 'threads'))
+	for worker_id, nodes in enumerate(shards):
+		pid, cpu, cpu_percent, maxrss, threads = usage.get(worker_id, (None, 0.0, 0.0, 0, 0))
+		print('{:>6} {:>8} {:>6} {:>6} {:>9.2f} {:>7.1f} {:>9.1f} {:>8}'.format(worker_id, pid or '-', len(nodes), ready.get(worker_id, '-'),
+			cpu, cpu_percent, maxrss/2**20, threads))
+	print('{:>6} {:>8} {:>6} {:>6} {:>9.2f} {:>7.1f} {:>9.1f} {:>8}'.format('total', '', sum(len(nodes) for nodes in shards), sum(ready.values()),
+		sum(u[1] for u in usage.values()), sum(u[2] for u in usage.values()), sum(u[3] for u in usage.values())/2**20,
+		sum(u[4] for u in usage.values())),'\n')
+
+
+#------------------------------------------------------------------------------------------------
+# simulation - runs a simulation process (see simulate) and reports its duration
+#------------------------------------------------------------------------------------------------
+def simulation(args, argvs, medium_args=None):
+	print('STATUS: Simulating {} nodes for {} s of virtual time - SCENARIO: {}'.format(len(argvs), args.duration, args.scenario),'\n')
+	report_queue = multiprocessing.Queue()
+	p = multiprocessing.Process(target=simulate, args=(argvs, report_queue, args.duration, medium_args, args.log_dir,), daemon=True)
+	p.start()
+	try:
+		while True:
+			try:
+				report = report_queue.get(timeout=1)
+			except Exception:
+				if not p.is_alive():
+					print('ERROR: Simulation exited with code {}'.format(p.exitcode),'\n')
+					sys.exit(1)
+				continue
+			virtual, wall, events = report[3:]
+			print('STATUS: Simulation done - virtual time: {:.1f} s - wall time: {:.3f} s - speedup: {:.1f}x - events: {}'.format(virtual, wall,
+				virtual/wall, events),'\n')
+			break
+	except KeyboardInterrupt:
+		pass
+	finally:
+		p.terminate()
+		p.join()
+	return
+
+
+##################################################
+## MAIN-ITS_launcher
+##################################################
+def main(argv):
+	parser = argparse.ArgumentParser(description='Run the nodes of a scenario file on a pool of worker processes.')
+	parser.add_argument('scenario', help='scenario file (JSON)')
+	parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes (default: number of cores)')
+	parser.add_argument('--duration', type=float, default=None, help='run time (seconds) - default: until interrupted')
+	parser.add_argument('--virtual-time', action='store_true', help='simulate duration seconds of virtual time, as fast as possible, in one process')
+	parser.add_argument('--log-dir', default=None, help='directory of the log files of the workers (default: output to the terminal)')
+	args = parser.parse_args(argv[1:])
+
+	if args.virtual_time and args.duration is None:
+		parser.error('--virtual-time requires --duration')
+
+	with open(args.scenario) as f:
+		scenario = json.load(f)
+	nodes = scenario_nodes(scenario)
+	if not nodes:
+		print('ERROR: No nodes in scenario {}'.format(args.scenario),'\n')
+		sys.exit(1)
+	if args.log_dir is not None:
+		os.makedirs(args.log_dir, exist_ok=True)
+
+	if args.virtual_time:
+		simulation(args, [node_argv(node) for node in nodes], scenario.get('medium'))
+		return
+
+	shards = shard([node_argv(node) for node in nodes], args.workers)
+	print('STATUS: Starting {} nodes on {} workers - SCENARIO: {}'.format(len(nodes), len(shards), args.scenario),'\n')
+
+	start_time = time.time()
+	report_queue = multiprocessing.Queue()
+	processes = [multiprocessing.Process(target=worker, args=(worker_id, argvs, report_queue, args.log_dir,), daemon=True)
+		for worker_id, argvs in enumerate(shards)]
+	for p in processes:
+		p.start()
+
+	ready = dict()
+	usage = dict()
+	try:
+		while args.duration is None or time.time() - start_time < args.duration:
+			try:
+				report = report_queue.get(timeout=1)
+			except Exception:
+				for worker_id, p in enumerate(processes):
+					if not p.is_alive():
+						print('ERROR: Worker exited with code {} - WORKER: {}'.format(p.exitcode, worker_id),'\n')
+						sys.exit(1)
+				continue
+			if report[0] == 'ready':
+				worker_id, pid, ready[worker_id], n, startup = report[1:]
+				print('STATUS: Worker ready - WORKER: {} - PID: {} - nodes ready: {}/{} - startup time: {:.3f} s'.format(worker_id, pid, ready[worker_id], n, startup),'\n')
+				if len(ready) == len(processes):
+					print('STATUS: Scenario ready - nodes ready: {}/{} - startup time: {:.3f} s'.format(sum(ready.values()), len(nodes), time.time() - start_time),'\n')
+			else:
+				usage[report[1]] = report[2:]
+				if len(usage) == len(processes) and report[1] == len(processes) - 1:
+					print_usage(shards, ready, usage)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		if usage:
+			print_usage(shards, ready, usage)
+		for p in processes:
+			p.terminate()
+		for p in processes:
+			p.join()
+	return
+
+if __name__=="__main__":
+	main(sys.argv[0:])
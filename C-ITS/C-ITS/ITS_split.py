@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# #################################################
+## SPLIT NODE MODE - the data link and transport & network layers run in one process and the facilities,
+# application and in-vehicle layers in another, so that each process has its own GIL (e.g. an RSU may
+# use two cores, with the reception path isolated from the business logic).
+# The processes are connected by shared-memory rings (see data_link/shmring.py) instead of pickled pipes:
+#	geonetwork_txd_queue      - facilities -> geonetworking (ca_service_txd, den_service_txd -> geonetwork_txd)
+#	geonetwork_rxd_ca_queue   - geonetworking -> facilities (geonetwork_rxd -> ca_service_rxd)
+#	geonetwork_rxd_den_queue  - geonetworking -> facilities (geonetwork_rxd -> den_service_rxd)
+# Variables read by both sides are shared records: coordinates (written by the in-vehicle threads) and
+# channel_status (written by multicast_rxd). Every other variable belongs to one side only; stale_stats
+# counts the messages discarded by the threads of each process.
+#################################################
+import struct
+import multiprocessing
+from ITS_clock import now
+from data_link.shmring import *
+
+# fields of the shared records (struct format of each field)
+COORDINATES_FIELDS = (('x', 'q'), ('y', 'q'), ('t', 'd'))
+CHANNEL_STATUS_FIELDS = (('cbr', 'd'), ('frames_per_sec', 'd'), ('bytes_per_sec', 'd'), ('t', 'd'))
+
+# size of the rings (bytes). CA messages supersede each other: when their ring is full, the newest is dropped
+# and the consumer catches up with the next one.
+SPLIT_RING_SIZE = 1 << 20
+
+
+#------------------------------------------------------------------------------------------------
+# SharedRecord - dictionary with a fixed set of numeric fields, shared by the processes of a node.
+#		Supports the dictionary operations used on coordinates and channel_status. The record is empty
+#		(False) until its first update.
+#------------------------------------------------------------------------------------------------
+class SharedRecord:
+
+	def __init__(self, fields, values=None):
+		self.fields = tuple(key for key, fmt in fields)
+		self.index = dict((key, i) for i, key in enumerate(self.fields))
+		# first byte: 1 once the record was written
+		self.struct = struct.Struct('=B' + ''.join(fmt for key, fmt in fields))
+		self.buffer = multiprocessing.RawArray('B', self.struct.size)
+		self.lock = multiprocessing.Lock()
+		if values:
+			self.update(values)
+
+	def _load(self):
+		with self.lock:
+			return self.struct.unpack_from(self.buffer, 0)
+
+	def update(self, *args, **kwargs):
+		values = dict(*args, **kwargs)
+		with self.lock:
+			record = list(self.struct.unpack_from(self.buffer, 0))
+			for key, value in values.items():
+				record[self.index[key] + 1] = value
+			record[0] = 1
+			self.struct.pack_into(self.buffer, 0, *record)
+
+	def __getitem__(self, key):
+		record = self._load()
+		if not record[0]:
+			raise KeyError(key)
+		return record[self.index[key] + 1]
+
+	def get(self, key, default=None):
+		record = self._load()
+		if not record[0] or key not in self.index:
+			return default
+		return record[self.index[key] + 1]
+
+	def __setitem__(self, key, value):
+		self.update({key: value})
+
+	def __contains__(self, key):
+		return bool(self) and key in self.index
+
+	def __bool__(self):
+		return bool(self._load()[0])
+
+	def copy(self):
+		record = self._load()
+		return dict(zip(self.fields, record[1:])) if record[0] else dict()
+
+	def keys(self):
+		return self.copy().keys()
+
+	def items(self):
+		return self.copy().items()
+
+	def __repr__(self):
+		return repr(self.copy())
+
+
+#------------------------------------------------------------------------------------------------
+# split_node_shared - variables, rings and events shared by the two processes of a node, to be created
+#		before the network process is started (see start_node and network_process in ITS_core.py)
+#		(out) - dictionary with coordinates, channel_status, the three rings, start_flag, rx_ready and tx_ready
+#------------------------------------------------------------------------------------------------
+def split_node_shared(args, ring_size=SPLIT_RING_SIZE):
+	return {
+		'coordinates': SharedRecord(COORDINATES_FIELDS, {'x': args.coordinateX[0], 'y': args.coordinateY[0], 't': now()}),
+		'channel_status': SharedRecord(CHANNEL_STATUS_FIELDS),
+		'geonetwork_txd_queue': MessageRing(ring_size, 'block'),
+		'geonetwork_rxd_ca_queue': MessageRing(ring_size, 'drop_newest'),
+		'geonetwork_rxd_den_queue': MessageRing(ring_size, 'block'),
+		'start_flag': multiprocessing.Event(),
+		'rx_ready': multiprocessing.Event(),
+		'tx_ready': multiprocessing.Event(),
+	}
@@ -9,5 +9,7 @@
 
 #  MACOS version - configuration for Wifi (ad-hoc mode)
 sudo route -nv add -net 224.0.0.0/24 -interface en0
+#Geographic multicast groups (ITS_core.py --geo-groups)
+#sudo route -nv add -net 239.255.250.0/24 -interface en0
 #sudo route -nv add -inet6 ff15:7079:7468:6f6e:6465:6d6f:6d63:6173 -interface en0
 sudo sysctl -w net.inet.ip.forwarding=1
@@ -1,14 +1,21 @@
 """A multi-producer, multi-consumer queue."""
 
-from time import time as _time
+from ITS_clock import now as _time, Condition as _Condition
 try:
     import threading as _threading
 except ImportError:
     import dummy_threading as _threading
 from collections import deque
 import heapq
+import asyncio
 
-__all__ = ['Empty', 'Full', 'Queue', 'PriorityQueue', 'LifoQueue']
+__all__ = ['Empty', 'Full', 'Queue', 'PriorityQueue', 'LifoQueue', 'LoopQueue', 'CoalescingQueue', 'Dispatcher', 'OVERFLOW_POLICIES']
+
+# What put() does when a bounded queue is full:
+#   block       - wait for a free slot (or raise Full)
+#   drop_oldest - discard the next item to be retrieved and put the new one
+#   drop_newest - discard the new item
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
 
 class Empty(Exception):
     "Exception raised by Queue.get(block=0)/get_nowait()."
@@ -22,10 +29,20 @@ class Queue:
     """Create a queue object with a given maximum size.
 
     If maxsize is <= 0, the queue size is infinite.
+
+    overflow is the policy applied by put() when the queue is full (see
+    OVERFLOW_POLICIES); items discarded by a drop policy are counted in
+    the dropped attribute.
     """
-    def __init__(self, maxsize=0):
+    def __init__(self, maxsize=0, overflow='block'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('unknown overflow policy: %r' % (overflow,))
         self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
         self._init(maxsize)
+        # Conditions are created by the installed clock (see ITS_clock.py), so
+        # that waits are accounted in virtual time by a simulation.
         # mutex must be held whenever the queue is mutating.  All methods
         # that acquire mutex must release it before returning.  mutex
         # is shared between the three conditions, so acquiring and
@@ -33,13 +50,13 @@ class Queue:
         self.mutex = _threading.Lock()
         # Notify not_empty whenever an item is added to the queue; a
         # thread waiting to get is notified then.
-        self.not_empty = _threading.Condition(self.mutex)
+        self.not_empty = _Condition(self.mutex)
         # Notify not_full whenever an item is removed from the queue;
         # a thread waiting to put is notified then.
-        self.not_full = _threading.Condition(self.mutex)
+        self.not_full = _Condition(self.mutex)
         # Notify all_tasks_done whenever the number of unfinished tasks
         # drops to zero; thread waiting to join() is notified to resume
-        self.all_tasks_done = _threading.Condition(self.mutex)
+        self.all_tasks_done = _Condition(self.mutex)
         self.unfinished_tasks = 0
 
     def task_done(self):
@@ -117,7 +134,12 @@ class Queue:
         """
         self.not_full.acquire()
         try:
-            if self.maxsize > 0:
+            if self._replace(item):
+                return
+            if self.maxsize > 0 and self.overflow != 'block':
+                if self._qsize() >= self.maxsize and not self._shed():
+                    return
+            elif self.maxsize > 0:
                 if not block:
                     if self._qsize() == self.maxsize:
                         raise Full
@@ -147,6 +169,65 @@ class Queue:
         """
         return self.put(item, False)
 
+    def put_or_drop(self, item):
+        """Put an item into the queue without blocking.
+
+        If no free slot is immediately available, the item is discarded and
+        counted in the dropped attribute, whatever the overflow policy. Used
+        by producers that must never wait, such as an event loop.
+        """
+        try:
+            self.put(item, False)
+        except Full:
+            with self.mutex:
+                self.dropped += 1
+
+    def put_many(self, items, block=True, timeout=None):
+        """Put a batch of items into the queue, in order, under one lock acquisition.
+
+        Waiting consumers are notified once per batch. On a bounded queue,
+        the items that fit are put and the call waits for free slots as
+        put() does; the Full exception is raised if the remaining items
+        could not be put ('block' false or 'timeout' expired).
+        """
+        self.not_full.acquire()
+        try:
+            n = 0
+            if timeout is not None:
+                if timeout < 0:
+                    raise ValueError("'timeout' must be a non-negative number")
+                endtime = _time() + timeout
+            try:
+                for item in items:
+                    if self._replace(item):
+                        continue
+                    if self.maxsize > 0 and self.overflow != 'block':
+                        if self._qsize() >= self.maxsize and not self._shed():
+                            continue
+                    elif self.maxsize > 0:
+                        while self._qsize() == self.maxsize:
+                            if not block:
+                                raise Full
+                            if n:
+                                self.not_empty.notify(n)
+                                self.unfinished_tasks += n
+                                n = 0
+                            if timeout is None:
+                                self.not_full.wait()
+                            else:
+                                remaining = endtime - _time()
+                                if remaining <= 0.0:
+                                    raise Full
+                                self.not_full.wait(remaining)
+                    self._put(item)
+                    n += 1
+            finally:
+                if n:
+                    self.unfinished_tasks += n
+                    self.not_empty.notify(n)
+        finally:
+            self.not_full.release()
+
     def get(self, block=True, timeout=None):
         """Remove and return an item from the queue.
 
@@ -189,6 +270,49 @@ class Queue:
         """
         return self.get(False)
 
+    def get_many(self, max_items=0, block=True, timeout=None):
+        """Remove and return a list of items from the queue, under one lock acquisition.
+
+        Waits for the first item as get() does, then removes the items
+        already queued, up to 'max_items' (0 - all of them). Raises the
+        Empty exception if no item was available.
+        """
+        self.not_empty.acquire()
+        try:
+            if not block:
+                if not self._qsize():
+                    raise Empty
+            elif timeout is None:
+                while not self._qsize():
+                    self.not_empty.wait()
+            elif timeout < 0:
+                raise ValueError("'timeout' must be a non-negative number")
+            else:
+                endtime = _time() + timeout
+                while not self._qsize():
+                    remaining = endtime - _time()
+                    if remaining <= 0.0:
+                        raise Empty
+                    self.not_empty.wait(remaining)
+            n = self._qsize()
+            if 0 < max_items < n:
+                n = max_items
+            items = [self._get() for i in range(n)]
+            self.not_full.notify(n)
+            return items
+        finally:
+            self.not_empty.release()
+
+    def _shed(self):
+        # Apply the drop policy to a full queue - return True if the new item
+        # is to be put. Called with the mutex held.
+        self.dropped += 1
+        if self.overflow == 'drop_oldest':
+            self._get()
+            self.unfinished_tasks -= 1
+            return True
+        return False
+
     # Override these methods to implement other queue organizations
     # (e.g. stack or priority queue).
     # These will only be called with appropriate locks held
@@ -208,6 +332,11 @@ class Queue:
     def _get(self):
         return self.queue.popleft()
 
+    # Replace a pending item by the new one - return True if the new item
+    # was absorbed and must not be added
+    def _replace(self, item):
+        return False
+
 
 class PriorityQueue(Queue):
     '''Variant of Queue that retrieves open entries in priority order (lowest first).
@@ -242,3 +371,308 @@ class LifoQueue(Queue):
 
     def _get(self):
         return self.queue.pop()
+
+
+class Dispatcher:
+    '''Queue-like front of a synchronous handler, used to fuse pipeline stages.
+
+    put() calls handler(item) in the producer's thread: nothing is queued
+    and there is no consumer thread.
+    '''
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def put(self, item, block=True, timeout=None):
+        self.handler(item)
+
+    def put_nowait(self, item):
+        self.handler(item)
+
+    def put_or_drop(self, item):
+        self.handler(item)
+
+    def put_many(self, items, block=True, timeout=None):
+        handler = self.handler
+        for item in items:
+            handler(item)
+
+
+class _KeyedDeque:
+    '''FIFO where an item replaces the pending item with the same key, in place.
+
+    key(item) returns the key of an item, or None for items that are never
+    replaced. Supports the deque operations used by Queue and asyncio.Queue.
+    '''
+
+    def __init__(self, key):
+        self.key = key
+        self.entries = deque()
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def replace(self, item):
+        key = self.key(item)
+        if key is None:
+            return False
+        entry = self.pending.get(key)
+        if entry is None:
+            return False
+        entry[1] = item
+        return True
+
+    def append(self, item):
+        key = self.key(item)
+        entry = [key, item]
+        self.entries.append(entry)
+        if key is not None:
+            self.pending[key] = entry
+
+    def popleft(self):
+        key, item = self.entries.popleft()
+        if key is not None:
+            del self.pending[key]
+        return item
+
+
+class CoalescingQueue(Queue):
+    '''Variant of Queue that keeps only the latest item of each key.
+
+    An item whose key(item) is already pending replaces the pending item,
+    keeping its position in the queue; items with key None are always
+    added. Replacements never block nor overflow, and are counted in the
+    coalesced attribute.
+    '''
+
+    def __init__(self, maxsize=0, overflow='block', key=None):
+        self.key = key
+        self.coalesced = 0
+        Queue.__init__(self, maxsize, overflow)
+
+    def _init(self, maxsize):
+        self.queue = _KeyedDeque(self.key)
+
+    def _replace(self, item):
+        if self.queue.replace(item):
+            self.coalesced += 1
+            return True
+        return False
+
+
+class _KeyedAsyncQueue(asyncio.Queue):
+    # asyncio.Queue storing its items in a _KeyedDeque
+
+    def __init__(self, key):
+        self.key = key
+        asyncio.Queue.__init__(self)
+
+    def _init(self, maxsize):
+        self._queue = _KeyedDeque(self.key)
+
+
+class LoopQueue:
+    '''Queue feeding the coroutines of an asyncio event loop.
+
+    put() may be called from any thread: items put from outside the loop
+    are handed over with call_soon_threadsafe(). Coroutines running on
+    the loop retrieve items with "await get_async()".
+
+    With the block overflow policy and maxsize > 0, every item holds one
+    of maxsize slots from the time it is put until it is retrieved. A
+    thread calling put() waits for a free slot, as with Queue, and a
+    coroutine waits with "await put_async()". put() called on the loop
+    itself cannot wait without stalling the loop: if the queue is full,
+    the item is dropped and counted (put_nowait() raises Full instead).
+
+    If key is given, the queue keeps only the latest item of each key, as
+    CoalescingQueue does. On the loop, a replacement never waits for a slot
+    nor is dropped.
+    '''
+
+    def __init__(self, loop, maxsize=0, overflow='drop_oldest', key=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('unsupported overflow policy: %r' % (overflow,))
+        self.loop = loop
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.coalesced = 0
+        self.queue = asyncio.Queue() if key is None else _KeyedAsyncQueue(key)
+        # block policy - slots taken by items put and not yet retrieved,
+        # threads waiting in put() and coroutines waiting in put_async()
+        self._blocking = maxsize > 0 and overflow == 'block'
+        self._slots = 0
+        self._slot_freed = _Condition(_threading.Lock())
+        self._waiters = deque()
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def qsize(self):
+        """Return the approximate size of the queue (not reliable!)."""
+        return self.queue.qsize()
+
+    def empty(self):
+        """Return True if the queue is empty, False otherwise (not reliable!)."""
+        return self.queue.empty()
+
+    def put(self, item, block=True, timeout=None):
+        """Put an item into the queue.
+
+        Only a thread other than the loop's, putting into a full queue with
+        the block policy, waits for a free slot ('block' and 'timeout' as in
+        Queue.put).
+        """
+        if self._in_loop():
+            if self._replace(item):
+                return
+            if not self._blocking:
+                self._put(item)
+            elif self._take_slot():
+                self._put(item, True)
+            elif not block:
+                raise Full
+            else:
+                self.dropped += 1
+        elif self._blocking:
+            self._wait_slot(block, timeout)
+            self.loop.call_soon_threadsafe(self._put, item, True)
+        else:
+            self.loop.call_soon_threadsafe(self._put, item)
+
+    def put_nowait(self, item):
+        """Put an item into the queue without blocking."""
+        return self.put(item, False)
+
+    def put_or_drop(self, item):
+        """Put an item into the queue without blocking; if the queue is full
+        with the block policy, the item is dropped and counted."""
+        try:
+            self.put(item, False)
+        except Full:
+            with self._slot_freed:
+                self.dropped += 1
+
+    async def put_async(self, item):
+        """Put an item into the queue from a coroutine of the loop, waiting on
+        the loop for a free slot if the queue is full with the block policy."""
+        if self._replace(item):
+            return
+        if not self._blocking:
+            self._put(item)
+            return
+        while not self._take_slot():
+            waiter = self.loop.create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self._put(item, True)
+
+    def put_many(self, items, block=True, timeout=None):
+        """Put a batch of items into the queue, handed over to the loop in one call.
+
+        With the block policy, a thread hands over the items that have a slot
+        before waiting for more slots.
+        """
+        if self._in_loop():
+            for item in items:
+                self.put(item, block)
+        elif self._blocking:
+            batch = []
+            for item in items:
+                if not self._take_slot():
+                    if batch:
+                        self.loop.call_soon_threadsafe(self._put_many, batch, True)
+                        batch = []
+                    self._wait_slot(block, timeout)
+                batch.append(item)
+            if batch:
+                self.loop.call_soon_threadsafe(self._put_many, batch, True)
+        else:
+            self.loop.call_soon_threadsafe(self._put_many, list(items))
+
+    def _put_many(self, items, slotted=False):
+        for item in items:
+            self._put(item, slotted)
+
+    def _take_slot(self):
+        with self._slot_freed:
+            if self._slots < self.maxsize:
+                self._slots += 1
+                return True
+            return False
+
+    def _wait_slot(self, block, timeout):
+        # runs outside the loop thread - take a slot, waiting as Queue.put does
+        with self._slot_freed:
+            if not block:
+                if self._slots >= self.maxsize:
+                    raise Full
+            elif timeout is None:
+                while self._slots >= self.maxsize:
+                    self._slot_freed.wait()
+            elif timeout < 0:
+                raise ValueError("'timeout' must be a non-negative number")
+            else:
+                endtime = _time() + timeout
+                while self._slots >= self.maxsize:
+                    remaining = endtime - _time()
+                    if remaining <= 0.0:
+                        raise Full
+                    self._slot_freed.wait(remaining)
+            self._slots += 1
+
+    def _free_slot(self):
+        # runs on the loop thread
+        with self._slot_freed:
+            self._slots -= 1
+            self._slot_freed.notify()
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _replace(self, item):
+        # runs on the loop thread - replace the pending item with the same key
+        if isinstance(self.queue, _KeyedAsyncQueue) and self.queue._queue.replace(item):
+            self.coalesced += 1
+            return True
+        return False
+
+    def _put(self, item, slotted=False):
+        # runs on the loop thread - slotted items hold a slot of the block policy
+        if self._replace(item):
+            if slotted:
+                self._free_slot()
+            return
+        if not self._blocking and 0 < self.maxsize <= self.queue.qsize():
+            self.dropped += 1
+            if self.overflow == 'drop_newest':
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+    async def get_async(self):
+        """Remove and return an item, waiting on the loop until one is available."""
+        item = await self.queue.get()
+        if self._blocking:
+            self._free_slot()
+        return item
+
+    def get_nowait(self):
+        """Remove and return an item if one is immediately available, else raise Empty.
+
+        Must be called from the loop thread.
+        """
+        try:
+            item = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            raise Empty
+        if self._blocking:
+            self._free_slot()
+        return item
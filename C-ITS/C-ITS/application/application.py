@@ -5,11 +5,12 @@
 #######################################################################################################
 from math import sqrt
 from socket import MsgFlag
-import time
+from ITS_clock import now, sleep
 from application.message_handler import *
 from application.self_driving_test import *
 from in_vehicle_network.location_functions import position_read
 from in_vehicle_network.car_motor_functions import *
+from data_link.freshness import FreshnessFilter, MAX_AGE
 
 # #####################################################################################################
 # constants
@@ -24,22 +25,27 @@ warm_up_time = 10
 #             application to identify the intended recipiient of the user message.
 #		TIPS: i) You may want to add more data to the messages, by adding more fields to the dictionary
 # 			  ii)  user interface is useful to allow the user to control your system execution.
+#		Headless mode (no user interface):
+#			ca_interval - CA inter-generation time, used instead of asking the user (no warm-up time)
+#			user_event_queue - queue where the RSU reads the events of the user, instead of asking the user
 # -----------------------------------------------------------------------------------------
 def application_txd(node, node_type, start_flag, my_system_rxd_queue, ca_service_txd_queue, den_service_txd_queue,
-                    my_system_txd_queue, obu_list):
-    while not start_flag.isSet():
-        time.sleep(1)
+                    my_system_txd_queue, obu_list, ca_interval=None, user_event_queue=None):
+    start_flag.wait()
     print('STATUS: Ready to start - THREAD: application_txd - NODE: {}'.format(node), '\n')
 
-    time.sleep(warm_up_time)
-    ca_user_data = trigger_ca(node)
+    if ca_interval is None:
+        sleep(warm_up_time)
+        ca_user_data = int(trigger_ca(node))
+    else:
+        ca_user_data = ca_interval
     #	print('STATUS: Message from user - THREAD: application_txd - NODE: {}'.format(node),' - MSG: {}'.format(ca_user_data ),'\n')
-    ca_service_txd_queue.put(int(ca_user_data))
+    ca_service_txd_queue.put(ca_user_data)
     i = 0
     while True:
         if node_type == "RSU":
             i = i + 1
-            den_user_data = trigger_event(node)
+            den_user_data = trigger_event(node) if user_event_queue is None else user_event_queue.get()
             print('STATUS: Message from user - THREAD: application_txd - NODE: {}'.format(node),
                   ' - MSG: {}'.format(den_user_data), '\n')
             bus_id,new_route,estimate = choose_bus(obu_list, (den_user_data['event_src_x'],den_user_data['event_src_y']),
@@ -49,6 +55,10 @@ def application_txd(node, node_type, start_flag, my_system_rxd_queue, ca_service
             if bus_id==0 and len(new_route)==0 and estimate==0:
                 print('No available routes!')
             else:
+                # the bus may be out of radio range: the DEN is sent to its last known position
+                bus = find_obu(obu_list, bus_id)
+                if bus is not None:
+                    event['destination'] = {'node': bus_id, 'x': bus['x'], 'y': bus['y']}
                 den_service_txd_queue.put(event)
         else:
             den_service_txd_queue.put(my_system_txd_queue.get())
@@ -60,24 +70,34 @@ def application_txd(node, node_type, start_flag, my_system_rxd_queue, ca_service
 # Thread: application reception. In this example it receives CA and DEN messages. 
 # 		Incoming messages are send to the user and my_system thread, where the logic of your system must be executed
 # 		CA messages have 1-hop transmission and DEN messages may have multiple hops and validity time
-#		Note: current version does not support multihop and time validity. 
-#		TIPS: i) if you want to add multihop, you need to change the thread structure and add 
-#       		the den_service_txd_queue so that the node can relay the DEN message. 
-# 				Do not forget to this also at IST_core.py
+#		Note: current version does not support time validity. DEN messages are relayed by the facilities layer
+#		      (den_relay thread), and only the first copy of each DEN reaches this thread.
+#		Messages are relayed in batches (get_many/put_many)
 # -----------------------------------------------------------------------------------------
 def application_rxd(node, start_flag, services_rxd_queue, my_system_rxd_queue):
-    while not start_flag.isSet():
-        time.sleep(1)
+    start_flag.wait()
     print('STATUS: Ready to start - THREAD: application_rxd - NODE: {}'.format(node), '\n')
 
     while True:
-        msg_rxd = services_rxd_queue.get()
-        #		print('STATUS: Message received/send - THREAD: application_rxd - NODE: {}'.format(node),' - MSG: {}'.format(msg_rxd),'\n')
-        my_system_rxd_queue.put(msg_rxd)
+        msgs_rxd = services_rxd_queue.get_many()
+        #		print('STATUS: Message received/send - THREAD: application_rxd - NODE: {}'.format(node),' - MSG: {}'.format(msgs_rxd),'\n')
+        my_system_rxd_queue.put_many(msgs_rxd)
 
     return
 
 
+# -----------------------------------------------------------------------------------------
+# application_on_receive - synchronous version of application_rxd, for the fused reception pipeline.
+#		Pass-through: messages are put directly on my_system_rxd_queue. The handler runs in the reception
+#		thread (or in the event loop), so it never blocks: a message that finds the queue full is dropped
+#		and counted in the dropped attribute of the queue.
+# -----------------------------------------------------------------------------------------
+def application_on_receive(node, my_system_rxd_queue):
+    def on_receive(msg):
+        my_system_rxd_queue.put_or_drop(msg)
+    return on_receive
+
+
 # -----------------------------------------------------------------------------------------
 # Side function to calculate time estimate
 # -----------------------------------------------------------------------------------------
@@ -219,9 +239,11 @@ def verify_area(list_Bus, new_client_destin, new_client_pos):
 # 				you need to create an event with the same structure that is used for the user and 
 #               change the thread structure by adding the den_service_txd_queue so that this thread can send th DEN message. 
 # 				Do not forget to this also at IST_core.py
+#		Messages older than their max-age budget are discarded and counted on stale_stats (see freshness.py)
+#		max_age: max-age budget per msg_type - see rx_max_age in services.py
 # -----------------------------------------------------------------------------------------
 def my_system(node, node_type, start_flag, coordinates, obd_2_interface, my_system_rxd_queue,
-              movement_control_txd_queue, my_system_txd_queue, obu_list, route):
+              movement_control_txd_queue, my_system_txd_queue, obu_list, route, stale_stats=None, max_age=MAX_AGE):
     # TODO input test data
     # TODO de acordo se é OBU e RSU
 
@@ -246,8 +268,7 @@ def my_system(node, node_type, start_flag, coordinates, obd_2_interface, my_syst
 
     # Calculate time estimate
 
-    while not start_flag.isSet():
-        time.sleep(1)
+    start_flag.wait()
     print('STATUS: Ready to start - THREAD: my_system - NODE: {}'.format(node), '\n')
 
     # TODO if BUS start executing route
@@ -256,13 +277,16 @@ def my_system(node, node_type, start_flag, coordinates, obd_2_interface, my_syst
         enter_car(movement_control_txd_queue)
         turn_on_car(movement_control_txd_queue)
         stop_car (movement_control_txd_queue)
+    freshness = FreshnessFilter('my_system', stale_stats, max_age)
     while True:
         update_obu_list(obu_list)
         msg_rxd = my_system_rxd_queue.get()
+        if not freshness.fresh(msg_rxd):
+            continue
         if (msg_rxd['msg_type'] == 'CA'):
             if node_type == "RSU":
                 for obu in msg_rxd['info']:
-                    obu_info = (msg_rxd['node'], obu['x'], obu['y'], obu['t'], node, obu['route'], int(time.time()) + 10)
+                    obu_info = (msg_rxd['node'], obu['x'], obu['y'], obu['t'], node, obu['route'], int(now()) + 10)
                     add_new_obu(obu_list, obu_info, node)
 
         if (msg_rxd['msg_type'] == 'DEN'):
@@ -289,7 +313,7 @@ def my_system(node, node_type, start_flag, coordinates, obd_2_interface, my_syst
 
 def update_obu_list(obu_list):
     new_list = []
-    current_time = int(time.time())
+    current_time = int(now())
     for i in range(len(obu_list)):
         exp_time = obu_list[i]['timer']
         if current_time - exp_time > 0:
@@ -298,6 +322,13 @@ def update_obu_list(obu_list):
     return new_list
 
 
+def find_obu(obu_list, obu_id):
+    for obu in obu_list:
+        if obu['obu_id'] == obu_id:
+            return obu
+    return None
+
+
 def add_new_obu(obu_list, obu_info, self_node):
     in_id = obu_info[0]
     obu_present = False
@@ -319,14 +350,14 @@ def add_new_obu(obu_list, obu_info, self_node):
             # RSU didn't change
 
             if obu_list[obu_pos]['originating_rsu'] == self_node:
-                obu_list[obu_pos]['timer'] = int(time.time()) + 4
+                obu_list[obu_pos]['timer'] = int(now()) + 4
             else:
                 obu_list[obu_pos]['timer'] = obu_info[6]
         else:
             # New originating RSU
             obu_list[obu_pos]['originating_rsu'] = obu_info[4]
             if obu_info[4] == self_node:
-                obu_list[obu_pos]['timer'] = int(time.time()) + 4
+                obu_list[obu_pos]['timer'] = int(now()) + 4
             else:
                 obu_list[obu_pos]['timer'] = obu_info[6]
 
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# #################################################
+## WIRE CODECS - serialization of the messages exchanged by multicast_txd and multicast_rxd
+#	json   - human readable format, kept as a fallback for debugging (e.g. tcpdump/wireshark)
+#	binary - versioned format with one schema per msg_type: fixed header + typed fields.
+#	         Key names are never sent; each record starts with a bitmap of the schema fields present.
+# The receiver detects the codec from the first byte of the datagram, so nodes using different
+# codecs can share the same channel.
+#################################################
+import json
+import struct
+
+# #####################################################################################################
+# binary format definition
+#	header - magic (0xC1, never '{'), codec version, msg_type code
+#	record - presence bitmap (u16) + fields of the schema in order + extras (keys not covered by the schema)
+BINARY_MAGIC = 0xC1
+CODEC_VERSION = 1
+
+BINARY_HEADER = struct.Struct('!BBB')
+PRESENCE = struct.Struct('!H')
+EXTRAS_BIT = 0x8000
+
+U16 = struct.Struct('!H')
+U16_MAX = 0xFFFF
+U32 = struct.Struct('!I')
+POINT = struct.Struct('!ii')
+
+# msg_type codes - code 0 is used for unknown message types, sent as a generic dictionary
+MSG_TYPE_CODES = {'BEACON': 1, 'CA': 2, 'DEN': 3}
+MSG_TYPE_NAMES = dict((code, name) for name, code in MSG_TYPE_CODES.items())
+
+# Field types
+#	str       - utf-8 string (u16 length)
+#	u32       - unsigned integer
+#	route     - list of (x,y) integer points
+#	val       - tagged generic value (None, bool, int, float, str, list, dict)
+#	rec:NAME  - nested record encoded with schema NAME
+#	list:NAME - list of records encoded with schema NAME
+# A value that does not fit its field type is sent as an extra, so encoding never loses information.
+SCHEMAS = {
+	'BEACON': (('node', 'str'), ('pos_x', 'val'), ('pos_y', 'val'), ('time', 'val')),
+	'CA': (('node', 'str'), ('node_type', 'str'), ('msg_id', 'u32'), ('info', 'list:OBU_INFO'), ('obu_list', 'list:OBU_ENTRY')),
+	'DEN': (('node', 'str'), ('node_type', 'str'), ('msg_id', 'u32'), ('event', 'rec:DEN_EVENT')),
+	'OBU_INFO': (('x', 'val'), ('y', 'val'), ('t', 'val'), ('route', 'route')),
+	'OBU_ENTRY': (('obu_id', 'str'), ('x', 'val'), ('y', 'val'), ('t', 'val'), ('originating_rsu', 'str'), ('route', 'route'), ('timer', 'val')),
+	'DEN_EVENT': (('node_id', 'val'), ('route', 'route'), ('estimate', 'val'), ('dest_rsu', 'val'), ('status', 'val')),
+}
+
+# tags of the generic values
+TAG_NONE, TAG_TRUE, TAG_FALSE, TAG_I8, TAG_I16, TAG_I32, TAG_I64, TAG_BIGINT, TAG_FLOAT, TAG_STR, TAG_LIST, TAG_DICT = range(12)
+
+INT_TAGS = ((TAG_I8, struct.Struct('!b'), -2**7, 2**7), (TAG_I16, struct.Struct('!h'), -2**15, 2**15),
+	(TAG_I32, struct.Struct('!i'), -2**31, 2**31), (TAG_I64, struct.Struct('!q'), -2**63, 2**63))
+INT_STRUCTS = dict((tag, st) for tag, st, low, high in INT_TAGS)
+FLOAT = struct.Struct('!d')
+
+
+class CodecError(ValueError):
+	"Exception raised when a datagram cannot be decoded."
+	pass
+
+
+#------------------------------------------------------------------------------------------------
+# generic values - used by 'val' fields and by the extras of each record
+#		lengths and counts are u16: longer strings, lists and dictionaries raise CodecError
+#------------------------------------------------------------------------------------------------
+def _put_count(buf, count, what):
+	if count > U16_MAX:
+		raise CodecError('{} too long: {} items'.format(what, count))
+	buf += U16.pack(count)
+
+def _put_str(buf, value):
+	data = value.encode('utf-8')
+	_put_count(buf, len(data), 'string')
+	buf += data
+
+def _get_str(data, offset):
+	(length,) = U16.unpack_from(data, offset)
+	offset += U16.size
+	if offset + length > len(data):
+		raise CodecError('truncated string')
+	return str(data[offset:offset+length], 'utf-8'), offset + length
+
+def _put_value(buf, value):
+	if value is None:
+		buf.append(TAG_NONE)
+	elif value is True:
+		buf.append(TAG_TRUE)
+	elif value is False:
+		buf.append(TAG_FALSE)
+	elif isinstance(value, int):
+		for tag, st, low, high in INT_TAGS:
+			if low <= value < high:
+				buf.append(tag)
+				buf += st.pack(value)
+				return
+		buf.append(TAG_BIGINT)
+		_put_str(buf, repr(value))
+	elif isinstance(value, float):
+		buf.append(TAG_FLOAT)
+		buf += FLOAT.pack(value)
+	elif isinstance(value, str):
+		buf.append(TAG_STR)
+		_put_str(buf, value)
+	elif isinstance(value, (list, tuple)):
+		buf.append(TAG_LIST)
+		_put_count(buf, len(value), 'list')
+		for item in value:
+			_put_value(buf, item)
+	elif isinstance(value, dict):
+		buf.append(TAG_DICT)
+		_put_count(buf, len(value), 'dictionary')
+		for key, item in value.items():
+			_put_str(buf, str(key))
+			_put_value(buf, item)
+	else:
+		raise TypeError('value not serializable: {!r}'.format(value))
+
+def _get_value(data, offset):
+	tag = data[offset]
+	offset += 1
+	if tag == TAG_NONE:
+		return None, offset
+	elif tag == TAG_TRUE:
+		return True, offset
+	elif tag == TAG_FALSE:
+		return False, offset
+	elif tag in INT_STRUCTS:
+		st = INT_STRUCTS[tag]
+		return st.unpack_from(data, offset)[0], offset + st.size
+	elif tag == TAG_BIGINT:
+		value, offset = _get_str(data, offset)
+		try:
+			return int(value), offset
+		except ValueError:
+			raise CodecError('malformed integer')
+	elif tag == TAG_FLOAT:
+		return FLOAT.unpack_from(data, offset)[0], offset + FLOAT.size
+	elif tag == TAG_STR:
+		return _get_str(data, offset)
+	elif tag == TAG_LIST:
+		(count,) = U16.unpack_from(data, offset)
+		offset += U16.size
+		value = []
+		for i in range(count):
+			item, offset = _get_value(data, offset)
+			value.append(item)
+		return value, offset
+	elif tag == TAG_DICT:
+		(count,) = U16.unpack_from(data, offset)
+		offset += U16.size
+		value = dict()
+		for i in range(count):
+			key, offset = _get_str(data, offset)
+			value[key], offset = _get_value(data, offset)
+		return value, offset
+	raise CodecError('unknown value tag {}'.format(tag))
+
+
+#------------------------------------------------------------------------------------------------
+# typed fields - each field type has a put (encode) and a get (decode) function.
+#		put functions raise TypeError/ValueError/struct.error when the value does not fit the type
+#------------------------------------------------------------------------------------------------
+def _put_str_field(buf, value):
+	if not isinstance(value, str):
+		raise TypeError('str field')
+	_put_str(buf, value)
+
+def _put_u32(buf, value):
+	if not isinstance(value, int) or isinstance(value, bool):
+		raise TypeError('u32 field')
+	buf += U32.pack(value)
+
+def _get_u32(data, offset):
+	return U32.unpack_from(data, offset)[0], offset + U32.size
+
+def _put_route(buf, value):
+	points = bytearray()
+	_put_count(points, len(value), 'route')
+	for x, y in value:
+		if not isinstance(x, int) or not isinstance(y, int):
+			raise TypeError('route field')
+		points += POINT.pack(x, y)
+	buf += points
+
+def _get_route(data, offset):
+	(count,) = U16.unpack_from(data, offset)
+	offset += U16.size
+	end = offset + count*POINT.size
+	if end > len(data):
+		raise CodecError('truncated route')
+	value = [list(point) for point in POINT.iter_unpack(data[offset:end])]
+	return value, end
+
+def _record_field(name):
+	def put(buf, value):
+		if not isinstance(value, dict):
+			raise TypeError('rec field')
+		_put_record(buf, COMPILED_SCHEMAS[name], value)
+	def get(data, offset):
+		return _get_record(data, offset, COMPILED_SCHEMAS[name])
+	return put, get
+
+def _list_field(name):
+	def put(buf, value):
+		if not all(isinstance(item, dict) for item in value):
+			raise TypeError('list field')
+		_put_count(buf, len(value), 'list')
+		schema = COMPILED_SCHEMAS[name]
+		for item in value:
+			_put_record(buf, schema, item)
+	def get(data, offset):
+		(count,) = U16.unpack_from(data, offset)
+		offset += U16.size
+		schema = COMPILED_SCHEMAS[name]
+		value = []
+		for i in range(count):
+			item, offset = _get_record(data, offset, schema)
+			value.append(item)
+		return value, offset
+	return put, get
+
+FIELD_TYPES = {'str': (_put_str_field, _get_str), 'u32': (_put_u32, _get_u32),
+	'route': (_put_route, _get_route), 'val': (_put_value, _get_value)}
+
+#------------------------------------------------------------------------------------------------
+# compile_schema - translate a schema into a tuple of (bit, key, put, get), resolved once at import time
+#------------------------------------------------------------------------------------------------
+def compile_schema(schema):
+	fields = []
+	for bit, (key, ftype) in enumerate(schema):
+		if ftype.startswith('rec:'):
+			put, get = _record_field(ftype[4:])
+		elif ftype.startswith('list:'):
+			put, get = _list_field(ftype[5:])
+		else:
+			put, get = FIELD_TYPES[ftype]
+		fields.append((1 << bit, key, put, get))
+	return tuple(fields)
+
+COMPILED_SCHEMAS = dict((name, compile_schema(schema)) for name, schema in SCHEMAS.items())
+
+#------------------------------------------------------------------------------------------------
+# records - presence bitmap + fields present + extras
+#------------------------------------------------------------------------------------------------
+def _put_record(buf, schema, record, skip=()):
+	start = len(buf)
+	buf += PRESENCE.pack(0)
+	presence = 0
+	covered = set(skip)
+	for bit, key, put, get in schema:
+		if key not in record:
+			continue
+		mark = len(buf)
+		try:
+			put(buf, record[key])
+		except (TypeError, ValueError, struct.error):
+			# value does not fit the schema - rollback and send it as an extra
+			del buf[mark:]
+			continue
+		presence |= bit
+		covered.add(key)
+	if not covered.issuperset(record):
+		presence |= EXTRAS_BIT
+		_put_value(buf, dict((key, value) for key, value in record.items() if key not in covered))
+	PRESENCE.pack_into(buf, start, presence)
+
+def _get_record(data, offset, schema):
+	(presence,) = PRESENCE.unpack_from(data, offset)
+	offset += PRESENCE.size
+	record = dict()
+	for bit, key, put, get in schema:
+		if presence & bit:
+			record[key], offset = get(data, offset)
+	if presence & EXTRAS_BIT:
+		extras, offset = _get_value(data, offset)
+		if not isinstance(extras, dict):
+			raise CodecError('malformed extras')
+		record.update(extras)
+	return record, offset
+
+
+#------------------------------------------------------------------------------------------------
+# encode_binary/decode_binary - binary codec
+#------------------------------------------------------------------------------------------------
+def encode_binary(msg):
+	msg_type = msg.get('msg_type')
+	code = MSG_TYPE_CODES.get(msg_type, 0)
+	buf = bytearray(BINARY_HEADER.pack(BINARY_MAGIC, CODEC_VERSION, code))
+	if code:
+		_put_record(buf, COMPILED_SCHEMAS[msg_type], msg, skip=('msg_type',))
+	else:
+		_put_value(buf, dict(msg))
+	return bytes(buf)
+
+def decode_binary(data):
+	try:
+		magic, version, code = BINARY_HEADER.unpack_from(data, 0)
+		if magic != BINARY_MAGIC:
+			raise CodecError('not a binary frame')
+		if version != CODEC_VERSION:
+			raise CodecError('unsupported codec version {}'.format(version))
+		if code == 0:
+			msg, offset = _get_value(data, BINARY_HEADER.size)
+			if not isinstance(msg, dict):
+				raise CodecError('malformed message')
+			return msg
+		if code not in MSG_TYPE_NAMES:
+			raise CodecError('unknown msg_type code {}'.format(code))
+		msg_type = MSG_TYPE_NAMES[code]
+		msg, offset = _get_record(data, BINARY_HEADER.size, COMPILED_SCHEMAS[msg_type])
+	except (struct.error, IndexError, UnicodeDecodeError) as e:
+		raise CodecError('malformed binary frame: {}'.format(e))
+	msg['msg_type'] = msg_type
+	return msg
+
+
+#------------------------------------------------------------------------------------------------
+# encode_json/decode_json - json codec (debug fallback)
+#------------------------------------------------------------------------------------------------
+def encode_json(msg):
+	return json.dumps(msg if isinstance(msg, dict) else dict(msg)).encode('utf-8')
+
+def decode_json(data):
+	try:
+		msg = json.loads(str(data, 'utf-8'))
+	except ValueError as e:
+		raise CodecError('malformed json frame: {}'.format(e))
+	if not isinstance(msg, dict):
+		raise CodecError('malformed json frame: not an object')
+	return msg
+
+
+# #####################################################################################################
+# codec registry - name: (encode, decode)
+CODECS = {'json': (encode_json, decode_json), 'binary': (encode_binary, decode_binary)}
+DEFAULT_CODEC = 'binary'
+
+#------------------------------------------------------------------------------------------------
+# get_codec - encode and decode functions of a codec
+#------------------------------------------------------------------------------------------------
+def get_codec(name):
+	if name not in CODECS:
+		raise ValueError('unknown codec {} - available: {}'.format(name, ', '.join(sorted(CODECS))))
+	return CODECS[name]
+
+#------------------------------------------------------------------------------------------------
+# decode_message - decode a datagram of any codec, detected by its first byte
+#------------------------------------------------------------------------------------------------
+def decode_message(data):
+	if len(data) == 0:
+		raise CodecError('empty datagram')
+	if data[0] == BINARY_MAGIC:
+		return decode_binary(data)
+	return decode_json(data)
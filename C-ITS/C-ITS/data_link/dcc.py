@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# #################################################
+## CHANNEL LOAD MEASUREMENT - input of the decentralized congestion control (DCC) of the facilities layer.
+# multicast_rxd counts every datagram received in measurement windows of DCC_WINDOW seconds. At the end of
+# each window, the channel busy ratio (cbr) is published on the channel_status dictionary, shared with the
+# upper layers in the same way as coordinates:
+#	channel_status = {'cbr', 'frames_per_sec', 'bytes_per_sec', 't'}
+#################################################
+from ITS_clock import now as clock_now
+
+# channel capacity in bytes per second (6 Mbit/s - default ITS-G5 data rate) and measurement window (seconds)
+CHANNEL_CAPACITY = 750000
+DCC_WINDOW = 1.0
+
+
+#------------------------------------------------------------------------------------------------
+# ChannelLoad - channel load measurement. cbr is averaged with the previous window, as in ETSI DCC.
+#------------------------------------------------------------------------------------------------
+class ChannelLoad:
+
+	def __init__(self, channel_status, capacity=CHANNEL_CAPACITY, window=DCC_WINDOW):
+		self.channel_status = channel_status
+		self.capacity = capacity
+		self.window = window
+		self.start = clock_now()
+		self.frames = 0
+		self.nbytes = 0
+		self.cbr = 0.0
+		channel_status.update({'cbr': 0.0, 'frames_per_sec': 0.0, 'bytes_per_sec': 0.0, 't': self.start})
+
+	def add(self, nbytes, now=None):
+		if now is None:
+			now = clock_now()
+		if now - self.start >= self.window:
+			self.publish(now)
+		self.frames += 1
+		self.nbytes += nbytes
+
+	def publish(self, now):
+		elapsed = now - self.start
+		bytes_per_sec = self.nbytes/elapsed
+		self.cbr = (self.cbr + min(1.0, bytes_per_sec/self.capacity))/2
+		self.channel_status.update({'cbr': self.cbr, 'frames_per_sec': self.frames/elapsed, 'bytes_per_sec': bytes_per_sec, 't': now})
+		self.start = now
+		self.frames = 0
+		self.nbytes = 0
+
+
+#------------------------------------------------------------------------------------------------
+# channel_busy_ratio - last cbr published. Measurements are only published when datagrams are received,
+#		so a measurement older than two windows means that the channel has been idle since then.
+#------------------------------------------------------------------------------------------------
+def channel_busy_ratio(channel_status, now=None, window=DCC_WINDOW):
+	if not channel_status:
+		return 0.0
+	if now is None:
+		now = clock_now()
+	if now - channel_status['t'] > 2*window:
+		return 0.0
+	return channel_status['cbr']
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# #################################################
+## FRAGMENTATION - frames larger than one datagram (MSG_SIZE) are split by multicast_txd and
+# reassembled by multicast_rxd. Each fragment carries a small header:
+#	magic (0xC3) | version | fragment index (u16) | fragment count (u16) | datagram id (u32) | sender node (8 bytes)
+# The sender node is encoded as in the frame header (see node_field in frame.py).
+# Reassembly is bounded: number of datagrams under reassembly, total buffered bytes and a timeout
+# restarted by every fragment received. Incomplete datagrams are discarded when any bound is reached.
+#################################################
+import struct
+from ITS_clock import now as clock_now
+from collections import OrderedDict
+from data_link.frame import node_field
+
+FRAGMENT_MAGIC = 0xC3
+FRAGMENT_VERSION = 1
+FRAGMENT_HEADER = struct.Struct('!BBHHI8s')
+
+# reassembly bounds
+MAX_FRAGMENTS = 256				# fragments per datagram
+REASSEMBLY_TIMEOUT = 2.0		# seconds without receiving a fragment of an incomplete datagram
+REASSEMBLY_MAX_DATAGRAMS = 64	# datagrams under reassembly
+REASSEMBLY_MAX_BYTES = 1 << 20	# bytes buffered by incomplete datagrams
+
+
+#------------------------------------------------------------------------------------------------
+# fragment_frame - split a frame in datagrams of at most msg_size bytes
+#		(out) - list of datagrams; frames that fit in one datagram are sent as they are
+#------------------------------------------------------------------------------------------------
+def fragment_frame(frame, node, datagram_id, msg_size):
+	if len(frame) <= msg_size:
+		return [frame]
+	payload_size = msg_size - FRAGMENT_HEADER.size
+	count = (len(frame) + payload_size - 1) // payload_size
+	if count > MAX_FRAGMENTS:
+		raise ValueError('frame too large: {} bytes'.format(len(frame)))
+	node_bin = node_field(node)[0]
+	datagram_id = datagram_id & 0xFFFFFFFF
+	fragments = []
+	for index in range(count):
+		header = FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, FRAGMENT_VERSION, index, count, datagram_id, node_bin)
+		fragments.append(header + frame[index*payload_size:(index+1)*payload_size])
+	return fragments
+
+#------------------------------------------------------------------------------------------------
+# is_fragment - True if the datagram is a fragment of a larger frame
+#------------------------------------------------------------------------------------------------
+def is_fragment(data):
+	return len(data) >= FRAGMENT_HEADER.size and data[0] == FRAGMENT_MAGIC
+
+
+#------------------------------------------------------------------------------------------------
+# Reassembler - reassembly buffer used by multicast_rxd.
+#		counters: complete, expired, evicted (memory or datagram bound), duplicated, invalid
+#------------------------------------------------------------------------------------------------
+class Reassembler:
+
+	def __init__(self, timeout=REASSEMBLY_TIMEOUT, max_datagrams=REASSEMBLY_MAX_DATAGRAMS, max_bytes=REASSEMBLY_MAX_BYTES):
+		self.timeout = timeout
+		self.max_datagrams = max_datagrams
+		self.max_bytes = max_bytes
+		# key: (sender, node, datagram id) - value: [deadline, fragment count, {index: payload}, bytes]
+		self.pending = OrderedDict()
+		self.buffered = 0
+		self.counters = {'complete': 0, 'expired': 0, 'evicted': 0, 'duplicated': 0, 'invalid': 0}
+
+	def _discard(self, key, counter):
+		entry = self.pending.pop(key)
+		self.buffered -= entry[3]
+		self.counters[counter] += 1
+
+	def expire(self, now=None):
+		"Discard incomplete datagrams whose timeout expired."
+		if now is None:
+			now = clock_now()
+		# entries are kept in order of last fragment received, so the oldest are at the front
+		while self.pending:
+			key, entry = next(iter(self.pending.items()))
+			if entry[0] > now:
+				break
+			self._discard(key, 'expired')
+
+	def add(self, data, sender=None, now=None):
+		"""Add a fragment. Return the reassembled frame when the last fragment arrives, None otherwise."""
+		if now is None:
+			now = clock_now()
+		self.expire(now)
+		magic, version, index, count, datagram_id, node = FRAGMENT_HEADER.unpack_from(data, 0)
+		payload = bytes(data[FRAGMENT_HEADER.size:])
+		if version != FRAGMENT_VERSION or count == 0 or count > MAX_FRAGMENTS or index >= count or len(payload) > self.max_bytes:
+			self.counters['invalid'] += 1
+			return None
+		key = (sender, node, datagram_id)
+		entry = self.pending.get(key)
+		if entry is None:
+			entry = [0, count, dict(), 0]
+			self.pending[key] = entry
+		elif entry[1] != count:
+			self._discard(key, 'invalid')
+			return None
+		elif index in entry[2]:
+			self.counters['duplicated'] += 1
+			return None
+		entry[0] = now + self.timeout
+		entry[2][index] = payload
+		entry[3] += len(payload)
+		self.buffered += len(payload)
+		self.pending.move_to_end(key)
+		if len(entry[2]) == count:
+			self.pending.pop(key)
+			self.buffered -= entry[3]
+			self.counters['complete'] += 1
+			return b''.join(entry[2][i] for i in range(count))
+		# memory and datagram bounds - the least recently updated datagrams are discarded first
+		while self.pending and (self.buffered > self.max_bytes or len(self.pending) > self.max_datagrams):
+			self._discard(next(iter(self.pending)), 'evicted')
+		return None
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# #################################################
+## FRAMES - fixed-offset header placed before the codec body of every datagram.
+# The header carries the fields needed to route, filter or drop a message without decoding its body:
+#	magic (0xC2) | codec id | msg_type code | flags | sender node (8 bytes) | msg_id (u32) | sender position x,y (i32)
+# The sender node field holds the node id itself when it is a string of up to 8 bytes, or else an 8-byte digest
+# of str(node), so that own frames are recognized for node ids of any length or type.
+# The body is decoded lazily, only when a consumer first touches a field that is not in the header.
+#################################################
+import struct
+import hashlib
+from functools import lru_cache
+from collections.abc import MutableMapping
+from data_link.codec import *
+
+FRAME_MAGIC = 0xC2
+FRAME_HEADER = struct.Struct('!BBBB8sIii')
+NODE_SIZE = 8
+
+# flags
+#	FLAG_NODE   - header node is equal to the 'node' field of the body
+#	FLAG_MSG_ID - header msg_id is equal to the 'msg_id' field of the body
+#	FLAG_POS    - header position is valid
+#	FLAG_POS_XY - header position is equal to the 'pos_x'/'pos_y' fields of the body (e.g. beacons)
+#	FLAG_GN     - the body has a geonetworking header (the 'gn' field, see geo.py)
+#	FLAG_NODE_DIGEST - header node is the digest of str() of the 'node' field of the body (see node_digest)
+FLAG_NODE = 0x01
+FLAG_MSG_ID = 0x02
+FLAG_POS = 0x04
+FLAG_POS_XY = 0x08
+FLAG_GN = 0x10
+FLAG_NODE_DIGEST = 0x20
+
+# codec identification on the frame header
+CODEC_IDS = {'binary': 1, 'json': 2}
+CODEC_NAMES = dict((cid, name) for name, cid in CODEC_IDS.items())
+
+POS_MIN = -2**31
+POS_MAX = 2**31 - 1
+
+
+@lru_cache(maxsize=1024)
+def node_digest(node):
+	return hashlib.blake2b(str(node).encode('utf-8'), digest_size=NODE_SIZE).digest()
+
+#------------------------------------------------------------------------------------------------
+# node_field - sender node field of the frame header, also used by fragment.py and shmchannel.py
+#		(out) - (node bytes, FLAG_NODE) for string ids of up to 8 bytes, (digest, FLAG_NODE_DIGEST) for any
+#		        other id and (b'', 0) for None
+#------------------------------------------------------------------------------------------------
+def node_field(node):
+	if node is None:
+		return b'', 0
+	if isinstance(node, str):
+		node_bin = node.encode('utf-8')
+		if node_bin and len(node_bin) <= NODE_SIZE and b'\x00' not in node_bin:
+			return node_bin, FLAG_NODE
+	return node_digest(node), FLAG_NODE_DIGEST
+
+def _fits_pos(value):
+	return isinstance(value, int) and not isinstance(value, bool) and POS_MIN <= value <= POS_MAX
+
+#------------------------------------------------------------------------------------------------
+# encode_frame - header + body encoded with the selected codec
+#		coordinates: sender coordinates, used as header position when the message has no pos_x/pos_y
+#------------------------------------------------------------------------------------------------
+def encode_frame(msg, codec=DEFAULT_CODEC, coordinates=None):
+	encode, decode = get_codec(codec)
+	node_bin, flags = node_field(msg.get('node'))
+	msg_id = msg.get('msg_id')
+	if isinstance(msg_id, int) and not isinstance(msg_id, bool) and 0 <= msg_id < 2**32:
+		flags |= FLAG_MSG_ID
+	else:
+		msg_id = 0
+	pos_x, pos_y = msg.get('pos_x'), msg.get('pos_y')
+	if _fits_pos(pos_x) and _fits_pos(pos_y):
+		flags |= FLAG_POS | FLAG_POS_XY
+	elif coordinates is not None and _fits_pos(int(coordinates['x'])) and _fits_pos(int(coordinates['y'])):
+		flags |= FLAG_POS
+		pos_x, pos_y = int(coordinates['x']), int(coordinates['y'])
+	else:
+		pos_x = pos_y = 0
+	if msg.get('gn') is not None:
+		flags |= FLAG_GN
+	header = FRAME_HEADER.pack(FRAME_MAGIC, CODEC_IDS[codec], MSG_TYPE_CODES.get(msg.get('msg_type'), 0), flags,
+		node_bin, msg_id, pos_x, pos_y)
+	return header + encode(msg)
+
+#------------------------------------------------------------------------------------------------
+# peek_header - read the frame header without touching the body
+#		(out) - dictionary with msg_type, node, node_digest, msg_id, pos_x, pos_y, flags, codec; None for non-framed 
+#		        datagrams. node_digest is only set (and node is None) for the ids that do not fit the header.
+#------------------------------------------------------------------------------------------------
+def peek_header(data):
+	if len(data) < FRAME_HEADER.size or data[0] != FRAME_MAGIC:
+		return None
+	magic, codec_id, code, flags, node, msg_id, pos_x, pos_y = FRAME_HEADER.unpack_from(data, 0)
+	if codec_id not in CODEC_NAMES:
+		raise CodecError('unknown codec id {}'.format(codec_id))
+	header = {'codec': CODEC_NAMES[codec_id], 'msg_type': MSG_TYPE_NAMES.get(code), 'flags': flags,
+		'node': str(node.rstrip(b'\x00'), 'utf-8') if flags & FLAG_NODE else None,
+		'node_digest': node if flags & FLAG_NODE_DIGEST else None,
+		'msg_id': msg_id if flags & FLAG_MSG_ID else None,
+		'pos_x': pos_x if flags & FLAG_POS else None,
+		'pos_y': pos_y if flags & FLAG_POS else None}
+	return header
+
+
+#------------------------------------------------------------------------------------------------
+# LazyMessage - mapping view of a received frame. Keys available in the header (msg_type and, when
+#		flagged as exact, node, msg_id, pos_x, pos_y) are answered without decoding the body.
+#		Any other access decodes the body once; from then on it behaves as a plain dictionary.
+#		Note: it is a Mapping, not a dict subclass, so code that needs a real dict (e.g. json.dumps) must 
+#		      convert it with dict(msg) or msg.copy(), which decode the body.
+#------------------------------------------------------------------------------------------------
+class LazyMessage(MutableMapping):
+
+	__slots__ = ('header', '_body', '_peek', '_dict')
+
+	def __init__(self, header, body):
+		self.header = header
+		self._body = body
+		self._dict = dict()
+		self._peek = {'msg_type': header['msg_type']} if header['msg_type'] is not None else {}
+		flags = header['flags']
+		if flags & FLAG_NODE:
+			self._peek['node'] = header['node']
+		if flags & FLAG_MSG_ID:
+			self._peek['msg_id'] = header['msg_id']
+		if flags & FLAG_POS_XY:
+			self._peek['pos_x'] = header['pos_x']
+			self._peek['pos_y'] = header['pos_y']
+
+	def decoded(self):
+		"Return True if the body was already decoded."
+		return self._body is None
+
+	def materialize(self):
+		"Decode the body, if not done yet, and return the decoded dictionary."
+		if self._body is not None:
+			encode, decode = get_codec(self.header['codec'])
+			body, self._body = self._body, None
+			self._dict.update(decode(body))
+		return self._dict
+
+	def __getitem__(self, key):
+		if self._body is not None and key in self._peek:
+			return self._peek[key]
+		return self.materialize()[key]
+
+	def get(self, key, default=None):
+		if self._body is not None and key in self._peek:
+			return self._peek[key]
+		return self.materialize().get(key, default)
+
+	def __contains__(self, key):
+		if self._body is not None and key in self._peek:
+			return True
+		return key in self.materialize()
+
+	def __iter__(self):
+		return iter(self.materialize())
+
+	def __len__(self):
+		return len(self.materialize())
+
+	def __eq__(self, other):
+		if isinstance(other, LazyMessage):
+			other = other.materialize()
+		return self.materialize() == other
+
+	__hash__ = None
+
+	def __repr__(self):
+		return repr(self.materialize())
+
+	def __setitem__(self, key, value):
+		self.materialize()[key] = value
+
+	def __delitem__(self, key):
+		del self.materialize()[key]
+
+	def keys(self):
+		return self.materialize().keys()
+
+	def values(self):
+		return self.materialize().values()
+
+	def items(self):
+		return self.materialize().items()
+
+	def copy(self):
+		return dict(self.materialize())
+
+	def __reduce__(self):
+		return (dict, (self.copy(),))
+
+
+#------------------------------------------------------------------------------------------------
+# gn_header - geonetworking header of a message (None if it has none), without decoding the body of
+#		received frames that are not flagged as having one
+#------------------------------------------------------------------------------------------------
+def gn_header(msg):
+	if isinstance(msg, LazyMessage) and not msg.decoded() and not (msg.header['flags'] & FLAG_GN):
+		return None
+	return msg.get('gn')
+
+#------------------------------------------------------------------------------------------------
+# decode_frame - decode a datagram into a message
+#		framed datagrams  - LazyMessage, the body is only decoded when needed
+#		legacy datagrams  - plain dictionary (json or binary codec without frame header)
+#------------------------------------------------------------------------------------------------
+def decode_frame(data, header=None):
+	if header is None:
+		header = peek_header(data)
+	if header is None:
+		return decode_message(data)
+	return LazyMessage(header, bytes(data[FRAME_HEADER.size:]))
+
+#------------------------------------------------------------------------------------------------
+# frame_bytes - frame of a message, to be handed over to another process
+#		A LazyMessage whose body was not decoded is sent as received (header rebuilt, body not re-encoded);
+#		any other message is encoded with encode_frame.
+#------------------------------------------------------------------------------------------------
+def frame_bytes(msg, codec=DEFAULT_CODEC):
+	if isinstance(msg, LazyMessage) and not msg.decoded():
+		header = msg.header
+		node_bin = header['node'].encode('utf-8') if header['flags'] & FLAG_NODE else header['node_digest'] or b''
+		return FRAME_HEADER.pack(FRAME_MAGIC, CODEC_IDS[header['codec']], MSG_TYPE_CODES.get(header['msg_type'], 0), header['flags'],
+			node_bin, header['msg_id'] or 0, header['pos_x'] or 0, header['pos_y'] or 0) + msg._body
+	return encode_frame(msg, codec)
+
+#------------------------------------------------------------------------------------------------
+# drop_own_frames - default reception filter: multicast loopback delivers our own frames back to us
+#		(out) - True to accept the frame, False to drop it
+#------------------------------------------------------------------------------------------------
+def drop_own_frames(node, header):
+	if header['node'] is not None:
+		return header['node'] != str(node)
+	if header['node_digest'] is not None:
+		return header['node_digest'] != node_digest(node)
+	return True
+
+#------------------------------------------------------------------------------------------------
+# station_key - key of CoalescingQueue/LoopQueue for messages that supersede each other: only the latest
+#		beacon and CA message of each station is kept while waiting in a queue. 
+#		(out) - (msg_type, node), or None for messages that are never coalesced (DEN)
+#------------------------------------------------------------------------------------------------
+COALESCED_MSG_TYPES = ('BEACON', 'CA')
+
+def station_key(msg):
+	msg_type = msg.get('msg_type')
+	if msg_type in COALESCED_MSG_TYPES:
+		return (msg_type, msg.get('node'))
+	return None
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# #################################################
+## MESSAGE FRESHNESS - received messages are stamped by multicast_rxd (rx_time, on the frame header) and
+# discarded by the consumers when, at dequeue time, they waited longer than the max-age budget of their
+# msg_type. Under backlog, a node skips the stale periodic data and catches up within one interval.
+# Discarded messages are counted per stage and msg_type on the stale_stats dictionary:
+#	stale_stats = {stage: {msg_type: count}}
+# Note: messages without frame header (legacy datagrams) are not stamped and never expire.
+#################################################
+from ITS_clock import now as clock_now
+
+# max-age budget (seconds) per msg_type - msg_types not listed never expire (e.g. DEN messages)
+#		BEACON - beacon interval (TXD_BEACON_INTERVAL)
+#		CA     - 1 s, the nominal upper bound of the CA generation interval. Under DCC the interval grows with
+#		         the channel load and so does the budget (see rx_max_age in services.py)
+# A budget may also be a function without arguments, evaluated when the message is checked.
+MAX_AGE = {'BEACON': 5.0, 'CA': 1.0}
+
+
+#------------------------------------------------------------------------------------------------
+# stamp - record the reception time of a message
+#------------------------------------------------------------------------------------------------
+def stamp(msg, now=None):
+	header = getattr(msg, 'header', None)
+	if header is not None:
+		header['rx_time'] = clock_now() if now is None else now
+	return msg
+
+#------------------------------------------------------------------------------------------------
+# message_age - seconds since the message was received, or None if it was not stamped
+#------------------------------------------------------------------------------------------------
+def message_age(msg, now=None):
+	header = getattr(msg, 'header', None)
+	if header is None or 'rx_time' not in header:
+		return None
+	return (clock_now() if now is None else now) - header['rx_time']
+
+
+#------------------------------------------------------------------------------------------------
+# FreshnessFilter - max-age check of the messages dequeued by one stage
+#		stale_stats: dictionary where the stage publishes its counters (None - counters kept locally)
+#		max_age: max-age budget per msg_type (see MAX_AGE)
+#		fresh(msg)   - (out) False if the message expired
+#		filter(msgs) - (out) list of the messages that did not expire
+#------------------------------------------------------------------------------------------------
+class FreshnessFilter:
+
+	def __init__(self, stage, stale_stats=None, max_age=MAX_AGE):
+		self.max_age = max_age
+		self.counters = dict() if stale_stats is None else stale_stats.setdefault(stage, dict())
+
+	def fresh(self, msg, now=None):
+		max_age = self.max_age.get(msg.get('msg_type'))
+		if max_age is None:
+			return True
+		if callable(max_age):
+			max_age = max_age()
+		age = message_age(msg, now)
+		if age is None or age <= max_age:
+			return True
+		msg_type = msg.get('msg_type')
+		self.counters[msg_type] = self.counters.get(msg_type, 0) + 1
+		return False
+
+	def filter(self, msgs, now=None):
+		if now is None:
+			now = clock_now()
+		return [msg for msg in msgs if self.fresh(msg, now)]
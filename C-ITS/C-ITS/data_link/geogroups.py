@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# #################################################
+## GEOGRAPHIC MULTICAST GROUPS - the map is divided in square cells of GEO_CELL_SIZE and each cell is mapped
+# to one multicast group. A node sends to the group of its own cell and joins the groups of its cell and of
+# the 8 neighbour cells, so the kernel drops the traffic of far-away nodes. Memberships are updated
+# (IP_ADD_MEMBERSHIP/IP_DROP_MEMBERSHIP) as the node's coordinates change.
+# Cells are mapped to GEO_GROUPS_X x GEO_GROUPS_Y groups by wrapping around: nodes that share a group
+# without being neighbours are at least GEO_GROUPS_X (or Y) cells apart.
+# Note: the groups are organization-local (239.255.250.0/24). Add a route for them, as done for 224.0.0.0/24
+# in the multicast_config scripts.
+#################################################
+import sys
+import socket
+import struct
+
+GEO_CELL_SIZE = 50
+GEO_GROUPS_X = 8
+GEO_GROUPS_Y = 8
+GEO_GROUP_BASE = '239.255.250.0'
+GEO_GROUP_UPDATE_INTERVAL = 1.0
+
+# Linux delivers to a socket bound to INADDR_ANY the traffic of every group joined by any socket of the host,
+# unless IP_MULTICAST_ALL is reset (value from linux/in.h, not exported by the socket module)
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49)
+
+
+#------------------------------------------------------------------------------------------------
+# cell_of - map cell of a position
+#------------------------------------------------------------------------------------------------
+def cell_of(x, y, cell_size=GEO_CELL_SIZE):
+	return int(x // cell_size), int(y // cell_size)
+
+#------------------------------------------------------------------------------------------------
+# group_of_cell - multicast group address of a map cell
+#------------------------------------------------------------------------------------------------
+def group_of_cell(cx, cy):
+	base = struct.unpack('!I', socket.inet_aton(GEO_GROUP_BASE))[0]
+	index = (cx % GEO_GROUPS_X) + (cy % GEO_GROUPS_Y)*GEO_GROUPS_X
+	return socket.inet_ntoa(struct.pack('!I', base + index))
+
+#------------------------------------------------------------------------------------------------
+# group_of_position - multicast group used to send from position (x,y)
+#------------------------------------------------------------------------------------------------
+def group_of_position(x, y):
+	return group_of_cell(*cell_of(x, y))
+
+#------------------------------------------------------------------------------------------------
+# groups_around - multicast groups to be joined by a node at position (x,y): own cell and neighbour cells
+#------------------------------------------------------------------------------------------------
+def groups_around(x, y):
+	cx, cy = cell_of(x, y)
+	return set(group_of_cell(cx+dx, cy+dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+
+
+#------------------------------------------------------------------------------------------------
+# GroupMembership - multicast groups joined by a reception socket, updated from the node's coordinates
+#------------------------------------------------------------------------------------------------
+class GroupMembership:
+
+	def __init__(self, sock, coordinates):
+		self.sock = sock
+		self.coordinates = coordinates
+		self.cell = None
+		self.groups = set()
+		if sys.platform.startswith('linux'):
+			sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+
+	def _mreq(self, group):
+		return socket.inet_pton(socket.AF_INET, group) + struct.pack('=I', socket.INADDR_ANY)
+
+	def update(self):
+		"Join/drop groups if the node moved to another cell. Return True if memberships changed."
+		x, y = self.coordinates['x'], self.coordinates['y']
+		cell = cell_of(x, y)
+		if cell == self.cell:
+			return False
+		self.cell = cell
+		groups = groups_around(x, y)
+		for group in self.groups - groups:
+			self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, self._mreq(group))
+		for group in groups - self.groups:
+			self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, self._mreq(group))
+		self.groups = groups
+		return True
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# #################################################
+## SIMULATED RADIO MEDIUM - in-process replacement of the multicast socket, used to run many nodes in one
+# process. Every node attaches a MediumPort to a shared RadioMedium; multicast_txd/multicast_rxd use the port
+# as their transport (see the transport argument). A datagram sent by a node is delivered to every other
+# attached node within tx_range of the sender's coordinates, unless it is lost. Delivery may be delayed
+# by a fixed latency plus a random jitter.
+# The ports are hashed on a grid of cells of tx_range + MEDIUM_GRID_MARGIN, so a send only visits the ports of
+# the 3x3 cells around the sender instead of every attached node. Nodes move without notifying the medium: the
+# grid is rebuilt from their coordinates at most every MEDIUM_GRID_REFRESH seconds, and a node is assumed not
+# to move more than MEDIUM_GRID_MARGIN in that time. The range check itself uses the current coordinates.
+# Delivery is a function call in the sender's thread (or in the delivery_loop thread, when delayed); the
+# asyncio runtime hands the datagrams over to its loop in batches (see LoopHandoff in multicast.py).
+#################################################
+import time
+import math
+import random
+import heapq
+import threading
+from ITS_clock import now, Condition
+from Queue import Queue
+
+# medium defaults - tx_range in coordinate units, latency and jitter in seconds, loss as a probability
+MEDIUM_TX_RANGE = 50
+MEDIUM_LOSS = 0.0
+MEDIUM_LATENCY = 0.0
+MEDIUM_JITTER = 0.0
+
+# port grid - rebuild interval (seconds) and distance a node may move between rebuilds (coordinate units)
+MEDIUM_GRID_REFRESH = 0.1
+MEDIUM_GRID_MARGIN = 10
+
+
+#------------------------------------------------------------------------------------------------
+# MediumPort - attachment point of one node to the medium
+#		send(datagram)   - transmit a datagram
+#		receive_batch()  - block until datagrams arrive; (out) - list of (datagram, sender node)
+#		set_receiver(f)  - deliver datagrams by calling f(datagram, sender) instead of queueing them
+#		counters         - txd, rxd, lost, and out_of_range (datagrams of senders in the neighbouring cells
+#		                   that were out of range)
+#------------------------------------------------------------------------------------------------
+class MediumPort:
+
+	def __init__(self, medium, node, coordinates):
+		self.medium = medium
+		self.node = node
+		self.coordinates = coordinates
+		self.inbox = Queue()
+		self.receiver = self.inbox_put
+		self.counters = {'txd': 0, 'rxd': 0, 'lost': 0, 'out_of_range': 0}
+
+	def inbox_put(self, datagram, sender):
+		self.inbox.put((datagram, sender))
+
+	def set_receiver(self, receiver):
+		self.receiver = receiver
+
+	def send(self, datagram):
+		self.counters['txd'] += 1
+		self.medium.send(self, datagram)
+
+	def receive_batch(self):
+		batch = [self.inbox.get()]
+		while not self.inbox.empty():
+			batch.append(self.inbox.get())
+		return batch
+
+	def close(self):
+		self.medium.detach(self)
+
+
+#------------------------------------------------------------------------------------------------
+# RadioMedium - shared channel with range, loss and latency model
+#------------------------------------------------------------------------------------------------
+class RadioMedium:
+
+	def __init__(self, tx_range=MEDIUM_TX_RANGE, loss=MEDIUM_LOSS, latency=MEDIUM_LATENCY, jitter=MEDIUM_JITTER, seed=None,
+			grid_refresh=MEDIUM_GRID_REFRESH, grid_margin=MEDIUM_GRID_MARGIN):
+		self.tx_range = tx_range
+		self.cell_size = tx_range + grid_margin
+		self.grid_refresh = grid_refresh
+		# grid - dictionary (cx, cy) -> list of ports, rebuilt at grid_time (None: to be rebuilt)
+		self.grid = None
+		self.grid_time = 0
+		self.loss = loss
+		self.latency = latency
+		self.jitter = jitter
+		self.random = random.Random(seed)
+		self.ports = []
+		self.lock = threading.Lock()
+		# delayed deliveries - heap of (delivery time, sequence, port, datagram, sender)
+		self.pending = []
+		self.sequence = 0
+		self.pending_cond = Condition()
+		self.scheduler = None
+
+	def attach(self, node, coordinates):
+		port = MediumPort(self, node, coordinates)
+		with self.lock:
+			self.ports = self.ports + [port]
+			self.grid = None
+		return port
+
+	def detach(self, port):
+		with self.lock:
+			self.ports = [p for p in self.ports if p is not port]
+			self.grid = None
+
+	def cell_of(self, coordinates):
+		return int(coordinates['x'] // self.cell_size), int(coordinates['y'] // self.cell_size)
+
+	def neighbours(self, sender):
+		# (out) - ports of the 3x3 cells around the sender (every port if the range is unlimited)
+		if math.isinf(self.cell_size):
+			return self.ports
+		t = now()
+		grid = self.grid
+		if grid is None or t - self.grid_time >= self.grid_refresh:
+			grid = dict()
+			for port in self.ports:
+				grid.setdefault(self.cell_of(port.coordinates), []).append(port)
+			self.grid, self.grid_time = grid, t
+		cx, cy = self.cell_of(sender.coordinates)
+		return [port for dx in (-1, 0, 1) for dy in (-1, 0, 1) for port in grid.get((cx + dx, cy + dy), ())]
+
+	def in_range(self, sender, receiver):
+		dx = sender.coordinates['x'] - receiver.coordinates['x']
+		dy = sender.coordinates['y'] - receiver.coordinates['y']
+		return math.hypot(dx, dy) <= self.tx_range
+
+	def send(self, sender, datagram):
+		# the list of ports and the grid are replaced (never modified), so they can be read without the lock
+		for port in self.neighbours(sender):
+			if port is sender:
+				continue
+			if not self.in_range(sender, port):
+				port.counters['out_of_range'] += 1
+				continue
+			if self.loss > 0 and self.random.random() < self.loss:
+				port.counters['lost'] += 1
+				continue
+			delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter > 0 else 0)
+			if delay > 0:
+				self.schedule(now() + delay, port, datagram, sender.node)
+			else:
+				port.counters['rxd'] += 1
+				port.receiver(datagram, sender.node)
+
+	def schedule(self, deliver_at, port, datagram, sender):
+		with self.pending_cond:
+			if self.scheduler is None:
+				self.scheduler = threading.Thread(target=self.delivery_loop, daemon=True)
+				self.scheduler.start()
+			self.sequence += 1
+			heapq.heappush(self.pending, (deliver_at, self.sequence, port, datagram, sender))
+			self.pending_cond.notify()
+
+	def delivery_loop(self):
+		while True:
+			with self.pending_cond:
+				while not self.pending or self.pending[0][0] > now():
+					self.pending_cond.wait(self.pending[0][0] - now() if self.pending else None)
+				deliver_at, sequence, port, datagram, sender = heapq.heappop(self.pending)
+			port.counters['rxd'] += 1
+			port.receiver(datagram, sender)
@@ -7,7 +7,21 @@
 #################################################
 import time
 import socket
+import select
 import struct, json
+import asyncio
+import threading
+import weakref
+from Queue import Empty
+from ITS_clock import sleep as clock_sleep
+from data_link.codec import *
+from data_link.frame import *
+from data_link.fragment import *
+from data_link.scheduler import *
+from data_link.dcc import *
+from data_link.geogroups import *
+from data_link.rxstats import *
+from data_link.freshness import *
 
 # #####################################################################################################
 # message fields definition
@@ -31,14 +45,22 @@ PORT=4260
 # 		255 - unrestricted.
 MY_TTL = 1 
 
-# Packet size
+# Packet size - larger frames are fragmented by multicast_txd and reassembled by multicast_rxd
 MSG_SIZE=1024
 
-def multicast_txd(node, start_flag, multicast_txd_queue):
+# Reception modes
+#		copy     - one recvfrom per wakeup, each datagram received in a new bytes object
+#		zerocopy - datagrams received with recvfrom_into in a preallocated ring of buffers and parsed from
+#		           memoryview slices. Each wakeup drains the socket until EAGAIN or the ring is full.
+RX_MODES = ('copy', 'zerocopy')
+DEFAULT_RX_MODE = 'zerocopy' if hasattr(socket, 'MSG_DONTWAIT') else 'copy'
+RX_RING_SIZE = 64
 
-	while not start_flag.isSet():
-		time.sleep (1)
-	print('STATUS: Ready to start - THREAD: multicast_txd - NODE: {}'.format(node),'\n')
+#------------------------------------------------------------------------------------------------
+# open_txd_socket - UDP socket used to send datagrams to the multicast group
+#		(out) - socket and multicast group address
+#------------------------------------------------------------------------------------------------
+def open_txd_socket():
 
 	#Translates host/port (not used here) into a sequence of 5 tupples (family, type, proto, canonname, sockaddr) 
 	#Used o to obtain family information AF_INET
@@ -54,21 +76,13 @@ def multicast_txd(node, start_flag, multicast_txd_queue):
 	# 		IPPROTO_IP - IPv4 protocol	
 	#		MULTICAST_TTL - set ttl value
 	s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl_bin)
-	
-	msg = dict()
-	while True:
-		rxd_msg=multicast_txd_queue.get()
-		data_to_send=s.sendto(json.dumps(rxd_msg).encode('utf-8'), (addrinfo[4][0], PORT))
-	#	print('STATUS: Message transmitted - THREAD: multicast_txd - NODE: {}'.format(node),' - MSG: {}'.format(data_to_send),'\n')
-	return
-
+	return s, (addrinfo[4][0], PORT)
 
-def multicast_rxd(node, start_flag, multicast_rxd_queue, beacon_rxd_queue):
-
-	
-	while not start_flag.isSet():
-		time.sleep (1)
-	print('STATUS: Ready to start - THREAD: multicast_rxd - NODE: {}'.format(node),'\n')
+#------------------------------------------------------------------------------------------------
+# open_rxd_socket - UDP socket bound to PORT and joined to the multicast group
+#		join: False to bind the socket without joining MYGROUP_4 (geographic groups - see geogroups.py)
+#------------------------------------------------------------------------------------------------
+def open_rxd_socket(join=True):
 
 	#Create an UDP/IPv4 socket 
 	r=socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -94,16 +108,380 @@ def multicast_rxd(node, start_flag, multicast_rxd_queue, beacon_rxd_queue):
 
 	# Drop multicast - drop the socket from the IPv4 multicast address of the selected interface. Use the same primitive and replace IP_ADD_MEMBERSHIP  by
 	# 		IP_DROP_MEMBERSHIP - drop the socket from the multicast group
-	r.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-
-	while True :
-		rxd_data, sender = r.recvfrom(MSG_SIZE)
-		pkt_rxd = json.loads(rxd_data.decode('utf-8'))
-	#	print('STATUS: Message received - THREAD: multicast_rxd - NODE: {}'.format(node),' - MSG: {}'.format(pkt_rxd),'\n')
-		if (pkt_rxd['msg_type'] == 'BEACON'):
-			beacon_rxd_queue.put(pkt_rxd)
-		else:
-			multicast_rxd_queue.put(pkt_rxd)
+	if join:
+		r.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+	return r
+
+#------------------------------------------------------------------------------------------------
+# Thread - multicast_txd - transmission of messages in the multicast group
+#		codec: wire codec used to serialize the messages ('binary' or 'json' for debugging)
+#		coordinates: node's coordinates, sent on the frame header as the sender position
+#		transport: None for the multicast socket, or an in-process transport with a send(datagram) method 
+#		           (e.g. a MediumPort of a simulated RadioMedium - see medium.py)
+#		traffic_classes: priority order and channel budget of each traffic class - see scheduler.py
+#		geo_groups: True to send to the multicast group of the node's map cell instead of MYGROUP_4 
+#		            (requires coordinates - see geogroups.py)
+#		ready: Event set when the socket is open (readiness barrier of the node)
+#		Note: messages are moved from multicast_txd_queue to a TxScheduler, so DEN messages overtake 
+#		      a backlog of CA messages and beacons, and each class is limited to its channel budget.
+#		      While the DEN backlog is full, multicast_txd_queue is not drained and its producers block.
+#------------------------------------------------------------------------------------------------
+def multicast_txd(node, start_flag, multicast_txd_queue, codec=DEFAULT_CODEC, coordinates=None, transport=None, traffic_classes=TRAFFIC_CLASSES, geo_groups=False,
+		ready=None):
+
+	start_flag.wait()
+	print('STATUS: Ready to start - THREAD: multicast_txd - NODE: {}'.format(node),'\n')
+
+	if transport is not None:
+		send = transport.send
+	elif geo_groups:
+		s, group_addr = open_txd_socket()
+		send = lambda datagram: s.sendto(datagram, (group_of_position(coordinates['x'], coordinates['y']), PORT))
+	else:
+		s, group_addr = open_txd_socket()
+		send = lambda datagram: s.sendto(datagram, group_addr)
+	if ready is not None:
+		ready.set()
+	get_codec(codec)
+	scheduler = TxScheduler(traffic_classes)
+	datagram_id = 0
+	while True:
+		while not scheduler.full() and not multicast_txd_queue.empty():
+			scheduler.add(multicast_txd_queue.get())
+		cls, rxd_msg = scheduler.next()
+		if cls is None:
+			# nothing can be sent now - wait for a new message or, at most, until a waiting class has budget
+			if scheduler.full():
+				clock_sleep(rxd_msg)
+				continue
+			try:
+				scheduler.add(multicast_txd_queue.get(timeout=rxd_msg))
+			except Empty:
+				pass
+			continue
+		try:
+			datagrams = fragment_frame(encode_frame(rxd_msg, codec, coordinates), node, datagram_id, MSG_SIZE)
+		except ValueError as e:
+			print('ERROR: Message not sent - THREAD: multicast_txd - NODE: {}'.format(node),' - {}'.format(e),'\n')
+			continue
+		datagram_id = datagram_id + 1
+		for datagram in datagrams:
+			data_to_send=send(datagram)
+		scheduler.sent(cls, sum(len(datagram) for datagram in datagrams))
+	#	print('STATUS: Message transmitted - THREAD: multicast_txd - NODE: {}'.format(node),' - MSG: {}'.format(data_to_send),'\n')
+	return
+
+
+#------------------------------------------------------------------------------------------------
+# Thread - multicast_rxd - reception of messages from the multicast group. 
+#		Messages are routed, filtered or dropped based on the frame header only. The body is decoded 
+#		by the first consumer that needs it - see LazyMessage.
+#		rx_filter: function(node, header) that returns False for frames to be dropped
+#		rx_mode: 'copy' or 'zerocopy' - see RX_MODES (multicast socket only)
+#		transport: None for the multicast socket, or an in-process transport with a receive_batch() method 
+#		channel_status: dictionary where the channel load measurements are published - see dcc.py
+#		geo_groups: True to join the multicast groups around the node's position instead of MYGROUP_4.
+#		            Memberships are checked after every wakeup and at least every GEO_GROUP_UPDATE_INTERVAL
+#		coordinates: node's coordinates (geo_groups only)
+#		rx_stats: dictionary where the socket drop counters are published - see rxstats.py (multicast socket only).
+#		          Counters are published every RX_STATS_INTERVAL, also when no datagram arrives
+#		rcvbuf_max: ceiling of SO_RCVBUF, grown when the kernel drops datagrams (rx_stats only)
+#		ready: Event set when the socket is bound and joined (readiness barrier of the node)
+#------------------------------------------------------------------------------------------------
+def multicast_rxd(node, start_flag, multicast_rxd_queue, beacon_rxd_queue, rx_filter=drop_own_frames, rx_mode=DEFAULT_RX_MODE, transport=None, channel_status=None,
+		geo_groups=False, coordinates=None, rx_stats=None, rcvbuf_max=RCVBUF_MAX, ready=None):
+
+	start_flag.wait()
+	print('STATUS: Ready to start - THREAD: multicast_rxd - NODE: {}'.format(node),'\n')
+
+	reassembler = Reassembler()
+	channel_load = ChannelLoad(channel_status) if channel_status is not None else None
+	if transport is not None:
+		if ready is not None:
+			ready.set()
+		while True :
+			for rxd_data, sender in transport.receive_batch():
+				deliver_datagram(node, rxd_data, sender, reassembler, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_load)
+
+	r = open_rxd_socket(join=not geo_groups)
+	membership = None
+	wait = None
+	if geo_groups:
+		membership = GroupMembership(r, coordinates)
+		membership.update()
+		wait = GEO_GROUP_UPDATE_INTERVAL
+	monitor = None
+	if rx_stats is not None:
+		monitor = RxDropMonitor(r, rx_stats, rcvbuf_max, ancillary=(rx_mode == 'zerocopy'))
+		# wake up at least every interval, so the counters are published and SO_RCVBUF grown on an idle or stalled socket
+		wait = monitor.interval if wait is None else min(wait, monitor.interval)
+	if ready is not None:
+		ready.set()
+	if rx_mode == 'zerocopy':
+		ring = create_rx_ring(RX_RING_SIZE, MSG_SIZE)
+		while True :
+			for rxd_data, sender in receive_batch(r, ring, wait, monitor):
+				deliver_datagram(node, rxd_data, sender, reassembler, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_load)
+			if membership is not None:
+				membership.update()
+			if monitor is not None:
+				poll_rx_stats(node, monitor)
+	else:
+		while True :
+			if (wait is None) or select.select([r], [], [], wait)[0]:
+				rxd_data, sender = r.recvfrom(MSG_SIZE)
+				deliver_datagram(node, rxd_data, sender, reassembler, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_load)
+			if membership is not None:
+				membership.update()
+			if monitor is not None:
+				poll_rx_stats(node, monitor)
+	return
+
+#------------------------------------------------------------------------------------------------
+# poll_rx_stats - publish the socket drop counters and report receive buffer growth
+#------------------------------------------------------------------------------------------------
+def poll_rx_stats(node, monitor):
+	rcvbuf = monitor.rcvbuf
+	monitor.poll()
+	if monitor.rcvbuf != rcvbuf:
+		print('STATUS: Receive buffer increased - NODE: {}'.format(node),' - drops: {} rcvbuf: {}'.format(monitor.drops, monitor.rcvbuf),'\n')
 	return
 
 
+#------------------------------------------------------------------------------------------------
+# deliver_datagram - reassembly, header filtering and routing of one received datagram
+#		Accepted messages are stamped with their reception time (see freshness.py)
+#		data may be a memoryview of a reception buffer: only accepted frames are copied (see decode_frame)
+#		channel_load: ChannelLoad that accounts every datagram received, or None
+#------------------------------------------------------------------------------------------------
+def deliver_datagram(node, rxd_data, sender, reassembler, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_load=None):
+	if channel_load is not None:
+		channel_load.add(len(rxd_data))
+	if is_fragment(rxd_data):
+		rxd_data = reassembler.add(rxd_data, sender)
+		if rxd_data is None:
+			return
+	try:
+		header = peek_header(rxd_data)
+		if (header is not None) and not rx_filter(node, header):
+			return
+		pkt_rxd = decode_frame(rxd_data, header)
+	except CodecError as e:
+		print('ERROR: Invalid message - THREAD: multicast_rxd - NODE: {}'.format(node),' - {}'.format(e),'\n')
+		return
+	stamp(pkt_rxd)
+#	print('STATUS: Message received - THREAD: multicast_rxd - NODE: {}'.format(node),' - MSG: {}'.format(pkt_rxd),'\n')
+	if (pkt_rxd['msg_type'] == 'BEACON'):
+		beacon_rxd_queue.put(pkt_rxd)
+	else:
+		multicast_rxd_queue.put(pkt_rxd)
+	return
+
+#------------------------------------------------------------------------------------------------
+# create_rx_ring - preallocated reception buffers and their memoryviews
+#------------------------------------------------------------------------------------------------
+def create_rx_ring(ring_size, msg_size):
+	ring = []
+	for i in range(ring_size):
+		buf = bytearray(msg_size)
+		ring.append((buf, memoryview(buf)))
+	return ring
+
+#------------------------------------------------------------------------------------------------
+# receive_batch - block until one datagram arrives, then drain the socket without blocking until
+#		EAGAIN or the ring is full.
+#		timeout: maximum time to wait for the first datagram (None - no limit)
+#		monitor: RxDropMonitor updated from the SO_RXQ_OVFL ancillary data, or None
+#		(out) - list of (memoryview slice, sender); slices are only valid until the next call
+#------------------------------------------------------------------------------------------------
+def receive_batch(sock, ring, timeout=None, monitor=None):
+	batch = []
+	flags = 0
+	if timeout is not None:
+		# a socket timeout would also apply to the non-blocking reads, so wait with select instead
+		if not select.select([sock], [], [], timeout)[0]:
+			return batch
+		flags = socket.MSG_DONTWAIT
+	if (monitor is not None) and monitor.ancillary:
+		for buf, view in ring:
+			try:
+				nbytes, ancdata, msg_flags, sender = sock.recvmsg_into([buf], RXQ_OVFL_ANCBUFSIZE, flags)
+			except BlockingIOError:
+				break
+			if ancdata:
+				monitor.rxq_ovfl(ancdata)
+			batch.append((view[:nbytes], sender))
+			flags = socket.MSG_DONTWAIT
+		return batch
+	for buf, view in ring:
+		try:
+			nbytes, sender = sock.recvfrom_into(buf, len(buf), flags)
+		except BlockingIOError:
+			break
+		batch.append((view[:nbytes], sender))
+		flags = socket.MSG_DONTWAIT
+	return batch
+
+
+# #####################################################################################################
+# asyncio runtime - coroutine versions of multicast_txd and multicast_rxd. Queues read by these coroutines
+# must be LoopQueue objects. The socket is read by the event loop, so rx_mode does not apply.
+
+#------------------------------------------------------------------------------------------------
+# MulticastRxdProtocol - datagram protocol that delivers the received datagrams (see deliver_datagram)
+#------------------------------------------------------------------------------------------------
+class MulticastRxdProtocol(asyncio.DatagramProtocol):
+
+	def __init__(self, node, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_status=None):
+		self.node = node
+		self.rx_filter = rx_filter
+		self.multicast_rxd_queue = multicast_rxd_queue
+		self.beacon_rxd_queue = beacon_rxd_queue
+		self.reassembler = Reassembler()
+		self.channel_load = ChannelLoad(channel_status) if channel_status is not None else None
+
+	def datagram_received(self, data, sender):
+		deliver_datagram(self.node, data, sender, self.reassembler, self.rx_filter, self.multicast_rxd_queue, self.beacon_rxd_queue, self.channel_load)
+
+	def error_received(self, exc):
+		print('ERROR: Socket error - COROUTINE: multicast_rxd - NODE: {}'.format(self.node),' - {}'.format(exc),'\n')
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - multicast_txd_async - same as multicast_txd thread
+#		ready: threading Event set when the socket is open
+#------------------------------------------------------------------------------------------------
+async def multicast_txd_async(node, multicast_txd_queue, codec=DEFAULT_CODEC, coordinates=None, transport=None, traffic_classes=TRAFFIC_CLASSES,
+		geo_groups=False, ready=None):
+
+	loop = asyncio.get_running_loop()
+	if transport is None:
+		s, group_addr = open_txd_socket()
+		transport, protocol = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=s)
+	else:
+		group_addr = None
+	if ready is not None:
+		ready.set()
+	print('STATUS: Ready to start - COROUTINE: multicast_txd - NODE: {}'.format(node),'\n')
+
+	get_codec(codec)
+	scheduler = TxScheduler(traffic_classes)
+	datagram_id = 0
+	try:
+		while True:
+			while not scheduler.full() and not multicast_txd_queue.empty():
+				scheduler.add(multicast_txd_queue.get_nowait())
+			cls, rxd_msg = scheduler.next()
+			if cls is None:
+				# nothing can be sent now - wait for a new message or, at most, until a waiting class has budget
+				if scheduler.full():
+					await asyncio.sleep(rxd_msg)
+					continue
+				try:
+					scheduler.add(await asyncio.wait_for(multicast_txd_queue.get_async(), rxd_msg))
+				except asyncio.TimeoutError:
+					pass
+				continue
+			try:
+				datagrams = fragment_frame(encode_frame(rxd_msg, codec, coordinates), node, datagram_id, MSG_SIZE)
+			except ValueError as e:
+				print('ERROR: Message not sent - COROUTINE: multicast_txd - NODE: {}'.format(node),' - {}'.format(e),'\n')
+				continue
+			datagram_id = datagram_id + 1
+			for datagram in datagrams:
+				if group_addr is None:
+					transport.send(datagram)
+				elif geo_groups:
+					transport.sendto(datagram, (group_of_position(coordinates['x'], coordinates['y']), PORT))
+				else:
+					transport.sendto(datagram, group_addr)
+			scheduler.sent(cls, sum(len(datagram) for datagram in datagrams))
+	finally:
+		transport.close()
+	return
+
+#------------------------------------------------------------------------------------------------
+# LoopHandoff - datagrams delivered by an in-process transport from other threads, handed over to an event loop
+#		in batches: put() appends to a pending list and only the first datagram of a batch wakes the loop up
+#		(call_soon_threadsafe, or call_soon from the loop itself), so datagrams sent while the loop is busy 
+#		share one wakeup. There is one LoopHandoff per loop, shared by the nodes running on it.
+#		loop_receiver(loop, f) - (out) receiver for set_receiver that calls f(datagram, sender) on the loop
+#------------------------------------------------------------------------------------------------
+class LoopHandoff:
+
+	def __init__(self, loop):
+		self.loop = loop
+		self.lock = threading.Lock()
+		self.pending = []
+		self.wakeups = 0
+
+	def put(self, receiver, datagram, sender):
+		with self.lock:
+			self.pending.append((receiver, datagram, sender))
+			if len(self.pending) > 1:
+				return
+			self.wakeups += 1
+		try:
+			running = asyncio.get_running_loop()
+		except RuntimeError:
+			running = None
+		if running is self.loop:
+			self.loop.call_soon(self.deliver)
+		else:
+			self.loop.call_soon_threadsafe(self.deliver)
+
+	def deliver(self):
+		with self.lock:
+			batch, self.pending = self.pending, []
+		for receiver, datagram, sender in batch:
+			receiver(datagram, sender)
+
+_loop_handoffs = weakref.WeakKeyDictionary()
+_loop_handoffs_lock = threading.Lock()
+
+def loop_receiver(loop, receiver):
+	with _loop_handoffs_lock:
+		handoff = _loop_handoffs.get(loop)
+		if handoff is None:
+			handoff = _loop_handoffs[loop] = LoopHandoff(loop)
+	return lambda datagram, sender: handoff.put(receiver, datagram, sender)
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - multicast_rxd_async - same as multicast_rxd thread, datagrams delivered by MulticastRxdProtocol
+#		transport: in-process transport with a set_receiver(f) method, or None for the multicast socket
+#		rx_stats: socket drop counters, read from /proc/net/udp every RX_STATS_INTERVAL
+#		ready: threading Event set when the socket is bound and joined
+#------------------------------------------------------------------------------------------------
+async def multicast_rxd_async(node, multicast_rxd_queue, beacon_rxd_queue, rx_filter=drop_own_frames, transport=None, channel_status=None,
+		geo_groups=False, coordinates=None, rx_stats=None, rcvbuf_max=RCVBUF_MAX, ready=None):
+
+	loop = asyncio.get_running_loop()
+	membership = None
+	monitor = None
+	if transport is None:
+		r = open_rxd_socket(join=not geo_groups)
+		if geo_groups:
+			membership = GroupMembership(r, coordinates)
+			membership.update()
+		if rx_stats is not None:
+			monitor = RxDropMonitor(r, rx_stats, rcvbuf_max)
+		transport, protocol = await loop.create_datagram_endpoint(
+			lambda: MulticastRxdProtocol(node, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_status), sock=r)
+	else:
+		# datagrams are delivered from the sender's thread and handed over to the loop in batches
+		protocol = MulticastRxdProtocol(node, rx_filter, multicast_rxd_queue, beacon_rxd_queue, channel_status)
+		transport.set_receiver(loop_receiver(loop, protocol.datagram_received))
+	if ready is not None:
+		ready.set()
+	print('STATUS: Ready to start - COROUTINE: multicast_rxd - NODE: {}'.format(node),'\n')
+	try:
+		if (membership is None) and (monitor is None):
+			await loop.create_future()
+		while True:
+			await asyncio.sleep(min(GEO_GROUP_UPDATE_INTERVAL, RX_STATS_INTERVAL))
+			if membership is not None:
+				membership.update()
+			if monitor is not None:
+				poll_rx_stats(node, monitor)
+	finally:
+		transport.close()
+	return
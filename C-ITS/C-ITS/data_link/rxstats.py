@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# #################################################
+## RECEPTION DROP TELEMETRY - datagrams dropped by the kernel when multicast_rxd falls behind and the socket
+# receive queue overflows. The drop counter of the socket is read from the drops column of /proc/net/udp
+# and from the SO_RXQ_OVFL ancillary data of received datagrams (Linux, zerocopy reception). The ancillary
+# counter is the one of the moment the datagram was queued, so it lags behind when the socket is not
+# read while it overflows; /proc/net/udp gives the current value. When new drops are seen, SO_RCVBUF is
+# doubled up to a ceiling. Counters are published on the rx_stats dictionary,
+# shared with the upper layers in the same way as channel_status:
+#	rx_stats = {'drops', 'drops_per_sec', 'rx_queue', 'rcvbuf', 'rcvbuf_grown', 't'}
+# Note: the kernel limits SO_RCVBUF to net.core.rmem_max (sysctl), which may be lower than the ceiling.
+#################################################
+import os
+import sys
+import time
+import socket
+import struct
+
+# SO_RXQ_OVFL value from asm-generic/socket.h, not exported by the socket module
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+RXQ_OVFL_ANCBUFSIZE = socket.CMSG_SPACE(struct.calcsize('=I'))
+PROC_NET_UDP = '/proc/net/udp'
+
+# ceiling of the receive buffer (bytes) and interval between publications (seconds)
+RCVBUF_MAX = 4*1024*1024
+RX_STATS_INTERVAL = 1.0
+
+
+#------------------------------------------------------------------------------------------------
+# RxDropMonitor - drop counter and receive buffer sizing of one reception socket
+#		ancillary - True if the drop counter comes with the received datagrams (see rxq_ovfl)
+#		poll(now) - publish the counters and grow the receive buffer, at most every interval seconds
+#------------------------------------------------------------------------------------------------
+class RxDropMonitor:
+
+	def __init__(self, sock, rx_stats, rcvbuf_max=RCVBUF_MAX, interval=RX_STATS_INTERVAL, ancillary=False):
+		self.sock = sock
+		self.rx_stats = rx_stats
+		self.rcvbuf_max = rcvbuf_max
+		self.interval = interval
+		self.inode = os.fstat(sock.fileno()).st_ino
+		self.ancillary = False
+		if ancillary and sys.platform.startswith('linux'):
+			try:
+				sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+				self.ancillary = True
+			except OSError:
+				pass
+		self.kernel_drops = 0
+		self.drops = 0
+		self.rx_queue = 0
+		self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+		self.rcvbuf_grown = 0
+		self.last = time.time()
+		rx_stats.update({'drops': 0, 'drops_per_sec': 0.0, 'rx_queue': 0, 'rcvbuf': self.rcvbuf, 'rcvbuf_grown': 0, 't': self.last})
+
+	def rxq_ovfl(self, ancdata):
+		"Update the drop counter from the ancillary data of a datagram received with recvmsg_into."
+		for level, cmsg_type, data in ancdata:
+			if level == socket.SOL_SOCKET and cmsg_type == SO_RXQ_OVFL:
+				self.kernel_drops = max(self.kernel_drops, struct.unpack('=I', data[:4])[0])
+
+	def read_proc(self):
+		"Drop counter and receive queue length (bytes) of the socket from /proc/net/udp."
+		inode = str(self.inode)
+		try:
+			with open(PROC_NET_UDP) as f:
+				for line in f:
+					fields = line.split()
+					if len(fields) > 12 and fields[9] == inode:
+						self.rx_queue = int(fields[4].split(':')[1], 16)
+						self.kernel_drops = max(self.kernel_drops, int(fields[12]))
+						return
+		except (OSError, ValueError):
+			pass
+
+	def poll(self, now=None):
+		if now is None:
+			now = time.time()
+		elapsed = now - self.last
+		if elapsed < self.interval:
+			return
+		self.read_proc()
+		new_drops = self.kernel_drops - self.drops
+		self.drops = self.kernel_drops
+		if new_drops > 0:
+			self.grow_rcvbuf()
+		self.rx_stats.update({'drops': self.drops, 'drops_per_sec': new_drops/elapsed, 'rx_queue': self.rx_queue, 'rcvbuf': self.rcvbuf,
+			'rcvbuf_grown': self.rcvbuf_grown, 't': now})
+		self.last = now
+
+	def grow_rcvbuf(self):
+		"Double the receive buffer, up to rcvbuf_max. Return True if the kernel accepted a larger buffer."
+		if self.rcvbuf >= self.rcvbuf_max:
+			return False
+		try:
+			# Linux reports twice the size requested (bookkeeping overhead), so request half of the target
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, min(self.rcvbuf_max, 2*self.rcvbuf)//2)
+		except OSError:
+			return False
+		rcvbuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+		if rcvbuf <= self.rcvbuf:
+			# limited by net.core.rmem_max - stop trying
+			self.rcvbuf_max = self.rcvbuf
+			return False
+		self.rcvbuf = rcvbuf
+		self.rcvbuf_grown += 1
+		return True
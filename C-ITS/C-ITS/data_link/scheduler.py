@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# #################################################
+## TRANSMISSION SCHEDULER - traffic classes and channel budget used by multicast_txd.
+# Messages waiting for transmission are kept in one FIFO per traffic class. The next message sent is
+# the oldest one of the highest priority class that still has channel budget. The budget of each class
+# is a token bucket in bytes: sending a frame consumes its size (the bucket may go negative) and the
+# class becomes eligible again when the bucket refills to zero.
+# Each FIFO holds at most TXD_CLASS_BACKLOG messages: when it is full, the oldest message of the class is
+# dropped, so a class starved of budget sheds stale messages instead of growing without limit.
+# The classes in TXD_BLOCKING_CLASSES (DEN) are never dropped: while one of them is full, full() is True and
+# multicast_txd stops draining multicast_txd_queue, so the producers block on that queue (backpressure).
+#################################################
+from ITS_clock import now as clock_now
+from collections import deque
+
+# Traffic classes in priority order (highest first): (name, msg_types, rate in bytes/s, burst in bytes)
+#		rate None - class is not rate limited
+TRAFFIC_CLASSES = (
+	('DEN', ('DEN',), 64000, 16000),
+	('CA', ('CA',), 32000, 8000),
+	('BEACON', ('BEACON',), 8000, 2000),
+	('OTHER', None, 8000, 2000),
+)
+
+# maximum number of messages waiting in each traffic class
+TXD_CLASS_BACKLOG = 256
+
+# traffic classes that block instead of dropping their oldest message when their backlog is full
+TXD_BLOCKING_CLASSES = ('DEN',)
+
+
+#------------------------------------------------------------------------------------------------
+# TokenBucket - channel budget of one traffic class
+#------------------------------------------------------------------------------------------------
+class TokenBucket:
+
+	def __init__(self, rate, burst, now=None):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = burst
+		self.last = clock_now() if now is None else now
+
+	def refill(self, now):
+		if self.rate is not None:
+			self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+		self.last = now
+
+	def delay(self, now):
+		"Seconds until the bucket allows a transmission (0 if it already does)."
+		if self.rate is None:
+			return 0
+		self.refill(now)
+		return 0 if self.tokens >= 0 else -self.tokens/self.rate
+
+	def consume(self, nbytes, now):
+		if self.rate is None:
+			return
+		self.refill(now)
+		self.tokens -= nbytes
+
+
+#------------------------------------------------------------------------------------------------
+# TxScheduler - per-class FIFOs and token buckets
+#		add(msg)          - queue a message in its traffic class
+#		next(now)         - (out) (class, msg) to be sent now, or (None, delay) with the seconds to wait
+#		                    for budget; delay is None if there is nothing to send
+#		sent(cls, nbytes) - charge the bytes sent to the class budget
+#		full()            - (out) True while a blocking class is at its backlog: no message must be added 
+#		                    until it is False again
+#		backlog           - maximum number of messages waiting in each class (drop oldest)
+#		blocking          - names of the classes that are never dropped (see full())
+#		Note: counters['blocked'] counts the times a blocking class became full
+#------------------------------------------------------------------------------------------------
+class TxScheduler:
+
+	def __init__(self, traffic_classes=TRAFFIC_CLASSES, backlog=TXD_CLASS_BACKLOG, blocking=TXD_BLOCKING_CLASSES):
+		now = clock_now()
+		self.names = [name for name, msg_types, rate, burst in traffic_classes]
+		self.fifos = [deque() for c in traffic_classes]
+		self.backlog = backlog
+		self.blocking = [cls for cls, name in enumerate(self.names) if name in blocking]
+		self.buckets = [TokenBucket(rate, burst, now) for name, msg_types, rate, burst in traffic_classes]
+		self.class_of = dict()
+		self.default_class = len(traffic_classes) - 1
+		for cls, (name, msg_types, rate, burst) in enumerate(traffic_classes):
+			for msg_type in (msg_types or ()):
+				self.class_of[msg_type] = cls
+		self.counters = dict((name, {'queued': 0, 'sent': 0, 'bytes': 0, 'dropped': 0, 'blocked': 0, 'max_wait': 0.0}) for name in self.names)
+
+	def __len__(self):
+		return sum(len(fifo) for fifo in self.fifos)
+
+	def full(self):
+		return any(len(self.fifos[cls]) >= self.backlog for cls in self.blocking)
+
+	def add(self, msg, now=None):
+		cls = self.class_of.get(msg.get('msg_type'), self.default_class)
+		fifo = self.fifos[cls]
+		counters = self.counters[self.names[cls]]
+		if cls in self.blocking:
+			if len(fifo) + 1 == self.backlog:
+				counters['blocked'] += 1
+		elif len(fifo) >= self.backlog:
+			fifo.popleft()
+			counters['dropped'] += 1
+		fifo.append((clock_now() if now is None else now, msg))
+		counters['queued'] += 1
+
+	def next(self, now=None):
+		if now is None:
+			now = clock_now()
+		wait = None
+		for cls, fifo in enumerate(self.fifos):
+			if not fifo:
+				continue
+			delay = self.buckets[cls].delay(now)
+			if delay == 0:
+				queued_at, msg = fifo.popleft()
+				counters = self.counters[self.names[cls]]
+				counters['max_wait'] = max(counters['max_wait'], now - queued_at)
+				return cls, msg
+			wait = delay if wait is None else min(wait, delay)
+		return None, wait
+
+	def sent(self, cls, nbytes, now=None):
+		self.buckets[cls].consume(nbytes, clock_now() if now is None else now)
+		counters = self.counters[self.names[cls]]
+		counters['sent'] += 1
+		counters['bytes'] += nbytes
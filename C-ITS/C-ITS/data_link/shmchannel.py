@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# #################################################
+## SHARED-MEMORY CHANNEL - transport of multicast_txd/multicast_rxd for nodes running on the same host, in
+# place of the kernel multicast loopback. Each node owns a broadcast ring in shared memory, where it is the
+# only producer; every other node reads the ring with its own cursor. Frames are exchanged with no system
+# call on the hot path: a reader only sleeps (POLL_MIN to POLL_MAX seconds) while all rings are idle.
+#	directory           - '<channel>': owner pid of each station slot (0 - free)
+#	ring of a station   - '<channel>-<slot>': pid | reserve | head | node (8 bytes) | node flags | data (ring_size bytes)
+#	                      node, node flags - node field of the frame header and its FLAG_NODE/FLAG_NODE_DIGEST flag
+#	                      (see node_field in frame.py), so that long node ids are not truncated
+#	                      reserve, head - bytes written since the ring was created; the producer moves
+#	                      reserve before writing a record and head after. Each record is length (u32) + frame.
+# Readers never block the producer: a reader that falls more than ring_size bytes behind loses the
+# overwritten frames, counted as overruns, and resumes from the current head.
+# Slots of processes that exited without closing their port are reclaimed by the next node.
+#################################################
+import os
+import time
+import struct
+import threading
+from multiprocessing import shared_memory, resource_tracker
+from data_link.frame import node_field, FLAG_NODE
+
+CHANNEL_NAME = 'its-channel'
+MAX_STATIONS = 256
+STATION_RING_SIZE = 1 << 20
+
+DIRECTORY_ENTRY = struct.Struct('=Q')
+STATION_HEADER = struct.Struct('=QQQ8sB7x')
+PID_OFFSET = 0
+RESERVE_OFFSET = 8
+HEAD_OFFSET = 16
+COUNTER = struct.Struct('=Q')
+RECORD_LENGTH = struct.Struct('=I')
+
+# reader wait when all rings are idle (seconds, doubled up to POLL_MAX) and interval between directory scans
+POLL_MIN = 0.00005
+POLL_MAX = 0.001
+SCAN_INTERVAL = 1.0
+
+
+#------------------------------------------------------------------------------------------------
+# open_shared_memory - create or attach a shared memory block
+#		track: True to let the resource tracker of multiprocessing remove the block when this process exits
+#		       (own ring). The directory and the rings of other nodes must outlive this process.
+#		The tracker is shared by the ports of a process: attaching the ring of a port of the same process
+#		must not unregister it (see _tracked)
+#------------------------------------------------------------------------------------------------
+_tracked = set()
+
+def open_shared_memory(name, size=0, create=False, track=False):
+	if create:
+		shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+	else:
+		shm = shared_memory.SharedMemory(name=name)
+	if track:
+		_tracked.add(shm._name)
+	elif shm._name not in _tracked:
+		resource_tracker.unregister(shm._name, 'shared_memory')
+	return shm
+
+def unlink_shared_memory(shm):
+	_tracked.discard(shm._name)
+	shm.unlink()
+
+def _pid_alive(pid):
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+
+#------------------------------------------------------------------------------------------------
+# StationRing - ring of one station, as seen by a reader
+#------------------------------------------------------------------------------------------------
+class StationRing:
+
+	def __init__(self, shm, pid):
+		self.shm = shm
+		self.pid = pid
+		self.size = shm.size - STATION_HEADER.size
+		pid, reserve, head, node, flags = STATION_HEADER.unpack_from(shm.buf, 0)
+		# sender of the datagrams: the node id, or its digest for the ids that do not fit the header
+		self.node = str(node.rstrip(b'\x00'), 'utf-8') if flags & FLAG_NODE else node
+		self.cursor = head
+
+	def counter(self, offset):
+		return COUNTER.unpack_from(self.shm.buf, offset)[0]
+
+	def read(self, pos, length):
+		buf = self.shm.buf
+		start = pos % self.size
+		n = min(length, self.size - start)
+		data = bytes(buf[STATION_HEADER.size + start:STATION_HEADER.size + start + n])
+		if n < length:
+			data += bytes(buf[STATION_HEADER.size:STATION_HEADER.size + length - n])
+		return data
+
+	def overwritten(self, pos):
+		return self.counter(RESERVE_OFFSET) - self.size > pos
+
+	def close(self):
+		self.shm.close()
+
+
+#------------------------------------------------------------------------------------------------
+# ShmPort - attachment point of one node to the shared-memory channel (same interface as MediumPort)
+#		send(datagram)   - write a datagram on the node's ring
+#		receive_batch()  - wait until datagrams arrive on the rings of the other nodes;
+#		                   (out) - list of (datagram, sender node - or its digest, see StationRing)
+#		set_receiver(f)  - deliver datagrams by calling f(datagram, sender) from a reader thread
+#		counters         - txd, rxd and overruns (datagrams lost by this reader)
+#------------------------------------------------------------------------------------------------
+class ShmPort:
+
+	def __init__(self, node, channel=CHANNEL_NAME, ring_size=STATION_RING_SIZE):
+		self.node = str(node)
+		self.channel = channel
+		self.pid = os.getpid()
+		try:
+			self.directory = open_shared_memory(channel, MAX_STATIONS*DIRECTORY_ENTRY.size, create=True)
+		except FileExistsError:
+			self.directory = open_shared_memory(channel)
+		self.slot, self.ring = self.claim(ring_size)
+		self.size = ring_size
+		self.head = 0
+		self.stations = dict()
+		self.last_scan = 0.0
+		self.receiver = None
+		self.counters = {'txd': 0, 'rxd': 0, 'overruns': 0}
+
+	def station_name(self, slot):
+		return '{}-{}'.format(self.channel, slot)
+
+	def claim(self, ring_size):
+		# the first slot whose ring can be created is ours; rings left by dead processes are removed
+		for slot in range(MAX_STATIONS):
+			name = self.station_name(slot)
+			try:
+				ring = open_shared_memory(name, STATION_HEADER.size + ring_size, create=True, track=True)
+			except FileExistsError:
+				try:
+					stale = open_shared_memory(name)
+				except FileNotFoundError:
+					continue
+				pid = COUNTER.unpack_from(stale.buf, PID_OFFSET)[0]
+				if _pid_alive(pid):
+					stale.close()
+					continue
+				stale.close()
+				shared_memory.SharedMemory(name=name).unlink()
+				try:
+					ring = open_shared_memory(name, STATION_HEADER.size + ring_size, create=True, track=True)
+				except FileExistsError:
+					continue
+			STATION_HEADER.pack_into(ring.buf, 0, self.pid, 0, 0, *node_field(self.node))
+			DIRECTORY_ENTRY.pack_into(self.directory.buf, slot*DIRECTORY_ENTRY.size, self.pid)
+			return slot, ring
+		raise RuntimeError('no free station slot in channel {}'.format(self.channel))
+
+	def send(self, datagram):
+		need = RECORD_LENGTH.size + len(datagram)
+		if need > self.size:
+			raise ValueError('datagram too large: {} bytes'.format(len(datagram)))
+		buf = self.ring.buf
+		COUNTER.pack_into(buf, RESERVE_OFFSET, self.head + need)
+		record = RECORD_LENGTH.pack(len(datagram)) + bytes(datagram)
+		start = self.head % self.size
+		n = min(need, self.size - start)
+		buf[STATION_HEADER.size + start:STATION_HEADER.size + start + n] = record[:n]
+		if n < need:
+			buf[STATION_HEADER.size:STATION_HEADER.size + need - n] = record[n:]
+		self.head += need
+		COUNTER.pack_into(buf, HEAD_OFFSET, self.head)
+		self.counters['txd'] += 1
+
+	def scan(self):
+		# attach the rings of the stations that joined the channel, detach the ones that left it
+		for slot in range(MAX_STATIONS):
+			if slot == self.slot:
+				continue
+			pid = DIRECTORY_ENTRY.unpack_from(self.directory.buf, slot*DIRECTORY_ENTRY.size)[0]
+			station = self.stations.get(slot)
+			if (station is not None) and station.pid == pid:
+				continue
+			if station is not None:
+				station.close()
+				del self.stations[slot]
+			if pid == 0:
+				continue
+			try:
+				shm = open_shared_memory(self.station_name(slot))
+			except FileNotFoundError:
+				continue
+			if COUNTER.unpack_from(shm.buf, PID_OFFSET)[0] != pid:
+				shm.close()
+				continue
+			self.stations[slot] = StationRing(shm, pid)
+
+	def poll(self):
+		batch = []
+		for station in self.stations.values():
+			head = station.counter(HEAD_OFFSET)
+			if head - station.cursor > station.size:
+				self.counters['overruns'] += 1
+				station.cursor = head
+			while station.cursor < head:
+				(length,) = RECORD_LENGTH.unpack(station.read(station.cursor, RECORD_LENGTH.size))
+				datagram = station.read(station.cursor + RECORD_LENGTH.size, length) if length <= station.size else None
+				if (datagram is None) or station.overwritten(station.cursor):
+					# the producer lapped this reader while the record was being read
+					self.counters['overruns'] += 1
+					station.cursor = station.counter(HEAD_OFFSET)
+					break
+				batch.append((datagram, station.node))
+				station.cursor += RECORD_LENGTH.size + length
+		self.counters['rxd'] += len(batch)
+		return batch
+
+	def receive_batch(self):
+		delay = POLL_MIN
+		while True:
+			now = time.time()
+			if now - self.last_scan >= SCAN_INTERVAL:
+				self.scan()
+				self.last_scan = now
+			batch = self.poll()
+			if batch:
+				return batch
+			time.sleep(delay)
+			delay = min(2*delay, POLL_MAX)
+
+	def set_receiver(self, receiver):
+		start = self.receiver is None
+		self.receiver = receiver
+		if start:
+			threading.Thread(target=self.receive_loop, daemon=True).start()
+
+	def receive_loop(self):
+		while True:
+			for datagram, sender in self.receive_batch():
+				self.receiver(datagram, sender)
+
+	def close(self):
+		DIRECTORY_ENTRY.pack_into(self.directory.buf, self.slot*DIRECTORY_ENTRY.size, 0)
+		for station in self.stations.values():
+			station.close()
+		self.stations = dict()
+		self.ring.close()
+		unlink_shared_memory(self.ring)
+		self.directory.close()
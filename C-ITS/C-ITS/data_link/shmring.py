@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# #################################################
+## SHARED-MEMORY RINGS - queues between processes of the same host, without pickling nor pipes.
+# A ShmRing is a circular buffer of variable-size records in a shared memory block:
+#	head (u64) | tail (u64) | data (size bytes)
+#	head, tail - bytes written and read since the ring was created; each record is length (u32) + bytes
+# A ring has one producer process and one consumer process. The threads of each side are serialized by a
+# local lock; the two sides synchronize on a multiprocessing Condition, acquired once per batch.
+# MessageRing carries messages as frames (see frame.py), plus their reception time for the freshness
+# checks of the consumer. Received frames whose body was not decoded are handed over as they are.
+# Note: the shared memory block is removed by the process that created the ring (close), or by the
+#       resource tracker of multiprocessing when that process exits.
+#################################################
+import math
+import struct
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from time import time as _time
+from Queue import Empty, Full
+from data_link.frame import *
+from data_link.freshness import stamp
+
+RING_HEADER = struct.Struct('=QQ')
+HEAD_OFFSET = 0
+TAIL_OFFSET = 8
+COUNTER = struct.Struct('=Q')
+RECORD_LENGTH = struct.Struct('=I')
+RX_TIME = struct.Struct('=d')
+
+# default ring size (bytes) and overflow policies supported by a ring. The consumer owns the tail,
+# so the producer cannot discard pending records (no drop_oldest).
+RING_SIZE = 1 << 20
+RING_OVERFLOW_POLICIES = ('block', 'drop_newest')
+
+
+#------------------------------------------------------------------------------------------------
+# ShmRing - ring of byte records in shared memory
+#		put_many(records)  - write a batch of records; blocks (or drops, drop_newest) while the ring is full
+#		put_or_drop(record) - write a record without blocking; dropped and counted if the ring is full
+#		get_many()         - block until records are available; (out) - list of records (bytes)
+#		Rings are created before the processes are started and handed over as Process arguments.
+#------------------------------------------------------------------------------------------------
+class ShmRing:
+
+	def __init__(self, size=RING_SIZE, overflow='block'):
+		if overflow not in RING_OVERFLOW_POLICIES:
+			raise ValueError('unsupported overflow policy: {!r}'.format(overflow))
+		self.size = size
+		self.overflow = overflow
+		self.shm = shared_memory.SharedMemory(create=True, size=RING_HEADER.size + size)
+		self.name = self.shm.name
+		self.owner = True
+		RING_HEADER.pack_into(self.shm.buf, 0, 0, 0)
+		self.cond = multiprocessing.Condition()
+		self.dropped = 0
+		self.put_lock = threading.Lock()
+		self.get_lock = threading.Lock()
+
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		for key in ('shm', 'put_lock', 'get_lock'):
+			del state[key]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.shm = shared_memory.SharedMemory(name=self.name)
+		self.owner = False
+		self.put_lock = threading.Lock()
+		self.get_lock = threading.Lock()
+
+	def _counters(self):
+		return RING_HEADER.unpack_from(self.shm.buf, 0)
+
+	def _write(self, pos, data):
+		buf = self.shm.buf
+		start = pos % self.size
+		n = min(len(data), self.size - start)
+		buf[RING_HEADER.size + start:RING_HEADER.size + start + n] = data[:n]
+		if n < len(data):
+			buf[RING_HEADER.size:RING_HEADER.size + len(data) - n] = data[n:]
+
+	def _read(self, pos, length):
+		buf = self.shm.buf
+		start = pos % self.size
+		n = min(length, self.size - start)
+		data = bytes(buf[RING_HEADER.size + start:RING_HEADER.size + start + n])
+		if n < length:
+			data += bytes(buf[RING_HEADER.size:RING_HEADER.size + length - n])
+		return data
+
+	def empty(self):
+		head, tail = self._counters()
+		return head == tail
+
+	def put(self, record, block=True, timeout=None):
+		self.put_many([record], block, timeout)
+
+	def put_or_drop(self, record):
+		try:
+			self.put(record, False)
+		except Full:
+			with self.put_lock:
+				self.dropped += 1
+
+	def put_many(self, records, block=True, timeout=None):
+		if timeout is not None:
+			if timeout < 0:
+				raise ValueError("'timeout' must be a non-negative number")
+			endtime = _time() + timeout
+		with self.put_lock, self.cond:
+			head, tail = self._counters()
+			pos = head
+			try:
+				for record in records:
+					need = RECORD_LENGTH.size + len(record)
+					if need > self.size:
+						raise ValueError('record too large: {} bytes'.format(len(record)))
+					while self.size - (pos - tail) < need:
+						if self.overflow == 'drop_newest':
+							break
+						if not block:
+							raise Full
+						if pos != head:
+							# publish the records already written before waiting for the consumer
+							COUNTER.pack_into(self.shm.buf, HEAD_OFFSET, pos)
+							self.cond.notify()
+							head = pos
+						if timeout is None:
+							self.cond.wait()
+						elif not self.cond.wait(endtime - _time()) and endtime <= _time():
+							raise Full
+						head, tail = self._counters()
+					else:
+						self._write(pos, RECORD_LENGTH.pack(len(record)))
+						self._write(pos + RECORD_LENGTH.size, record)
+						pos += need
+						continue
+					self.dropped += 1
+			finally:
+				if pos != head:
+					COUNTER.pack_into(self.shm.buf, HEAD_OFFSET, pos)
+					self.cond.notify()
+
+	def get(self, block=True, timeout=None):
+		return self.get_many(1, block, timeout)[0]
+
+	def get_many(self, max_items=0, block=True, timeout=None):
+		if timeout is not None:
+			if timeout < 0:
+				raise ValueError("'timeout' must be a non-negative number")
+			endtime = _time() + timeout
+		with self.get_lock, self.cond:
+			head, tail = self._counters()
+			while head == tail:
+				if not block:
+					raise Empty
+				if timeout is None:
+					self.cond.wait()
+				elif not self.cond.wait(endtime - _time()) and endtime <= _time():
+					raise Empty
+				head, tail = self._counters()
+			records = []
+			while tail < head and not (0 < max_items <= len(records)):
+				(length,) = RECORD_LENGTH.unpack(self._read(tail, RECORD_LENGTH.size))
+				records.append(self._read(tail + RECORD_LENGTH.size, length))
+				tail += RECORD_LENGTH.size + length
+			COUNTER.pack_into(self.shm.buf, TAIL_OFFSET, tail)
+			self.cond.notify()
+			return records
+
+	def close(self):
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+
+#------------------------------------------------------------------------------------------------
+# pack_message/unpack_message - ring record of a message: reception time (NaN if not stamped) + frame
+#------------------------------------------------------------------------------------------------
+def pack_message(msg):
+	header = getattr(msg, 'header', None)
+	rx_time = header.get('rx_time', math.nan) if header is not None else math.nan
+	return RX_TIME.pack(rx_time) + frame_bytes(msg)
+
+def unpack_message(record):
+	(rx_time,) = RX_TIME.unpack_from(record, 0)
+	msg = decode_frame(record[RX_TIME.size:])
+	if not math.isnan(rx_time):
+		stamp(msg, rx_time)
+	return msg
+
+
+#------------------------------------------------------------------------------------------------
+# MessageRing - ShmRing of messages, with the interface of Queue used by the layer threads
+#------------------------------------------------------------------------------------------------
+class MessageRing(ShmRing):
+
+	def put_many(self, msgs, block=True, timeout=None):
+		ShmRing.put_many(self, [pack_message(msg) for msg in msgs], block, timeout)
+
+	def get_many(self, max_items=0, block=True, timeout=None):
+		return [unpack_message(record) for record in ShmRing.get_many(self, max_items, block, timeout)]
+
+	def put_nowait(self, msg):
+		self.put(msg, False)
+
+	def get_nowait(self):
+		return self.get(False)
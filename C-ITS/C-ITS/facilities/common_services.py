@@ -3,16 +3,18 @@
 # SENDING/RECEIVING SERVICES - Here you add the common services - CAM messages and DEN messages generation.
 # In this structure both messages are generated and received by the same thread. But, you may want to have independent threads
 ##########################################################################################################
-import time
+from ITS_clock import sleep
 from facilities.services import *
+from data_link.freshness import FreshnessFilter, MAX_AGE
 
 #------------------------------------------------------------------------------------------------
 # Thread - ca_service_txd - periodical transmission of CA messages.
+#		channel_status: channel load published by the data link. When given, the inter-generation interval 
+#		                grows from the user generation time up to CA_MAX_INTERVAL as the channel gets busy (DCC)
 #------------------------------------------------------------------------------------------------
-def ca_service_txd(node, node_type, start_flag, coordinates, obd_2_interface, ca_service_txd_queue, geonetwork_txd_queue, obu_list,route):
+def ca_service_txd(node, node_type, start_flag, coordinates, obd_2_interface, ca_service_txd_queue, geonetwork_txd_queue, obu_list,route, channel_status=None):
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: ca_service_txd - NODE: {}'.format(node),'\n')
 
 	ca_msg=dict()
@@ -24,35 +26,49 @@ def ca_service_txd(node, node_type, start_flag, coordinates, obd_2_interface, ca
 			print('STATUS: Message from user - THREAD: ca_service_txd - NODE: {}'.format(node),' - MSG: {}'.format(ca_msg_txd),'\n')
 			geonetwork_txd_queue.put(ca_msg_txd)
 			msg_id=msg_id+1
-			time.sleep(generation_time)
+			sleep(dcc_interval(generation_time, channel_status))
 			if (ca_service_txd_queue.empty()==False):
 				generation_time=ca_service_txd_queue.get()
 	return
 
 #------------------------------------------------------------------------------------------------
 # Thread - ca_service_exd - reception of CA messages and transmission to the application_rxd 
+#		Messages are relayed in batches (get_many/put_many)
+#		CA messages older than their max-age budget are discarded and counted on stale_stats (see freshness.py)
+#		max_age: max-age budget per msg_type - see rx_max_age in services.py
 #------------------------------------------------------------------------------------------------
-def ca_service_rxd(node, start_flag, geonetwork_rxd_ca_queue, services_rxd_queue):
+def ca_service_rxd(node, start_flag, geonetwork_rxd_ca_queue, services_rxd_queue, stale_stats=None, max_age=MAX_AGE):
 
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: ca_service_rxd - NODE: {}'.format(node),'\n')
 
+	freshness = FreshnessFilter('ca_service_rxd', stale_stats, max_age)
 	while True :
-		ca_msg_rxd=geonetwork_rxd_ca_queue.get()
-#		print('STATUS: Message received/send - THREAD: ca_service_rxd - NODE: {}'.format(node),' - MSG: {}'.format(ca_msg_rxd),'\n')
-		services_rxd_queue.put(ca_msg_rxd)
+		ca_msgs_rxd=freshness.filter(geonetwork_rxd_ca_queue.get_many())
+#		print('STATUS: Message received/send - THREAD: ca_service_rxd - NODE: {}'.format(node),' - MSG: {}'.format(ca_msgs_rxd),'\n')
+		if ca_msgs_rxd:
+			services_rxd_queue.put_many(ca_msgs_rxd)
 	return
 
+#------------------------------------------------------------------------------------------------
+# ca_service_on_receive - synchronous version of ca_service_rxd, for the fused reception pipeline.
+#		CA messages older than their max-age budget are discarded and counted on stale_stats, as in ca_service_rxd
+#------------------------------------------------------------------------------------------------
+def ca_service_on_receive(node, services_on_receive, stale_stats=None, max_age=MAX_AGE):
+	freshness = FreshnessFilter('ca_service_rxd', stale_stats, max_age)
+	def on_receive(msg_rxd):
+		if freshness.fresh(msg_rxd):
+			services_on_receive(msg_rxd)
+	return on_receive
+
 #------------------------------------------------------------------------------------------------
 # Thread - den_service_txd -  transmission of DEN messages.
 #			Note: for message repetition, you need to include the repetition mechanism.
 #------------------------------------------------------------------------------------------------
 def den_service_txd(node, node_type, start_flag, coordinates, obd2_interface, den_service_txd_queue, geonetwork_txd_queue):
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: den_service_txd - NODE: {}'.format(node),'\n')
 
 	msg_id =0
@@ -66,15 +82,47 @@ def den_service_txd(node, node_type, start_flag, coordinates, obd2_interface, de
 
 #------------------------------------------------------------------------------------------------
 # Thread - den_service_exd - reception of DEN messages and transmission to the application_rxd 
+#		Messages are relayed in batches (get_many/put_many)
+#		relay: node's DenRelay - duplicates are discarded and first copies are scheduled to be relayed
+#		       (see den_relay); None to pass every DEN up
 #------------------------------------------------------------------------------------------------
-def den_service_rxd(node, start_flag, geonetwork_rxd_den_queue, services_rxd_queue):
+def den_service_rxd(node, start_flag, geonetwork_rxd_den_queue, services_rxd_queue, relay=None):
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: den_service_rxd - NODE: {}'.format(node),'\n')
 
 	while True :
-		den_msg_rxd=geonetwork_rxd_den_queue.get()
-#		print('STATUS: Message received/send - THREAD: den_service_txd - NODE: {}'.format(node),' - MSG: {}'.format(den_msg_rxd),'\n')
-		services_rxd_queue.put(den_msg_rxd)
+		den_msgs_rxd=geonetwork_rxd_den_queue.get_many()
+#		print('STATUS: Message received/send - THREAD: den_service_txd - NODE: {}'.format(node),' - MSG: {}'.format(den_msgs_rxd),'\n')
+		if relay is not None:
+			den_msgs_rxd=[msg for msg in den_msgs_rxd if relay.receive(msg)]
+		if den_msgs_rxd:
+			services_rxd_queue.put_many(den_msgs_rxd)
+	return
+
+#------------------------------------------------------------------------------------------------
+# den_service_on_receive - synchronous version of den_service_rxd, for the fused reception pipeline.
+#		Pass-through when there is no relay: the handler of the application layer is returned.
+#------------------------------------------------------------------------------------------------
+def den_service_on_receive(node, services_on_receive, relay=None):
+	if relay is None:
+		return services_on_receive
+	def on_receive(msg_rxd):
+		if relay.receive(msg_rxd):
+			services_on_receive(msg_rxd)
+	return on_receive
+
+#------------------------------------------------------------------------------------------------
+# Thread - den_relay - multi-hop DEN relay: DENs are sent again to the geonetwork_txd once their contention
+#		delay expires without another node relaying them first (see DenRelay)
+#------------------------------------------------------------------------------------------------
+def den_relay(node, start_flag, relay, geonetwork_txd_queue):
+
+	start_flag.wait()
+	print('STATUS: Ready to start - THREAD: den_relay - NODE: {}'.format(node),'\n')
+
+	while True :
+		den_msgs_txd=relay.wait_due()
+#		print('STATUS: Message relayed - THREAD: den_relay - NODE: {}'.format(node),' - MSG: {}'.format(den_msgs_txd),'\n')
+		geonetwork_txd_queue.put_many(den_msgs_txd)
 	return
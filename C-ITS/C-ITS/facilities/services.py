@@ -3,9 +3,39 @@
 ## FUNCTIONS USED BY FACILITITES LAYER  - COMMMON SERVICES
 #################################################
 import time
+import math
+import heapq
+from collections import OrderedDict
+from ITS_clock import now, Condition
 from in_vehicle_network.car_motor_functions import *
 from in_vehicle_network.location_functions import *
 from rsu_legacy_systems.rsu_control import *
+from data_link.dcc import channel_busy_ratio
+from data_link.frame import gn_header
+from data_link.freshness import MAX_AGE
+
+# DCC - bounds of the CA inter-generation interval (seconds) and DCC states: (cbr upper limit, position of
+# the interval between the lower and the upper bound). The lower bound is the generation time typed by the user.
+CA_MIN_INTERVAL = 0.1
+CA_MAX_INTERVAL = 10
+DCC_STATES = ((0.30, 0.0), (0.40, 0.25), (0.50, 0.5), (0.60, 0.75), (float('inf'), 1.0))
+
+# max-age budget of the received CA messages, in CA inter-generation intervals at the current channel load:
+# a CA that waited longer is superseded by the next one of its station
+CA_MAX_AGE_INTERVALS = 1
+
+# relevance area of CA messages - radius of the circle around the sender (coordinate units) sent as a geocast
+# area. Nodes outside the circle do not deliver the CA, so it must cover the RSU service area. 
+#		None - CAs are broadcast to every node that receives them (RSUs at any distance included)
+CA_AREA_RADIUS = None
+
+# DEN relay - hop limit of the DEN messages, duplicate cache (entries, seconds) and contention timers: a node at
+# distance d from the last transmitter waits DEN_RELAY_MAX_DELAY*(1 - d/DEN_RELAY_RANGE) before relaying
+DEN_HOP_LIMIT = 5
+DEN_CACHE_SIZE = 1024
+DEN_CACHE_TTL = 60
+DEN_RELAY_MAX_DELAY = 0.1
+DEN_RELAY_RANGE = 100
 
 
 # ------------------------------------------------------------------------------------------------
@@ -14,14 +44,18 @@ from rsu_legacy_systems.rsu_control import *
 #                    - msg_id: identification of the event used to discard duplicated DEN messages received
 #                    - coordinates: real-time position (x,y) at the instant (t) when the message is created
 #                    - obd_2_interface: vehicle's dynamic information (speed, direction and heading).
+#                    - area_radius: OBU messages are geocast to the circle of area_radius around the vehicle 
+#                      (see geo.py), or broadcast if it is None
 # -------------------------------------------------------------------------------------------------
 
-def create_ca_message(node, node_type, msg_id, coordinates, obd_2_interface, obu_list, route):
+def create_ca_message(node, node_type, msg_id, coordinates, obd_2_interface, obu_list, route, area_radius=CA_AREA_RADIUS):
     if node_type == "OBU":
         x, y, t = position_read(coordinates)
         s, d, h = get_vehicle_info(obd_2_interface)
         obu_info = [{'x': x, 'y': y, 't': t, 'route': route}]
         ca_msg = {'msg_type': 'CA', 'node': node, 'node_type': node_type, 'msg_id': msg_id, 'info': obu_info}
+        if area_radius is not None:
+            ca_msg['gn'] = {'type': 'geocast', 'area': {'shape': 'circle', 'x': x, 'y': y, 'r': area_radius}}
     elif node_type == "RSU":
         ca_msg = {'msg_type': 'CA', 'node': node, 'node_type': node_type, 'msg_id': msg_id, 'obu_list': obu_list}
     return ca_msg
@@ -29,15 +63,146 @@ def create_ca_message(node, node_type, msg_id, coordinates, obd_2_interface, obu
 
 # ------------------------------------------------------------------------------------------------
 # create_DEN_message - create an event message (DEN) based on information received from application layer
+#                      DENs of an OBU carry its position (x,y) and time (t), as CA messages do
 #                    - node: node that generates the event
 #                    - msg_id: identification of the event used to discard duplicated DEN messages received
 #                    - coordinates: real-time position (x,y) at the instant (t) when the message is created
 #                    - event: event information received from application layer.
+#                      event['destination'] (optional): {'node', 'x', 'y'} of the node the event is addressed to, 
+#                      sent to it by geo unicast (see geo.py) instead of being broadcast to the neighbours
+#                      event['area'] (optional): area of the nodes the event is relevant to, {'shape': 'circle', 'x', 'y', 'r'}
+#                      or {'shape': 'rect', 'x1', 'y1', 'x2', 'y2'}, sent by geocast
+#                    Other events are sent by topologically-scoped broadcast (tsb), relayed up to DEN_HOP_LIMIT hops
 # -------------------------------------------------------------------------------------------------
 def create_den_message(node, node_type, msg_id, coordinates, event):
-    #	if node_type == "OBU":
-    #		x,y,t = position_read(coordinates)
-    #		den_msg= {'msg_type':'DEN', 'node':node, 'msg_id':msg_id,'pos_x': x,'pos_y':y, 'time':t, 'event': event}
-    if node_type == "RSU":
-        den_msg = {'msg_type': 'DEN', 'node': node, 'node_type': node_type, 'event': event}
+    # the addressing fields are taken out of a copy: the application keeps its event as it was
+    event = dict(event)
+    destination = event.pop('destination', None)
+    area = event.pop('area', None)
+    if node_type == "OBU":
+        x, y, t = position_read(coordinates)
+        den_msg = {'msg_type': 'DEN', 'node': node, 'node_type': node_type, 'msg_id': msg_id, 'pos_x': x, 'pos_y': y, 'time': t, 'event': event}
+    else:
+        den_msg = {'msg_type': 'DEN', 'node': node, 'node_type': node_type, 'msg_id': msg_id, 'event': event}
+    if destination is not None:
+        den_msg['gn'] = {'type': 'unicast', 'dest': str(destination['node']), 'dest_x': destination['x'], 'dest_y': destination['y']}
+    elif area is not None:
+        den_msg['gn'] = {'type': 'geocast', 'area': area, 'hop_limit': DEN_HOP_LIMIT}
+    else:
+        den_msg['gn'] = {'type': 'tsb', 'hop_limit': DEN_HOP_LIMIT}
     return den_msg
+
+
+# ------------------------------------------------------------------------------------------------
+# DenRelay - multi-hop relay of the DEN messages received by a node (tsb and geocast - geo unicast messages
+#            are forwarded by the geonetworking layer)
+#                    - receive(msg): (out) True for the first copy of a DEN, to be delivered to the application.
+#                      The first copy is scheduled to be relayed after a contention delay, shorter for nodes
+#                      farther from the transmitter; hearing another copy in the meantime cancels the relay.
+#                    - wait_due(): wait for the DENs whose contention delay expired; (out) list of DENs to relay
+#                    - seen: duplicate cache, (originator, msg_id) -> expiry time, bounded (oldest entries evicted
+#                      first) and expired (TTL)
+# -------------------------------------------------------------------------------------------------
+class DenRelay:
+
+    def __init__(self, node, coordinates, cache_size=DEN_CACHE_SIZE, ttl=DEN_CACHE_TTL,
+                 max_delay=DEN_RELAY_MAX_DELAY, relay_range=DEN_RELAY_RANGE):
+        self.node = node
+        self.coordinates = coordinates
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.max_delay = max_delay
+        self.relay_range = relay_range
+        self.cond = Condition()
+        self.seen = OrderedDict()
+        self.pending = dict()
+        self.timers = []
+        self.sequence = 0
+        self.counters = {'relayed': 0, 'cancelled': 0, 'duplicates': 0}
+
+    def contention_delay(self, gn):
+        if gn.get('prev_x') is None:
+            return self.max_delay
+        x, y, t = position_read(self.coordinates)
+        distance = math.hypot(x - gn['prev_x'], y - gn['prev_y'])
+        return self.max_delay * max(0.0, 1.0 - distance / self.relay_range)
+
+    def _expire(self, t):
+        while self.seen:
+            key, expiry = next(iter(self.seen.items()))
+            if expiry > t and len(self.seen) < self.cache_size:
+                break
+            self.seen.popitem(last=False)
+
+    def receive(self, msg):
+        msg_id = msg.get('msg_id')
+        if msg_id is None:
+            return True
+        key = (str(msg.get('node')), msg_id)
+        with self.cond:
+            t = now()
+            self._expire(t)
+            if key in self.seen:
+                self.counters['duplicates'] += 1
+                if self.pending.pop(key, None) is not None:
+                    self.counters['cancelled'] += 1
+                return False
+            self.seen[key] = t + self.ttl
+            gn = gn_header(msg)
+            if gn is not None and gn.get('type') in ('tsb', 'geocast') and gn.get('hops', 0) + 1 < gn.get('hop_limit', 1):
+                self.pending[key] = msg
+                self.sequence += 1
+                heapq.heappush(self.timers, (t + self.contention_delay(gn), self.sequence, key))
+                self.cond.notify()
+        return True
+
+    def wait_due(self):
+        with self.cond:
+            while True:
+                t = now()
+                due = []
+                while self.timers and self.timers[0][0] <= t:
+                    deadline, sequence, key = heapq.heappop(self.timers)
+                    msg = self.pending.pop(key, None)
+                    if msg is not None:
+                        due.append(msg)
+                if due:
+                    break
+                self.cond.wait(self.timers[0][0] - t if self.timers else None)
+        msgs_relay = []
+        for msg in due:
+            msg_relay = msg.copy()
+            gn = dict(msg_relay['gn'])
+            gn['hops'] = gn.get('hops', 0) + 1
+            msg_relay['gn'] = gn
+            msgs_relay.append(msg_relay)
+        self.counters['relayed'] += len(msgs_relay)
+        return msgs_relay
+
+
+# ------------------------------------------------------------------------------------------------
+# dcc_interval - CA inter-generation interval adapted to the channel load (reactive DCC)
+#                    - generation_time: interval requested by the user, used when the channel is not congested
+#                    - channel_status: channel load measurements published by multicast_rxd
+# -------------------------------------------------------------------------------------------------
+def dcc_interval(generation_time, channel_status, min_interval=CA_MIN_INTERVAL, max_interval=CA_MAX_INTERVAL):
+    low = min(max(generation_time, min_interval), max_interval)
+    if channel_status is None:
+        return low
+    cbr = channel_busy_ratio(channel_status)
+    for cbr_limit, position in DCC_STATES:
+        if cbr < cbr_limit:
+            return low + position * (max_interval - low)
+    return max_interval
+
+
+# ------------------------------------------------------------------------------------------------
+# rx_max_age - max-age budgets of the received messages (see freshness.py), with the CA budget following DCC:
+#              k inter-generation intervals of a CA service with the nominal interval MAX_AGE['CA']
+#                    - channel_status: channel load measurements published by multicast_rxd
+# -------------------------------------------------------------------------------------------------
+def rx_max_age(channel_status, k=CA_MAX_AGE_INTERVALS):
+    max_age = dict(MAX_AGE)
+    nominal = MAX_AGE['CA']
+    max_age['CA'] = lambda: k * dcc_interval(nominal, channel_status)
+    return max_age
@@ -2,7 +2,7 @@
 # #################################################
 ## ACCESS TO IN-VEIHICLE SENSORS/ATUATORS AND GPS
 #################################################
-import time
+from ITS_clock import sleep
 from in_vehicle_network.car_motor_functions import *
 from in_vehicle_network.location_functions import *
 
@@ -14,12 +14,11 @@ from in_vehicle_network.location_functions import *
 def update_location(node, start_flag, coordinates, obd_2_interface):
 	gps_time = 2
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: update_location - NODE: {}\n'.format(node),'\n')
 
 	while True:
-		time.sleep(gps_time)
+		sleep(gps_time)
 		position_update(coordinates, obd_2_interface)
 #		print('STATUS: New position update - THREAD: update_location - NODE: {}\n'.format(coordinates),'\n')
 	return
@@ -52,8 +51,7 @@ speed_dec = -50
 def movement_control(node, start_flag, coordinates, obd_2_interface, movement_control_txd_queue):
 	TIME_INTERVAL = 5
 	
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: movement_control - NODE: {}\n'.format(node),'\n')
 	
 	direction = car_parked
@@ -98,5 +96,5 @@ def movement_control(node, start_flag, coordinates, obd_2_interface, movement_co
 
 		set_vehicle_info (obd_2_interface, speed, direction, status)
 		position_update(coordinates, obd_2_interface)
-		time.sleep(TIME_INTERVAL)
+		sleep(TIME_INTERVAL)
 	return
@@ -2,7 +2,7 @@
 # #################################################
 ## FUNCTIONS USED IN VEHICLE - (x,y) location
 #################################################
-import time
+from ITS_clock import now
 from in_vehicle_network.car_motor_functions import *
 
 
@@ -34,7 +34,7 @@ def position_update(coordinates, obd_2_interface):
         x=coordinates['x']
         y=coordinates['y'] - dummy_delta_y
     
-    t=time.time()
+    t=now()
     coordinates.update({'x':x, 'y':y, 't':t})
     return
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - virtual clock (ITS_clock.py): wakeup order, virtual waits and threads leaving the simulation
+#################################################
+import threading
+import unittest
+from ITS_clock import VirtualClock
+
+EPOCH = 1000.0
+WALL_TIMEOUT = 5
+
+
+# run targets as threads of a simulation - (out) clock and threads, once the clock is started
+def simulate(targets, until=None):
+	clock = VirtualClock(EPOCH)
+	start_flag = clock.Event()
+	def participant(target):
+		start_flag.wait()
+		target(clock)
+	threads = [threading.Thread(target=participant, args=(target,), daemon=True) for target in targets]
+	for t in threads:
+		t.start()
+	clock.start(start_flag, len(threads), until=until, timeout=WALL_TIMEOUT)
+	return clock, threads
+
+
+class VirtualClockTest(unittest.TestCase):
+
+	def join(self, threads):
+		for t in threads:
+			t.join(WALL_TIMEOUT)
+			self.assertFalse(t.is_alive(), 'simulation stalled')
+
+	def test_wakeup_order(self):
+		log = []
+		lock = threading.Lock()
+		def sleeper(name, delays):
+			def target(clock):
+				for delay in delays:
+					clock.sleep(delay)
+					with lock:
+						log.append((clock.time() - EPOCH, name))
+			return target
+		clock, threads = simulate([sleeper('a', (3, 3)), sleeper('b', (1, 4)), sleeper('c', (2, 0.5))])
+		self.join(threads)
+		self.assertEqual(log, [(1, 'b'), (2, 'c'), (2.5, 'c'), (3, 'a'), (5, 'b'), (6, 'a')])
+		self.assertEqual(clock.events, 6)
+
+	def test_same_deadline_in_registration_order(self):
+		# both wake up at 3: b registered its deadline at 0, before a registered its own at 1
+		log = []
+		def a(clock):
+			clock.sleep(1)
+			clock.sleep(2)
+			log.append('a')
+		def b(clock):
+			clock.sleep(3)
+			log.append('b')
+		for i in range(5):
+			del log[:]
+			clock, threads = simulate([a, b])
+			self.join(threads)
+			self.assertEqual(log, ['b', 'a'])
+
+	def test_finished_thread_is_detached(self):
+		# the first thread ends without blocking again: the clock must not wait for it
+		wakeups = []
+		def quitter(clock):
+			return
+		def sleeper(clock):
+			for i in range(5):
+				clock.sleep(10)
+				wakeups.append(clock.time() - EPOCH)
+		clock, threads = simulate([quitter, sleeper])
+		self.join(threads)
+		self.assertEqual(wakeups, [10, 20, 30, 40, 50])
+
+	def test_failed_thread_is_detached(self):
+		wakeups = []
+		def failing(clock):
+			clock.sleep(1)
+			raise RuntimeError('thread failure')
+		def sleeper(clock):
+			for i in range(3):
+				clock.sleep(2)
+				wakeups.append(clock.time() - EPOCH)
+		excepthook = threading.excepthook
+		threading.excepthook = lambda args: None
+		try:
+			clock, threads = simulate([failing, sleeper])
+			self.join(threads)
+		finally:
+			threading.excepthook = excepthook
+		self.assertEqual(wakeups, [2, 4, 6])
+
+	def test_until(self):
+		def ticker(clock):
+			while True:
+				clock.sleep(1)
+		clock, threads = simulate([ticker], until=EPOCH + 30)
+		self.assertTrue(clock.done.wait(WALL_TIMEOUT))
+		self.assertEqual(clock.time(), EPOCH + 30)
+		self.assertEqual(clock.events, 30)
+
+	def test_condition(self):
+		results = []
+		items = []
+		def consumer(clock):
+			with cond:
+				results.append((cond.wait(5), clock.time() - EPOCH))
+				results.append((cond.wait_for(lambda: len(items) > 0, 100), clock.time() - EPOCH))
+		def producer(clock):
+			clock.sleep(20)
+			with cond:
+				items.append(1)
+				cond.notify()
+		clock = VirtualClock(EPOCH)
+		cond = clock.Condition(threading.Lock())
+		start_flag = clock.Event()
+		threads = [threading.Thread(target=lambda target=target: (start_flag.wait(), target(clock)), daemon=True)
+			for target in (consumer, producer)]
+		for t in threads:
+			t.start()
+		clock.start(start_flag, len(threads), timeout=WALL_TIMEOUT)
+		self.join(threads)
+		# the first wait times out after 5 s of virtual time, the second one is notified at 20 s
+		self.assertEqual(results, [(False, 5), (True, 20)])
+
+
+if __name__ == '__main__':
+	unittest.main()
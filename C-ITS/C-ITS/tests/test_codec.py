@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - wire codecs (codec.py): round-trips of every msg_type and codec detection by the first byte
+# Run from the C-ITS folder: python -m pytest -q tests (or python -m unittest discover tests)
+#################################################
+import json
+import unittest
+from data_link.codec import *
+
+BEACON = {'msg_type': 'BEACON', 'node': '1', 'pos_x': 10, 'pos_y': -20, 'time': '1700000000.5'}
+CA_OBU = {'msg_type': 'CA', 'node': '2', 'node_type': 'OBU', 'msg_id': 7,
+	'info': [{'x': 1, 'y': 2, 't': '3.0', 'route': [(3, 0), (0, 0)]}]}
+CA_RSU = {'msg_type': 'CA', 'node': '9', 'node_type': 'RSU', 'msg_id': 1,
+	'obu_list': [{'obu_id': '2', 'x': 1, 'y': 2, 't': '3.0', 'originating_rsu': '9', 'route': [(1, 1)], 'timer': 12}]}
+DEN = {'msg_type': 'DEN', 'node': '9', 'node_type': 'RSU', 'msg_id': 4,
+	'event': {'node_id': '2', 'route': [(0, 0), (1, 1)], 'estimate': 12.5, 'dest_rsu': 3, 'status': 'ok'}}
+
+
+# routes are sent as lists of points and come back as lists of lists
+def as_json(msg):
+	return json.loads(json.dumps(msg))
+
+
+class CodecRoundTripTest(unittest.TestCase):
+
+	def assertRoundTrip(self, msg, codec):
+		encode, decode = get_codec(codec)
+		self.assertEqual(as_json(decode(encode(msg))), as_json(msg))
+
+	def test_schema_messages(self):
+		for codec in CODECS:
+			for msg in (BEACON, CA_OBU, CA_RSU, DEN):
+				with self.subTest(codec=codec, msg_type=msg['msg_type']):
+					self.assertRoundTrip(msg, codec)
+
+	def test_extras_and_unknown_types(self):
+		# keys outside the schema and values that do not fit their field type are sent as extras
+		msgs = (dict(BEACON, gn={'type': 'tsb', 'hops': 1, 'prev_x': 1.5}),
+			dict(CA_OBU, msg_id=2**40, node_type=None),
+			{'msg_type': 'OTHER', 'a': [1, 2.5, None, True, 'x'], 'b': {'c': -2**70}})
+		for msg in msgs:
+			with self.subTest(msg=msg):
+				self.assertRoundTrip(msg, 'binary')
+
+	def test_binary_is_smaller(self):
+		for msg in (BEACON, CA_OBU, DEN):
+			self.assertLess(len(encode_binary(msg)), len(encode_json(msg)))
+
+	def test_format_detection(self):
+		self.assertEqual(as_json(decode_message(encode_binary(DEN))), as_json(DEN))
+		self.assertEqual(decode_message(encode_json(BEACON)), BEACON)
+		self.assertNotEqual(encode_binary(BEACON)[0], ord('{'))
+
+	def test_malformed(self):
+		for data in (b'', b'{not json', encode_binary(CA_OBU)[:-3], bytes([BINARY_MAGIC, CODEC_VERSION + 1, 1])):
+			with self.subTest(data=data):
+				self.assertRaises(CodecError, decode_message, data)
+
+	def test_malformed_extras(self):
+		# a record flagged with extras whose value is not a dictionary
+		data = bytes([BINARY_MAGIC, CODEC_VERSION, MSG_TYPE_CODES['BEACON']]) + PRESENCE.pack(EXTRAS_BIT) + bytes([TAG_LIST, 0, 0])
+		self.assertRaises(CodecError, decode_message, data)
+		data = bytes([BINARY_MAGIC, CODEC_VERSION, 0, TAG_STR, 0, 1]) + b'x'
+		self.assertRaises(CodecError, decode_message, data)
+		data = bytes([BINARY_MAGIC, CODEC_VERSION, 0, TAG_BIGINT, 0, 1]) + b'x'
+		self.assertRaises(CodecError, decode_message, data)
+		self.assertRaises(CodecError, decode_message, b'[1, 2]')
+
+	def test_too_long(self):
+		for msg in (dict(BEACON, node='x'*(U16_MAX + 1)), dict(BEACON, extra=[0]*(U16_MAX + 1)),
+				dict(CA_OBU, info=[{'route': [(0, 0)]*(U16_MAX + 1)}])):
+			with self.subTest(key=sorted(msg)[-1]):
+				self.assertRaises(CodecError, encode_binary, msg)
+		self.assertRoundTrip(dict(BEACON, node='x'*U16_MAX), 'binary')
+
+	def test_unknown_codec(self):
+		self.assertRaises(ValueError, get_codec, 'xml')
+
+
+if __name__ == '__main__':
+	unittest.main()
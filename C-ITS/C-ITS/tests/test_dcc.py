@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - decentralized congestion control: channel load measurement (dcc.py) and the CA generation
+# interval and max-age budget that follow it (dcc_interval and rx_max_age in services.py)
+#################################################
+import unittest
+from ITS_clock import now as clock_now
+from data_link.dcc import *
+from data_link.freshness import MAX_AGE
+from facilities.services import dcc_interval, rx_max_age, CA_MIN_INTERVAL, CA_MAX_INTERVAL
+
+
+def channel(cbr):
+	return {'cbr': cbr, 'frames_per_sec': 0.0, 'bytes_per_sec': 0.0, 't': clock_now()}
+
+
+class ChannelLoadTest(unittest.TestCase):
+
+	def test_windows(self):
+		status = dict()
+		load = ChannelLoad(status, capacity=1000, window=1.0)
+		start = load.start
+		for i in range(10):
+			load.add(100, start + 0.05*i)
+		self.assertEqual(status['cbr'], 0.0, 'published at the end of the window only')
+		load.add(100, start + 1.0)
+		self.assertEqual(status['frames_per_sec'], 10)
+		self.assertEqual(status['bytes_per_sec'], 1000)
+		# cbr is averaged with the previous window
+		self.assertEqual(status['cbr'], 0.5)
+		load.add(0, start + 2.0)
+		self.assertAlmostEqual(status['cbr'], (0.5 + 0.1)/2)
+		load.add(0, start + 3.0)
+		self.assertAlmostEqual(status['cbr'], 0.15)
+
+	def test_idle_channel(self):
+		status = channel(0.8)
+		self.assertEqual(channel_busy_ratio(status, status['t'] + 1.5, window=1.0), 0.8)
+		self.assertEqual(channel_busy_ratio(status, status['t'] + 2.5, window=1.0), 0.0)
+		self.assertEqual(channel_busy_ratio({}), 0.0)
+
+
+class DccIntervalTest(unittest.TestCase):
+
+	def test_states(self):
+		low = 1.0
+		expected = ((0.0, low), (0.29, low), (0.35, low + 0.25*(CA_MAX_INTERVAL - low)), (0.45, low + 0.5*(CA_MAX_INTERVAL - low)),
+			(0.55, low + 0.75*(CA_MAX_INTERVAL - low)), (0.9, CA_MAX_INTERVAL))
+		for cbr, interval in expected:
+			with self.subTest(cbr=cbr):
+				self.assertAlmostEqual(dcc_interval(low, channel(cbr)), interval)
+
+	def test_bounds(self):
+		self.assertEqual(dcc_interval(0.01, None), CA_MIN_INTERVAL)
+		self.assertEqual(dcc_interval(100, None), CA_MAX_INTERVAL)
+		self.assertEqual(dcc_interval(100, channel(0.0)), CA_MAX_INTERVAL)
+
+	def test_max_age_follows_the_interval(self):
+		status = channel(0.0)
+		max_age = rx_max_age(status, k=2)
+		self.assertAlmostEqual(max_age['CA'](), 2.0)
+		status.update(channel(0.9))
+		self.assertAlmostEqual(max_age['CA'](), 2*CA_MAX_INTERVAL)
+		self.assertEqual(max_age['BEACON'], MAX_AGE['BEACON'])
+
+
+if __name__ == '__main__':
+	unittest.main()
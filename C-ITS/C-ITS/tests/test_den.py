@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - DEN messages (services.py): creation, duplicate cache and relay contention of DenRelay
+#################################################
+import threading
+import unittest
+from ITS_clock import now as clock_now
+from facilities.services import *
+
+WALL_TIMEOUT = 5
+COORDINATES = {'x': 0, 'y': 0, 't': 0}
+
+
+def den(node='9', msg_id=1, hops=0, prev=(50, 0), gn_type='tsb'):
+	gn = {'type': gn_type, 'hops': hops, 'hop_limit': 3}
+	if prev is not None:
+		gn['prev_x'], gn['prev_y'] = prev
+	return {'msg_type': 'DEN', 'node': node, 'msg_id': msg_id, 'event': {}, 'gn': gn}
+
+# wait_due in a thread - (out) DENs to relay, or None if none was due before the timeout
+def wait_due(relay, timeout=WALL_TIMEOUT):
+	due = []
+	thread = threading.Thread(target=lambda: due.append(relay.wait_due()), daemon=True)
+	thread.start()
+	thread.join(timeout)
+	return due[0] if due else None
+
+
+class CreateDenMessageTest(unittest.TestCase):
+
+	def test_event_not_mutated(self):
+		event = {'status': 'crash', 'destination': {'node': 7, 'x': 10, 'y': 20}}
+		den_msg = create_den_message('1', 'RSU', 4, COORDINATES, event)
+		self.assertEqual(event, {'status': 'crash', 'destination': {'node': 7, 'x': 10, 'y': 20}})
+		self.assertEqual(den_msg['event'], {'status': 'crash'})
+		self.assertEqual(den_msg['gn'], {'type': 'unicast', 'dest': '7', 'dest_x': 10, 'dest_y': 20})
+
+	def test_obu(self):
+		area = {'shape': 'circle', 'x': 0, 'y': 0, 'r': 100}
+		den_msg = create_den_message('2', 'OBU', 5, {'x': 3, 'y': 4, 't': 1.5}, {'status': 'crash', 'area': area})
+		self.assertEqual(den_msg, {'msg_type': 'DEN', 'node': '2', 'node_type': 'OBU', 'msg_id': 5, 'pos_x': 3,
+			'pos_y': 4, 'time': 1.5, 'event': {'status': 'crash'}, 'gn': {'type': 'geocast', 'area': area, 'hop_limit': DEN_HOP_LIMIT}})
+
+	def test_tsb(self):
+		den_msg = create_den_message('1', 'RSU', 6, COORDINATES, {'status': 'ok'})
+		self.assertEqual(den_msg['gn'], {'type': 'tsb', 'hop_limit': DEN_HOP_LIMIT})
+		self.assertNotIn('pos_x', den_msg)
+
+
+class DenRelayTest(unittest.TestCase):
+
+	def relay(self, **kwargs):
+		kwargs.setdefault('max_delay', 0.05)
+		kwargs.setdefault('relay_range', 100)
+		return DenRelay('1', COORDINATES, **kwargs)
+
+	def test_duplicates(self):
+		relay = self.relay()
+		self.assertTrue(relay.receive(den()))
+		self.assertFalse(relay.receive(den()))
+		self.assertTrue(relay.receive(den(msg_id=2)))
+		self.assertTrue(relay.receive(den(node='8')))
+		self.assertEqual(relay.counters['duplicates'], 1)
+		# messages without msg_id are always delivered
+		self.assertTrue(relay.receive({'msg_type': 'DEN', 'node': '9'}))
+		self.assertTrue(relay.receive({'msg_type': 'DEN', 'node': '9'}))
+
+	def test_cache_bounded_and_expired(self):
+		relay = self.relay(cache_size=2, ttl=WALL_TIMEOUT)
+		for msg_id in range(3):
+			relay.receive(den(msg_id=msg_id))
+		self.assertEqual(list(relay.seen), [('9', 1), ('9', 2)])
+		self.assertTrue(relay.receive(den(msg_id=0)))
+		relay = self.relay(ttl=0)
+		relay.receive(den())
+		self.assertTrue(relay.receive(den()))
+
+	def test_contention_delay(self):
+		relay = self.relay()
+		# farther from the last transmitter - shorter delay; beyond the range or unknown transmitter - bounds
+		self.assertAlmostEqual(relay.contention_delay({'prev_x': 80, 'prev_y': 0}), 0.01)
+		self.assertAlmostEqual(relay.contention_delay({'prev_x': 20, 'prev_y': 0}), 0.04)
+		self.assertEqual(relay.contention_delay({'prev_x': 0, 'prev_y': 150}), 0)
+		self.assertEqual(relay.contention_delay({}), 0.05)
+
+	def test_relay(self):
+		relay = self.relay()
+		start = clock_now()
+		relay.receive(den(hops=1, prev=(20, 0)))
+		relayed = wait_due(relay)
+		self.assertGreaterEqual(clock_now() - start, 0.04 - 0.005)
+		self.assertEqual(len(relayed), 1)
+		self.assertEqual(relayed[0]['gn']['hops'], 2)
+		self.assertEqual(relay.counters['relayed'], 1)
+
+	def test_relay_order(self):
+		relay = self.relay()
+		relay.receive(den(msg_id=1, prev=(10, 0)))
+		relay.receive(den(msg_id=2, prev=(90, 0)))
+		self.assertEqual([msg['msg_id'] for msg in wait_due(relay)], [2])
+		self.assertEqual([msg['msg_id'] for msg in wait_due(relay)], [1])
+
+	def test_cancelled_by_duplicate(self):
+		relay = self.relay(max_delay=0.2)
+		msg = den(prev=(0, 0))
+		relay.receive(msg)
+		# another node relayed it first
+		relay.receive(den(hops=1, prev=(30, 0)))
+		self.assertEqual(relay.counters['cancelled'], 1)
+		self.assertIsNone(wait_due(relay, 0.4))
+		self.assertEqual(relay.counters['relayed'], 0)
+
+	def test_hop_limit(self):
+		relay = self.relay(max_delay=0)
+		# the relayed copy would reach the hop limit, and geo unicast is forwarded by the geonetworking layer
+		self.assertTrue(relay.receive(den(msg_id=1, hops=2)))
+		self.assertTrue(relay.receive(den(msg_id=2, gn_type='unicast')))
+		self.assertEqual(relay.pending, {})
+		self.assertTrue(relay.receive(den(msg_id=3, hops=1, gn_type='geocast')))
+		self.assertEqual([msg['msg_id'] for msg in wait_due(relay)], [3])
+
+
+if __name__ == '__main__':
+	unittest.main()
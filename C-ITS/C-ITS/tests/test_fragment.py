@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - fragmentation and reassembly (fragment.py): order, duplicates, timeouts and memory bounds
+#################################################
+import random
+import unittest
+from data_link.fragment import *
+
+MSG_SIZE = 64
+
+
+def fragments(size, datagram_id=1, node='1'):
+	frame = bytes(random.Random(size).getrandbits(8) for i in range(size))
+	return frame, fragment_frame(frame, node, datagram_id, MSG_SIZE)
+
+
+class FragmentTest(unittest.TestCase):
+
+	def test_small_frame_is_not_fragmented(self):
+		frame = b'x'*MSG_SIZE
+		self.assertEqual(fragment_frame(frame, '1', 0, MSG_SIZE), [frame])
+		self.assertFalse(is_fragment(frame))
+
+	def test_reassembly_in_any_order(self):
+		frame, datagrams = fragments(1000)
+		self.assertTrue(all(is_fragment(d) and len(d) <= MSG_SIZE for d in datagrams))
+		random.Random(0).shuffle(datagrams)
+		reassembler = Reassembler()
+		results = [reassembler.add(d, 'sender', now=0) for d in datagrams]
+		self.assertEqual(results[-1], frame)
+		self.assertEqual(results[:-1], [None]*(len(datagrams) - 1))
+		self.assertEqual(reassembler.counters['complete'], 1)
+		self.assertEqual(reassembler.buffered, 0)
+
+	def test_duplicates(self):
+		frame, datagrams = fragments(200)
+		reassembler = Reassembler()
+		reassembler.add(datagrams[0], 'sender', now=0)
+		self.assertIsNone(reassembler.add(datagrams[0], 'sender', now=0))
+		self.assertEqual(reassembler.counters['duplicated'], 1)
+		for d in datagrams[1:]:
+			result = reassembler.add(d, 'sender', now=0)
+		self.assertEqual(result, frame)
+
+	def test_senders_are_kept_apart(self):
+		frame, datagrams = fragments(200)
+		reassembler = Reassembler()
+		for d in datagrams[:-1]:
+			reassembler.add(d, 'a', now=0)
+			reassembler.add(d, 'b', now=0)
+		self.assertEqual(reassembler.add(datagrams[-1], 'a', now=0), frame)
+		self.assertEqual(len(reassembler.pending), 1)
+
+	def test_timeout_restarted_by_each_fragment(self):
+		frame, datagrams = fragments(300)
+		reassembler = Reassembler(timeout=1.0)
+		for t, d in enumerate(datagrams[:-1]):
+			reassembler.add(d, 'sender', now=0.9*t)
+		self.assertEqual(reassembler.add(datagrams[-1], 'sender', now=0.9*(len(datagrams) - 1)), frame)
+
+	def test_timeout(self):
+		frame, datagrams = fragments(300)
+		reassembler = Reassembler(timeout=1.0)
+		reassembler.add(datagrams[0], 'sender', now=0)
+		reassembler.expire(now=1.5)
+		self.assertEqual(reassembler.counters['expired'], 1)
+		self.assertEqual(reassembler.buffered, 0)
+		for d in datagrams[1:]:
+			self.assertIsNone(reassembler.add(d, 'sender', now=1.5))
+
+	def test_datagram_limit(self):
+		reassembler = Reassembler(max_datagrams=2)
+		for datagram_id in range(3):
+			frame, datagrams = fragments(200, datagram_id)
+			reassembler.add(datagrams[0], 'sender', now=0)
+		self.assertEqual(len(reassembler.pending), 2)
+		self.assertEqual(reassembler.counters['evicted'], 1)
+		# the least recently updated datagram is evicted first
+		self.assertNotIn(('sender', b'1' + b'\x00'*7, 0), reassembler.pending)
+
+	def test_memory_limit(self):
+		reassembler = Reassembler(max_bytes=100)
+		frame, datagrams = fragments(1000)
+		for d in datagrams:
+			self.assertIsNone(reassembler.add(d, 'sender', now=0))
+		self.assertLessEqual(reassembler.buffered, 100)
+		self.assertGreater(reassembler.counters['evicted'], 0)
+
+	def test_long_node_ids(self):
+		# node ids sharing their first 8 bytes must not be reassembled together
+		frame_a, datagrams_a = fragments(200, node='vehicle-000000001')
+		frame_b, datagrams_b = fragments(300, node='vehicle-000000002')
+		reassembler = Reassembler()
+		for d in datagrams_a[:-1] + datagrams_b[:-1]:
+			self.assertIsNone(reassembler.add(d, 'sender', now=0))
+		self.assertEqual(reassembler.counters['invalid'], 0)
+		self.assertEqual(reassembler.add(datagrams_a[-1], 'sender', now=0), frame_a)
+		self.assertEqual(reassembler.add(datagrams_b[-1], 'sender', now=0), frame_b)
+
+	def test_invalid(self):
+		frame, datagrams = fragments(200)
+		reassembler = Reassembler()
+		bad_version = bytes([datagrams[0][0], FRAGMENT_VERSION + 1]) + datagrams[0][2:]
+		self.assertIsNone(reassembler.add(bad_version, 'sender', now=0))
+		other_count = fragment_frame(frame + b'x'*MSG_SIZE, '1', 1, MSG_SIZE)
+		reassembler.add(datagrams[0], 'sender', now=0)
+		self.assertIsNone(reassembler.add(other_count[1], 'sender', now=0))
+		self.assertEqual(reassembler.counters['invalid'], 2)
+		self.assertEqual(reassembler.pending, {})
+
+	def test_too_large(self):
+		self.assertRaises(ValueError, fragment_frame, b'x'*(MSG_SIZE*(MAX_FRAGMENTS + 1)), '1', 0, MSG_SIZE)
+
+
+if __name__ == '__main__':
+	unittest.main()
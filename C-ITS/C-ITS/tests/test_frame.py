@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - frame header and lazy body decoding (frame.py)
+#################################################
+import pickle
+import unittest
+from data_link.frame import *
+
+BEACON = {'msg_type': 'BEACON', 'node': '1', 'pos_x': 10, 'pos_y': -20, 'time': '1700000000.5'}
+DEN = {'msg_type': 'DEN', 'node': '9', 'node_type': 'RSU', 'msg_id': 4, 'event': {'status': 'ok'},
+	'gn': {'type': 'tsb', 'hops': 1}}
+
+
+class FrameHeaderTest(unittest.TestCase):
+
+	def test_peek(self):
+		for codec in CODECS:
+			header = peek_header(encode_frame(BEACON, codec))
+			self.assertEqual((header['codec'], header['msg_type'], header['node'], header['pos_x'], header['pos_y']),
+				(codec, 'BEACON', '1', 10, -20))
+			self.assertIsNone(header['msg_id'])
+			self.assertFalse(header['flags'] & FLAG_GN)
+
+	def test_coordinates(self):
+		header = peek_header(encode_frame(DEN, coordinates={'x': 3.7, 'y': -4.2}))
+		self.assertEqual((header['pos_x'], header['pos_y'], header['msg_id']), (3, -4, 4))
+		self.assertFalse(header['flags'] & FLAG_POS_XY)
+		self.assertTrue(header['flags'] & FLAG_GN)
+
+	def test_legacy_datagram(self):
+		self.assertIsNone(peek_header(encode_json(BEACON)))
+		self.assertEqual(decode_frame(encode_json(BEACON)), BEACON)
+
+	def test_long_node_ids(self):
+		for node in ('vehicle-000000001', 'vehicle-000000002', 12, 'été-1234'):
+			header = peek_header(encode_frame(dict(BEACON, node=node)))
+			self.assertIsNone(header['node'])
+			self.assertEqual(header['node_digest'], node_digest(node))
+			self.assertFalse(drop_own_frames(node, header))
+		header = peek_header(encode_frame(dict(BEACON, node='vehicle-000000001')))
+		self.assertTrue(drop_own_frames('vehicle-000000002', header))
+		self.assertFalse(drop_own_frames('1', peek_header(encode_frame(BEACON))))
+		self.assertTrue(drop_own_frames('2', peek_header(encode_frame(BEACON))))
+
+
+class LazyMessageTest(unittest.TestCase):
+
+	def test_header_fields_do_not_decode(self):
+		msg = decode_frame(encode_frame(BEACON))
+		self.assertEqual((msg['msg_type'], msg['node'], msg.get('pos_x'), msg['pos_y']), ('BEACON', '1', 10, -20))
+		self.assertIn('node', msg)
+		self.assertIsNone(gn_header(msg))
+		self.assertFalse(msg.decoded())
+		self.assertEqual(msg['time'], BEACON['time'])
+		self.assertTrue(msg.decoded())
+
+	def test_mapping(self):
+		msg = decode_frame(encode_frame(DEN))
+		self.assertEqual(gn_header(msg), DEN['gn'])
+		self.assertEqual(msg, DEN)
+		self.assertEqual(dict(msg), DEN)
+		self.assertEqual(sorted(msg), sorted(DEN))
+		msg['hops'] = 2
+		del msg['gn']
+		expected = dict(DEN, hops=2)
+		del expected['gn']
+		self.assertEqual(msg.copy(), expected)
+		self.assertIs(type(msg.copy()), dict)
+		self.assertIs(type(pickle.loads(pickle.dumps(msg))), dict)
+		self.assertEqual(encode_json(msg), encode_json(msg.copy()))
+
+	def test_frame_bytes(self):
+		# an undecoded message is forwarded as received, a decoded one is encoded again
+		data = encode_frame(dict(DEN, node='roadside-unit-1'))
+		msg = decode_frame(data)
+		self.assertEqual(frame_bytes(msg), data)
+		msg['msg_id'] = 5
+		self.assertEqual(decode_frame(frame_bytes(msg))['msg_id'], 5)
+
+	def test_station_key(self):
+		self.assertEqual(station_key(decode_frame(encode_frame(BEACON))), ('BEACON', '1'))
+		self.assertIsNone(station_key(DEN))
+
+
+if __name__ == '__main__':
+	unittest.main()
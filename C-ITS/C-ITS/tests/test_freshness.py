@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - max-age checks of the received messages (freshness.py)
+#################################################
+import unittest
+from data_link.frame import encode_frame, decode_frame
+from data_link.freshness import *
+
+
+def received(msg_type, rx_time):
+	return stamp(decode_frame(encode_frame({'msg_type': msg_type, 'node': '1'})), rx_time)
+
+
+class FreshnessFilterTest(unittest.TestCase):
+
+	def test_age(self):
+		msg = received('CA', 100.0)
+		self.assertEqual(message_age(msg, 100.5), 0.5)
+		self.assertIsNone(message_age({'msg_type': 'CA'}, 100.5))
+
+	def test_budget_per_msg_type(self):
+		stale_stats = dict()
+		freshness = FreshnessFilter('stage', stale_stats, {'CA': 1.0, 'BEACON': 5.0})
+		msgs = [received('CA', 99.5), received('CA', 98.0), received('BEACON', 98.0), received('DEN', 0.0), {'msg_type': 'CA'}]
+		# DEN messages have no budget and unstamped messages never expire
+		self.assertEqual(freshness.filter(msgs, now=100.0), [msgs[0], msgs[2], msgs[3], msgs[4]])
+		self.assertEqual(stale_stats, {'stage': {'CA': 1}})
+		self.assertFalse(freshness.fresh(received('BEACON', 90.0), now=100.0))
+		self.assertEqual(stale_stats['stage'], {'CA': 1, 'BEACON': 1})
+
+	def test_budget_function(self):
+		budget = [1.0]
+		freshness = FreshnessFilter('stage', max_age={'CA': lambda: budget[0]})
+		msg = received('CA', 98.0)
+		self.assertFalse(freshness.fresh(msg, now=100.0))
+		budget[0] = 3.0
+		self.assertTrue(freshness.fresh(msg, now=100.0))
+		self.assertEqual(freshness.counters, {'CA': 1})
+
+	def test_header_fields_do_not_decode(self):
+		msg = received('CA', 0.0)
+		FreshnessFilter('stage').fresh(msg, now=10.0)
+		self.assertFalse(msg.decoded())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - geographic unicast (geo.py): greedy forwarding, perimeter recovery around voids, unreachable
+# destinations and the cache of greedy decisions on the loc_table; expiry of the loc_table entries
+#################################################
+import math
+import threading
+import unittest
+from transport_network.geo import *
+from transport_network.spatial import LocTable
+
+TX_RANGE = 100
+
+# chain - every hop is greedy
+CHAIN = {'1': (0, 0), '2': (80, 0), '3': (160, 0), '4': (240, 60), '5': (320, 0), '9': (400, 0)}
+# void - '2' is closer to '9' than '1' but has no neighbour closer than itself: the message goes around
+# the void through '3', '4', '5' and '6'
+VOID = {'1': (0, 0), '2': (60, 0), '3': (60, 80), '4': (140, 120), '5': (220, 100), '6': (290, 50), '9': (330, 0)}
+# unreachable - no node is within range of '9'
+UNREACHABLE = {'1': (0, 0), '2': (60, 0), '3': (60, 80), '9': (400, 0)}
+# face change - links given explicitly (obstacles between the other nodes): the line from '1' to '9' leaves
+# the face '1', '2', '3', '4', '5' through the edge '3'-'4', where the walk must go on in the outer face
+FACE = {'1': (0, 0), '2': (-150, 60), '3': (10, 150), '4': (10, -150), '5': (-150, -60), '6': (150, -200),
+	'9': (300, 0)}
+FACE_LINKS = [('1', '2'), ('2', '3'), ('3', '4'), ('4', '5'), ('5', '1'), ('4', '6'), ('6', '9')]
+
+
+def loc_tables(positions, links=None):
+	tables = dict()
+	for node, (x, y) in positions.items():
+		table = LocTable()
+		for neighbour, (vx, vy) in positions.items():
+			if links is None:
+				linked = neighbour != node and math.hypot(vx - x, vy - y) <= TX_RANGE
+			else:
+				linked = (node, neighbour) in links or (neighbour, node) in links
+			if linked:
+				table[neighbour] = {'node': neighbour, 'pos_x': vx, 'pos_y': vy, 'timeout': None}
+		tables[node] = table
+	return tables
+
+def node_info(positions, node):
+	x, y = positions[node]
+	return update_node_info(node, x, y, 0)
+
+# forward a geo unicast message hop by hop, as route_txd and route_rxd do - (out) nodes visited, modes used
+def route(positions, src, dest, tables=None):
+	tables = loc_tables(positions) if tables is None else tables
+	gn = {'type': 'unicast', 'dest': dest, 'dest_x': positions[dest][0], 'dest_y': positions[dest][1]}
+	node, path, modes = src, [src], []
+	while node != dest:
+		x, y = positions[node]
+		next_hop = route_unicast(node, gn, {'x': x, 'y': y, 't': 0}, tables[node])
+		modes.append(gn.get('mode', 'greedy'))
+		if not next_hop:
+			break
+		assert next_hop in tables[node], 'next hop is not a neighbour'
+		gn = dict(gn, hops=gn['hops'] + 1)
+		node = next_hop
+		path.append(node)
+	return path, modes
+
+
+class GreedyTest(unittest.TestCase):
+
+	def test_neighbour_destination(self):
+		tables = loc_tables(CHAIN)
+		self.assertEqual(find_next_hop(node_info(CHAIN, '5'), tables['5'], '9', {}), '9')
+
+	def test_no_destination_position(self):
+		tables = loc_tables(CHAIN)
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), tables['1'], '9', {}), 0)
+
+	def test_chain(self):
+		path, modes = route(CHAIN, '1', '9')
+		self.assertEqual(path, ['1', '2', '3', '4', '5', '9'])
+		self.assertEqual(set(modes), {'greedy'})
+
+
+class PerimeterTest(unittest.TestCase):
+
+	def test_planar_neighbours(self):
+		# 'c' lies inside the circle on the edge a-b: the Gabriel graph of 'a' drops b
+		positions = {'a': (0, 0), 'b': (80, 0), 'c': (40, 10)}
+		tables = loc_tables(positions)
+		planar = [neighbour for neighbour, x, y in planar_neighbours(node_info(positions, 'a'), tables['a'])]
+		self.assertEqual(planar, ['c'])
+
+	def test_right_hand_neighbour(self):
+		positions = {'a': (0, 0), 'n': (0, 50), 'w': (-50, 0), 's': (0, -50)}
+		tables = loc_tables(positions)
+		info = node_info(positions, 'a')
+		# counterclockwise from east: north first, then west, then south
+		self.assertEqual(right_hand_neighbour(info, tables['a'], 0), 'n')
+		self.assertEqual(right_hand_neighbour(info, tables['a'], math.pi/2), 'w')
+		self.assertEqual(right_hand_neighbour(info, tables['a'], -math.pi/2), 'n')
+
+	def test_void_recovery(self):
+		path, modes = route(VOID, '1', '9')
+		self.assertEqual(path[-1], '9')
+		self.assertEqual(path, ['1', '2', '3', '4', '5', '6', '9'])
+		# greedy until the local maximum at '2', perimeter around the void, greedy again once closer than '2'
+		self.assertEqual(modes[0], 'greedy')
+		self.assertEqual(modes[1], 'perimeter')
+		self.assertEqual(modes[-1], 'greedy')
+
+	def test_perimeter_state(self):
+		tables = loc_tables(VOID)
+		gn = {'dest_x': VOID['9'][0], 'dest_y': VOID['9'][1]}
+		next_hop = find_next_hop(node_info(VOID, '2'), tables['2'], '9', gn)
+		self.assertEqual(gn['mode'], 'perimeter')
+		self.assertEqual((gn['lp_x'], gn['lp_y']), VOID['2'])
+		self.assertEqual(gn['e0'], ['2', next_hop])
+
+	def test_face_change(self):
+		path, modes = route(FACE, '1', '9', loc_tables(FACE, FACE_LINKS))
+		# '3'-'4' crosses the line: the walk turns back at '3' and goes around the outer face
+		self.assertEqual(path, ['1', '2', '3', '2', '1', '5', '4', '6', '9'])
+
+	def test_face_change_state(self):
+		tables = loc_tables(FACE, FACE_LINKS)
+		gn = {'dest_x': 300, 'dest_y': 0, 'mode': 'perimeter', 'lp_x': 0, 'lp_y': 0, 'lf_x': 0, 'lf_y': 0,
+			'e0': ['1', '2'], 'prev_x': -150, 'prev_y': 60}
+		self.assertEqual(find_next_hop(node_info(FACE, '3'), tables['3'], '9', gn), '2')
+		self.assertEqual((gn['lf_x'], gn['lf_y']), (10, 0))
+		self.assertEqual(gn['e0'], ['3', '2'])
+		# the same crossing is not closer than lf: the edge is taken on a later visit
+		gn.update(prev_x=-150, prev_y=60)
+		self.assertEqual(find_next_hop(node_info(FACE, '3'), tables['3'], '9', gn), '4')
+
+	def test_unreachable(self):
+		path, modes = route(UNREACHABLE, '1', '9')
+		self.assertNotEqual(path[-1], '9')
+		# the face around the void is walked once and the message is dropped before the hop limit
+		self.assertLess(len(path), GN_HOP_LIMIT)
+		self.assertEqual(modes[-1], 'perimeter')
+
+	def test_hop_limit(self):
+		tables = loc_tables(CHAIN)
+		gn = {'type': 'unicast', 'dest': '9', 'dest_x': 400, 'dest_y': 0, 'hops': GN_HOP_LIMIT}
+		self.assertEqual(route_unicast('1', gn, {'x': 0, 'y': 0, 't': 0}, tables['1']), 0)
+		self.assertEqual(gn['next_hop'], 0)
+
+
+class NextHopCacheTest(unittest.TestCase):
+
+	def test_cached_decision(self):
+		tables = loc_tables(CHAIN)
+		table = tables['1']
+		gn = {'dest_x': 400, 'dest_y': 0}
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '2')
+		self.assertEqual(list(table.next_hops.values()), ['2'])
+		# a cached decision is returned without searching the table again
+		table.nearest = None
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '2')
+
+	def test_cache_invalidated_by_new_neighbour(self):
+		tables = loc_tables(CHAIN)
+		table = tables['1']
+		gn = {'dest_x': 400, 'dest_y': 0}
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '2')
+		table['7'] = {'node': '7', 'pos_x': 95, 'pos_y': 0, 'timeout': None}
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '7')
+		del table['7']
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '2')
+
+	def test_cache_invalidated_by_moving_neighbour(self):
+		tables = loc_tables(CHAIN)
+		table = tables['1']
+		gn = {'dest_x': 400, 'dest_y': 0}
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '2')
+		# '2' moves away from the destination, behind '1': greedy fails and perimeter mode starts
+		table['2'] = {'node': '2', 'pos_x': -80, 'pos_y': 0, 'timeout': None}
+		gn_moved = dict(gn)
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', gn_moved), '2')
+		self.assertEqual(gn_moved['mode'], 'perimeter')
+
+	def test_cache_invalidated_by_move_within_cell(self):
+		tables = loc_tables(CHAIN)
+		table = tables['1']
+		table['7'] = {'node': '7', 'pos_x': 60, 'pos_y': 10, 'timeout': None}
+		gn = {'dest_x': 400, 'dest_y': 0}
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '2')
+		# '7' moves ahead of '2' without leaving its cell
+		table['7'] = {'node': '7', 'pos_x': 99, 'pos_y': 10, 'timeout': None}
+		self.assertEqual(table.cell_of(60, 10), table.cell_of(99, 10))
+		self.assertEqual(find_next_hop(node_info(CHAIN, '1'), table, '9', dict(gn)), '7')
+
+
+
+# CountingLock - lock that counts its acquisitions
+class CountingLock:
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.acquisitions = 0
+
+	def acquire(self):
+		self.lock.acquire()
+		self.acquisitions += 1
+
+	def release(self):
+		self.lock.release()
+
+	def __enter__(self):
+		self.acquire()
+
+	def __exit__(self, *args):
+		self.release()
+
+
+class LocTableEntryTest(unittest.TestCase):
+
+	def beacon(self, node, x=0, y=0):
+		return create_beacon(node, x, y, 0)
+
+	def test_update(self):
+		table, lock = LocTable(), CountingLock()
+		self.assertEqual(update_loc_table_entry('1', table, self.beacon('1'), lock, 10), -1)
+		self.assertEqual(update_loc_table_entry('1', table, self.beacon('2', 30, 40), lock, 10), '1')
+		self.assertEqual(list(table), ['2'])
+		self.assertEqual(table.within(30, 40, 1), [(0, '2')])
+		self.assertEqual(table.next_expiry(), table['2']['timeout'])
+
+	def test_expiry(self):
+		table, lock = LocTable(), CountingLock()
+		update_loc_table_entry('1', table, self.beacon('2'), lock, -1)
+		update_loc_table_entry('1', table, self.beacon('3'), lock, -1)
+		update_loc_table_entry('1', table, self.beacon('4'), lock, 60)
+		lock.acquisitions = 0
+		# every expired entry is removed under one lock acquisition
+		delete_loc_table_entry(table, '1', lock)
+		self.assertEqual(list(table), ['4'])
+		self.assertEqual(lock.acquisitions, 1)
+		# nothing expired: the lock is not taken
+		delete_loc_table_entry(table, '1', lock)
+		self.assertEqual(lock.acquisitions, 1)
+		self.assertEqual(delete_loc_table_entry(LocTable(), '1', lock), None)
+		self.assertEqual(lock.acquisitions, 1)
+
+	def test_refreshed_entry_kept(self):
+		table, lock = LocTable(), CountingLock()
+		update_loc_table_entry('1', table, self.beacon('2'), lock, -1)
+		update_loc_table_entry('1', table, self.beacon('2'), lock, 60)
+		delete_loc_table_entry(table, '1', lock)
+		self.assertEqual(list(table), ['2'])
+
+	def test_plain_table_is_scanned(self):
+		table, lock = dict(), CountingLock()
+		update_loc_table_entry('1', table, self.beacon('2'), lock, -1)
+		update_loc_table_entry('1', table, self.beacon('3'), lock, 60)
+		delete_loc_table_entry(table, '1', lock)
+		self.assertEqual(list(table), ['3'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - geocast (geo.py, geonetworking.py): region of interest, line forwarding towards the area and
+# delivery, forwarding or drop on reception
+#################################################
+import unittest
+from Queue import Queue
+from transport_network.geo import *
+from transport_network.spatial import LocTable
+from transport_network.geonetworking import route_txd, route_rxd
+
+CIRCLE = circle_area(300, 0, 50)
+RECT = rect_area(400, 100, 200, -100)
+
+
+def loc_table(positions):
+	return LocTable({node: {'node': node, 'pos_x': x, 'pos_y': y, 'timeout': None} for node, (x, y) in positions.items()})
+
+def node_info(x, y):
+	return update_node_info('1', x, y, 0)
+
+def coordinates(x, y):
+	return {'x': x, 'y': y, 't': 0}
+
+
+class RoiTest(unittest.TestCase):
+
+	def test_areas(self):
+		self.assertEqual(RECT, {'shape': 'rect', 'x1': 200, 'y1': -100, 'x2': 400, 'y2': 100})
+		self.assertEqual(area_center(CIRCLE), (300, 0))
+		self.assertEqual(area_center(RECT), (300, 0))
+		self.assertEqual(area_distance(CIRCLE, 200, 0), 50)
+		self.assertEqual(area_distance(CIRCLE, 320, 0), 0)
+		self.assertEqual(area_distance(RECT, 100, 0), 100)
+		self.assertEqual(area_distance(RECT, 100, 200), math.hypot(100, 100))
+		self.assertEqual(area_distance(RECT, 300, 50), 0)
+
+	def test_check_roi(self):
+		self.assertTrue(check_roi(node_info(300, 40), None, CIRCLE))
+		self.assertFalse(check_roi(node_info(300, 60), None, CIRCLE))
+		# pos takes the place of the node position
+		self.assertTrue(check_roi(node_info(0, 0), (400, 100), RECT))
+		self.assertFalse(check_roi(node_info(300, 0), (401, 100), RECT))
+		self.assertTrue(check_roi(node_info(0, 0), None, None))
+
+
+class GeocastNextHopTest(unittest.TestCase):
+
+	def test_inside_area(self):
+		# a node inside the area broadcasts, even with no neighbour
+		self.assertEqual(geocast_next_hop(node_info(300, 0), loc_table({}), CIRCLE), GN_BROADCAST)
+
+	def test_neighbour_inside_area(self):
+		table = loc_table({'2': (260, 0), '3': (100, 50)})
+		self.assertEqual(geocast_next_hop(node_info(180, 0), table, CIRCLE), GN_BROADCAST)
+		table = loc_table({'2': (210, 90)})
+		self.assertEqual(geocast_next_hop(node_info(150, 90), table, RECT), GN_BROADCAST)
+
+	def test_line_forwarding(self):
+		table = loc_table({'2': (80, 0), '3': (-80, 0)})
+		self.assertEqual(geocast_next_hop(node_info(0, 0), table, CIRCLE), '2')
+		self.assertEqual(geocast_next_hop(node_info(0, 0), table, RECT), '2')
+
+	def test_no_neighbour_towards_area(self):
+		table = loc_table({'3': (-80, 0)})
+		self.assertEqual(geocast_next_hop(node_info(0, 0), table, CIRCLE), 0)
+		self.assertEqual(geocast_next_hop(node_info(0, 0), loc_table({}), CIRCLE), 0)
+
+	def test_route_geocast(self):
+		table = loc_table({'2': (80, 0)})
+		gn = {'type': 'geocast', 'area': CIRCLE}
+		self.assertEqual(route_geocast('1', gn, coordinates(0, 0), table), '2')
+		self.assertEqual((gn['src'], gn['hops'], gn['hop_limit'], gn['next_hop']), ('1', 0, GN_HOP_LIMIT, '2'))
+		self.assertEqual((gn['prev_x'], gn['prev_y']), (0, 0))
+		gn = {'type': 'geocast', 'area': CIRCLE, 'hops': GN_HOP_LIMIT}
+		self.assertEqual(route_geocast('1', gn, coordinates(300, 0), table), 0)
+		self.assertEqual(gn['next_hop'], 0)
+
+
+class GeocastRoutingTest(unittest.TestCase):
+
+	def test_txd_suppressed_without_next_hop(self):
+		msgs = [{'msg_type': 'DEN', 'gn': {'type': 'geocast', 'area': CIRCLE}},
+			{'msg_type': 'DEN', 'gn': {'type': 'geocast', 'area': rect_area(-100, -10, -50, 10)}}]
+		sent = route_txd('1', msgs, coordinates(0, 0), loc_table({'2': (80, 0)}))
+		self.assertEqual(len(sent), 1)
+		self.assertEqual(sent[0]['gn']['next_hop'], '2')
+
+	def test_rxd_inside_area(self):
+		txd_queue = Queue()
+		gn = {'type': 'geocast', 'area': CIRCLE, 'hops': 1, 'next_hop': GN_BROADCAST}
+		self.assertTrue(route_rxd('3', {'msg_type': 'DEN', 'gn': gn}, gn, coordinates(290, 10), loc_table({}), txd_queue))
+		self.assertTrue(txd_queue.empty())
+
+	def test_rxd_forward_towards_area(self):
+		txd_queue = Queue()
+		gn = {'type': 'geocast', 'area': CIRCLE, 'hops': 1, 'hop_limit': GN_HOP_LIMIT, 'next_hop': '2'}
+		msg = {'msg_type': 'DEN', 'gn': gn}
+		table = loc_table({'4': (200, 0)})
+		self.assertFalse(route_rxd('2', msg, gn, coordinates(120, 0), table, txd_queue))
+		msg_fwd = txd_queue.get_nowait()
+		self.assertEqual((msg_fwd['gn']['hops'], msg_fwd['gn']['next_hop']), (2, '4'))
+		# the received message is left as it was
+		self.assertEqual((gn['hops'], gn['next_hop']), (1, '2'))
+
+	def test_rxd_drop(self):
+		txd_queue = Queue()
+		gn = {'type': 'geocast', 'area': CIRCLE, 'hops': 1, 'next_hop': '2'}
+		table = loc_table({'4': (200, 0)})
+		# not the next hop
+		self.assertFalse(route_rxd('5', {'msg_type': 'DEN', 'gn': gn}, gn, coordinates(120, 0), table, txd_queue))
+		# next hop, but no neighbour closer to the area
+		self.assertFalse(route_rxd('2', {'msg_type': 'DEN', 'gn': gn}, gn, coordinates(120, 0), loc_table({}), txd_queue))
+		self.assertTrue(txd_queue.empty())
+
+
+if __name__ == '__main__':
+	unittest.main()
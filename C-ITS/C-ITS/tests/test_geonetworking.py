@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - geonetworking layer (geonetworking.py): reception never blocks, neither the event loop of the asyncio
+# runtime on the queues read by the facilities threads nor the fused pipeline on a full transmission queue
+#################################################
+import asyncio
+import threading
+import unittest
+from Queue import Queue, CoalescingQueue, LoopQueue
+from data_link.frame import station_key
+from transport_network.spatial import LocTable
+from transport_network.geonetworking import geonetwork_rxd_async, geonetwork_on_receive
+
+WALL_TIMEOUT = 5
+DEN = {'msg_type': 'DEN', 'node': '9', 'msg_id': 1}
+
+
+class GeonetworkRxdAsyncTest(unittest.TestCase):
+
+	def test_full_den_queue_does_not_stall_the_loop(self):
+		# nobody reads the DEN queue (a stalled den_service_rxd thread): the loop must keep running
+		den_queue = Queue(2, 'block')
+		ca_queue = CoalescingQueue(2, 'drop_oldest', station_key)
+		ticks = []
+		done = threading.Event()
+		async def main():
+			loop = asyncio.get_running_loop()
+			rxd_queue = LoopQueue(loop, 16, 'block', station_key)
+			task = loop.create_task(geonetwork_rxd_async('1', rxd_queue, ca_queue, den_queue))
+			for msg_id in range(10):
+				await rxd_queue.put_async(dict(DEN, msg_id=msg_id))
+				await asyncio.sleep(0)
+				ticks.append(msg_id)
+			while not rxd_queue.empty():
+				await asyncio.sleep(0)
+			task.cancel()
+			done.set()
+		thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True)
+		thread.start()
+		self.assertTrue(done.wait(WALL_TIMEOUT), 'event loop stalled on a full queue')
+		thread.join(WALL_TIMEOUT)
+		self.assertEqual(ticks, list(range(10)))
+		self.assertEqual([msg['msg_id'] for msg in den_queue.get_many()], [0, 1])
+		self.assertEqual(den_queue.dropped, 8)
+
+
+class FusedForwardingTest(unittest.TestCase):
+
+	def test_full_tx_queue_does_not_block_reception(self):
+		# node '2' is the next hop of geo unicast messages for '9': it forwards them without waiting for
+		# a full multicast_txd_queue, and keeps delivering the messages addressed to itself
+		table = LocTable({'9': {'node': '9', 'pos_x': 150, 'pos_y': 0, 'timeout': None}})
+		txd_queue = Queue(1, 'block')
+		delivered = []
+		on_receive = geonetwork_on_receive('2', delivered.append, delivered.append, {'x': 80, 'y': 0, 't': 0}, table, txd_queue)
+		def receive():
+			for msg_id in range(3):
+				on_receive(dict(DEN, msg_id=msg_id, gn={'type': 'unicast', 'dest': '9', 'dest_x': 150, 'dest_y': 0, 'next_hop': '2'}))
+			on_receive(dict(DEN, msg_id=3, gn={'type': 'unicast', 'dest': '2', 'dest_x': 80, 'dest_y': 0}))
+		thread = threading.Thread(target=receive, daemon=True)
+		thread.start()
+		thread.join(WALL_TIMEOUT)
+		self.assertFalse(thread.is_alive(), 'reception blocked on a full queue')
+		forwarded = txd_queue.get_many()
+		self.assertEqual([(msg['msg_id'], msg['gn']['next_hop'], msg['gn']['hops']) for msg in forwarded], [(0, '9', 1)])
+		self.assertEqual(txd_queue.dropped, 2)
+		self.assertEqual([msg['msg_id'] for msg in delivered], [3])
+
+
+if __name__ == '__main__':
+	unittest.main()
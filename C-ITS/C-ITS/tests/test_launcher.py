@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - scenario launcher (ITS_launcher.py): scenario nodes, their input arguments and the sharding over
+# the worker processes
+#################################################
+import unittest
+from ITS_launcher import *
+
+SCENARIO = {'defaults': {'velocity': 10, 'ca_interval': 1},
+	'nodes': [{'node': 1, 'type': 'RSU', 'x': 0, 'y': 0}, {'node': 2, 'type': 'OBU', 'x': 3, 'y': 4, 'route': 'C1', 'ca_interval': 0.5}],
+	'fleet': {'count': 20, 'type': 'OBU', 'area': [0, 0, 100, 50], 'route': 'C2', 'seed': 7}}
+
+
+class ShardTest(unittest.TestCase):
+
+	def test_balanced_and_contiguous(self):
+		nodes = list(range(10))
+		for workers in range(1, 12):
+			with self.subTest(workers=workers):
+				shards = shard(nodes, workers)
+				self.assertEqual(len(shards), min(workers, len(nodes)))
+				self.assertEqual([node for s in shards for node in s], nodes)
+				sizes = [len(s) for s in shards]
+				self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+	def test_degenerate(self):
+		self.assertEqual(shard([1, 2], 0), [[1, 2]])
+		self.assertEqual(shard([], 4), [[]])
+
+
+class ScenarioTest(unittest.TestCase):
+
+	def test_nodes(self):
+		nodes = scenario_nodes(SCENARIO)
+		self.assertEqual([node['node'] for node in nodes], list(range(1, 23)))
+		self.assertEqual(nodes[1]['ca_interval'], 0.5)
+		self.assertEqual(nodes[0]['runtime'], SCENARIO_DEFAULTS['runtime'])
+		fleet = nodes[2:]
+		self.assertTrue(all(0 <= node['x'] <= 100 and 0 <= node['y'] <= 50 and node['route'] == 'C2' for node in fleet))
+		self.assertTrue(all(node['velocity'] == 10 and node['ca_interval'] == 1 for node in fleet))
+		# the fleet is reproducible for a given seed
+		self.assertEqual(scenario_nodes(SCENARIO), nodes)
+
+	def test_node_argv(self):
+		parser = create_parser()
+		rsu, obu = [parser.parse_args(node_argv(node)) for node in scenario_nodes(SCENARIO)[:2]]
+		self.assertTrue(rsu.RSU and not rsu.OBU and rsu.headless)
+		self.assertEqual((obu.node, obu.coordinateX, obu.coordinateY, obu.velocity), ([2], [3], [4], [10]))
+		self.assertTrue(obu.OBU and obu.C1)
+		self.assertEqual(obu.ca_interval, 0.5)
+		self.assertEqual(node_argv(dict(scenario_nodes(SCENARIO)[1], geo_groups=True, split=False))[-2:], ['--geo-groups', '--headless'])
+
+
+if __name__ == '__main__':
+	unittest.main()
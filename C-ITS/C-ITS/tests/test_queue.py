@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - layer queues (Queue.py)
+#################################################
+import asyncio
+import threading
+import unittest
+from Queue import *
+
+WALL_TIMEOUT = 5
+
+
+class BatchTest(unittest.TestCase):
+
+	def test_put_many_get_many(self):
+		q = Queue()
+		q.put_many(range(5))
+		q.put(5)
+		self.assertEqual(q.get_many(), [0, 1, 2, 3, 4, 5])
+		q.put_many([6, 7, 8])
+		self.assertEqual(q.get_many(max_items=2), [6, 7])
+		self.assertEqual(q.get_many(), [8])
+		self.assertRaises(Empty, q.get_many, block=False)
+		self.assertRaises(Empty, q.get_many, timeout=0.01)
+		self.assertEqual(q.unfinished_tasks, 9)
+
+	def test_get_many_waits_for_the_first_item(self):
+		q = Queue()
+		batches = []
+		consumer = threading.Thread(target=lambda: batches.append(q.get_many()), daemon=True)
+		consumer.start()
+		q.put_many(['a', 'b'])
+		consumer.join(WALL_TIMEOUT)
+		self.assertFalse(consumer.is_alive())
+		self.assertEqual(batches, [['a', 'b']])
+
+	def test_put_many_waits_for_free_slots(self):
+		q = Queue(2)
+		self.assertRaises(Full, q.put_many, range(3), block=False)
+		# the items that fit were put
+		self.assertEqual(q.get_many(), [0, 1])
+		producer = threading.Thread(target=q.put_many, args=(range(10),), daemon=True)
+		producer.start()
+		received = []
+		while len(received) < 10:
+			received += q.get_many(timeout=WALL_TIMEOUT)
+		producer.join(WALL_TIMEOUT)
+		self.assertEqual(received, list(range(10)))
+
+	def test_put_many_timeout(self):
+		q = Queue(1)
+		self.assertRaises(Full, q.put_many, [1, 2], timeout=0.01)
+		self.assertEqual(q.get_many(), [1])
+
+
+class OverflowPolicyTest(unittest.TestCase):
+
+	def test_unknown_policy(self):
+		self.assertRaises(ValueError, Queue, 1, 'drop_random')
+
+	def test_drop_oldest(self):
+		q = Queue(3, 'drop_oldest')
+		q.put_many(range(5))
+		q.put(5)
+		self.assertEqual(q.get_many(), [3, 4, 5])
+		self.assertEqual(q.dropped, 3)
+		self.assertEqual(q.unfinished_tasks, 3)
+
+	def test_drop_newest(self):
+		q = Queue(3, 'drop_newest')
+		q.put_many(range(5))
+		q.put(5, timeout=0)
+		self.assertEqual(q.get_many(), [0, 1, 2])
+		self.assertEqual(q.dropped, 3)
+
+	def test_block(self):
+		q = Queue(2, 'block')
+		q.put_many([0, 1])
+		self.assertRaises(Full, q.put_nowait, 2)
+		self.assertRaises(Full, q.put, 2, timeout=0.01)
+		producer = threading.Thread(target=q.put, args=(2,), daemon=True)
+		producer.start()
+		self.assertEqual(q.get(), 0)
+		producer.join(WALL_TIMEOUT)
+		self.assertFalse(producer.is_alive())
+		self.assertEqual(q.get_many(), [1, 2])
+		self.assertEqual(q.dropped, 0)
+
+	def test_put_or_drop(self):
+		for overflow in OVERFLOW_POLICIES:
+			with self.subTest(overflow=overflow):
+				q = Queue(2, overflow)
+				for item in range(3):
+					q.put_or_drop(item)
+				self.assertEqual(q.qsize(), 2)
+				self.assertEqual(q.dropped, 1)
+
+	def test_unbounded(self):
+		q = Queue(0, 'drop_newest')
+		q.put_many(range(1000))
+		self.assertEqual((q.qsize(), q.dropped), (1000, 0))
+
+
+class LoopQueueTest(unittest.TestCase):
+
+	def run_loop(self, main):
+		# run main(loop) on an event loop in another thread, as the asyncio runtime does
+		loop = asyncio.new_event_loop()
+		result = []
+		thread = threading.Thread(target=lambda: result.append(loop.run_until_complete(main(loop))), daemon=True)
+		thread.start()
+		thread.join(WALL_TIMEOUT)
+		self.assertFalse(thread.is_alive(), 'event loop stalled')
+		loop.close()
+		return result[0]
+
+	def test_drop_policies(self):
+		async def main(loop):
+			results = []
+			for overflow in ('drop_oldest', 'drop_newest'):
+				q = LoopQueue(loop, 2, overflow)
+				for item in range(4):
+					q.put(item)
+				results.append(([q.get_nowait() for i in range(q.qsize())], q.dropped))
+			return results
+		self.assertEqual(self.run_loop(main), [([2, 3], 2), ([0, 1], 2)])
+
+	def test_block_in_loop_drops(self):
+		# put() on the loop itself never waits: the item is dropped (put_nowait raises Full)
+		async def main(loop):
+			q = LoopQueue(loop, 2, 'block')
+			for item in range(3):
+				q.put(item)
+			try:
+				q.put_nowait(3)
+			except Full:
+				full = True
+			q.put_or_drop(4)
+			return [await q.get_async(), await q.get_async()], q.dropped, full, q.empty()
+		self.assertEqual(self.run_loop(main), ([0, 1], 2, True, True))
+
+	def test_put_async_waits_for_a_slot(self):
+		async def main(loop):
+			q = LoopQueue(loop, 2, 'block')
+			async def producer():
+				for item in range(6):
+					await q.put_async(item)
+			task = loop.create_task(producer())
+			received = []
+			while len(received) < 6:
+				self.assertLessEqual(q.qsize(), 2)
+				received.append(await q.get_async())
+			await task
+			return received, q.dropped
+		self.assertEqual(self.run_loop(main), (list(range(6)), 0))
+
+	def test_thread_waits_for_a_slot(self):
+		# threads block on a full queue (backpressure) and resume when the loop retrieves items
+		loop = asyncio.new_event_loop()
+		q = LoopQueue(loop, 2, 'block')
+		producer = threading.Thread(target=q.put_many, args=(range(5),), daemon=True)
+		producer.start()
+		async def main(loop):
+			received = []
+			while len(received) < 5:
+				received.append(await q.get_async())
+			return received
+		result = []
+		consumer = threading.Thread(target=lambda: result.append(loop.run_until_complete(main(loop))), daemon=True)
+		consumer.start()
+		producer.join(WALL_TIMEOUT)
+		consumer.join(WALL_TIMEOUT)
+		self.assertEqual(result, [list(range(5))])
+		loop.close()
+
+	def test_thread_put_timeout(self):
+		loop = asyncio.new_event_loop()
+		q = LoopQueue(loop, 1, 'block')
+		q.put(0)
+		self.assertRaises(Full, q.put, 1, timeout=0.01)
+		self.assertRaises(Full, q.put_nowait, 1)
+		q.put_or_drop(1)
+		self.assertEqual(q.dropped, 1)
+		loop.close()
+
+
+class CoalescingTest(unittest.TestCase):
+
+	def key(self, item):
+		return item[0]
+
+	def test_latest_value_keeps_its_position(self):
+		q = CoalescingQueue(key=self.key)
+		q.put_many([('a', 1), ('b', 1), (None, 1), ('a', 2), (None, 2)])
+		q.put(('b', 2))
+		self.assertEqual(q.get_many(), [('a', 2), ('b', 2), (None, 1), (None, 2)])
+		self.assertEqual(q.coalesced, 2)
+		# once retrieved, a key is queued again
+		q.put(('a', 3))
+		self.assertEqual(q.get(), ('a', 3))
+
+	def test_replacement_never_overflows(self):
+		q = CoalescingQueue(2, 'block', self.key)
+		q.put_many([('a', 1), ('b', 1)])
+		q.put(('a', 2), block=False)
+		self.assertRaises(Full, q.put_nowait, ('c', 1))
+		self.assertEqual(q.get_many(), [('a', 2), ('b', 1)])
+		self.assertEqual(q.dropped, 0)
+
+	def test_loop_queue(self):
+		async def main(loop):
+			q = LoopQueue(loop, 2, 'block', self.key)
+			for item in [('a', 1), ('b', 1), ('a', 2), ('a', 3)]:
+				await q.put_async(item)
+			# replacements free the slot they took
+			q.put(('c', 1))
+			return [q.get_nowait() for i in range(q.qsize())], q.coalesced, q.dropped
+		self.assertEqual(LoopQueueTest.run_loop(self, main), ([('a', 3), ('b', 1)], 2, 1))
+
+
+class DispatcherTest(unittest.TestCase):
+
+	def test_handler_called_in_the_producer_thread(self):
+		calls = []
+		dispatcher = Dispatcher(lambda item: calls.append((item, threading.current_thread())))
+		dispatcher.put(1)
+		dispatcher.put_nowait(2)
+		dispatcher.put_or_drop(3)
+		dispatcher.put_many([4, 5])
+		self.assertEqual(calls, [(item, threading.current_thread()) for item in range(1, 6)])
+
+
+if __name__ == '__main__':
+	unittest.main()
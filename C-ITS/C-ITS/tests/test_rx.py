@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - zero-copy reception (multicast.py): socket draining into the preallocated ring of buffers
+#################################################
+import socket
+import unittest
+from data_link.multicast import create_rx_ring, receive_batch
+
+
+class ReceiveBatchTest(unittest.TestCase):
+
+	def setUp(self):
+		self.rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.rx.bind(('127.0.0.1', 0))
+		self.tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+	def tearDown(self):
+		self.rx.close()
+		self.tx.close()
+
+	def send(self, *datagrams):
+		for datagram in datagrams:
+			self.tx.sendto(datagram, self.rx.getsockname())
+
+	def test_drain_up_to_ring_size(self):
+		ring = create_rx_ring(2, 16)
+		self.send(b'a', b'bb', b'ccc')
+		batch = receive_batch(self.rx, ring, timeout=1)
+		self.assertEqual([bytes(view) for view, sender in batch], [b'a', b'bb'])
+		self.assertTrue(all(isinstance(view, memoryview) for view, sender in batch))
+		self.assertEqual(batch[0][1][1], self.tx.getsockname()[1])
+		self.assertEqual([bytes(view) for view, sender in receive_batch(self.rx, ring, timeout=1)], [b'ccc'])
+
+	def test_buffers_are_reused(self):
+		ring = create_rx_ring(1, 16)
+		self.send(b'first')
+		view, sender = receive_batch(self.rx, ring, timeout=1)[0]
+		self.assertEqual(bytes(view), b'first')
+		self.send(b'again')
+		receive_batch(self.rx, ring, timeout=1)
+		# slices are only valid until the next call
+		self.assertEqual(bytes(view), b'again')
+
+	def test_truncated_to_buffer_size(self):
+		ring = create_rx_ring(1, 4)
+		self.send(b'123456')
+		self.assertEqual(bytes(receive_batch(self.rx, ring, timeout=1)[0][0]), b'1234')
+
+	def test_timeout(self):
+		self.assertEqual(receive_batch(self.rx, create_rx_ring(2, 16), timeout=0.05), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
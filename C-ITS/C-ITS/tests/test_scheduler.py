@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - transmission scheduler (scheduler.py): class priority, token-bucket budget, backlog drops and
+# backpressure of the blocking classes
+#################################################
+import unittest
+from ITS_clock import now as clock_now
+from data_link.scheduler import *
+
+CLASSES = (
+	('DEN', ('DEN',), 1000, 500),
+	('CA', ('CA',), 100, 100),
+	('OTHER', None, None, None),
+)
+
+
+def msg(msg_type, msg_id=0):
+	return {'msg_type': msg_type, 'msg_id': msg_id}
+
+
+class TokenBucketTest(unittest.TestCase):
+
+	def test_budget(self):
+		bucket = TokenBucket(100, 50, now=0)
+		self.assertEqual(bucket.delay(0), 0)
+		bucket.consume(80, 0)
+		# the bucket went negative: eligible again once it refills to zero
+		self.assertAlmostEqual(bucket.delay(0), 0.3)
+		self.assertAlmostEqual(bucket.delay(0.2), 0.1)
+		self.assertEqual(bucket.delay(0.31), 0)
+		self.assertEqual(bucket.delay(100), 0)
+		self.assertEqual(bucket.tokens, 50)
+
+	def test_unlimited(self):
+		bucket = TokenBucket(None, None, now=0)
+		bucket.consume(10**9, 0)
+		self.assertEqual(bucket.delay(0), 0)
+
+
+class TxSchedulerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.scheduler = TxScheduler(CLASSES, backlog=4)
+		self.now = clock_now()
+
+	def test_priority(self):
+		for m in (msg('BEACON', 1), msg('CA', 2), msg('DEN', 3), msg('CA', 4)):
+			self.scheduler.add(m, self.now)
+		order = []
+		while len(self.scheduler):
+			cls, m = self.scheduler.next(self.now)
+			order.append((self.scheduler.names[cls], m['msg_id']))
+		self.assertEqual(order, [('DEN', 3), ('CA', 2), ('CA', 4), ('OTHER', 1)])
+		self.assertEqual(self.scheduler.next(self.now), (None, None))
+
+	def test_budget_is_per_class(self):
+		self.scheduler.add(msg('CA', 1), self.now)
+		self.scheduler.add(msg('CA', 2), self.now)
+		self.scheduler.add(msg('BEACON', 3), self.now)
+		cls, m = self.scheduler.next(self.now)
+		self.scheduler.sent(cls, 150, self.now)
+		# CA is out of budget for 0.5 s: the lower priority class goes first
+		cls, m = self.scheduler.next(self.now)
+		self.assertEqual(m['msg_id'], 3)
+		cls, delay = self.scheduler.next(self.now)
+		self.assertIsNone(cls)
+		self.assertAlmostEqual(delay, 0.5)
+		cls, m = self.scheduler.next(self.now + 0.5)
+		self.assertEqual(m['msg_id'], 2)
+		self.assertEqual(self.scheduler.counters['CA']['sent'], 1)
+		self.assertEqual(self.scheduler.counters['CA']['bytes'], 150)
+		self.assertAlmostEqual(self.scheduler.counters['CA']['max_wait'], 0.5)
+
+	def test_backlog_drops_oldest(self):
+		for msg_id in range(6):
+			self.scheduler.add(msg('CA', msg_id), self.now)
+		self.assertEqual([m['msg_id'] for t, m in self.scheduler.fifos[1]], [2, 3, 4, 5])
+		self.assertEqual(self.scheduler.counters['CA']['dropped'], 2)
+		self.assertFalse(self.scheduler.full())
+
+	def test_blocking_class(self):
+		for msg_id in range(4):
+			self.assertFalse(self.scheduler.full())
+			self.scheduler.add(msg('DEN', msg_id), self.now)
+		# DEN messages are never dropped: the scheduler reports full until one is sent
+		self.assertTrue(self.scheduler.full())
+		self.assertEqual(self.scheduler.counters['DEN']['blocked'], 1)
+		self.assertEqual(self.scheduler.counters['DEN']['dropped'], 0)
+		cls, m = self.scheduler.next(self.now)
+		self.assertEqual(m['msg_id'], 0)
+		self.assertFalse(self.scheduler.full())
+
+	def test_no_blocking_classes(self):
+		scheduler = TxScheduler(CLASSES, backlog=2, blocking=())
+		for msg_id in range(3):
+			scheduler.add(msg('DEN', msg_id), self.now)
+		self.assertFalse(scheduler.full())
+		self.assertEqual(scheduler.counters['DEN']['dropped'], 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - shared-memory channel (shmchannel.py): broadcast between the ports of a channel, sender
+# identification, readers lapped by a producer and slots released by closed ports
+#################################################
+import os
+import unittest
+from multiprocessing import shared_memory
+from data_link.shmchannel import *
+from data_link.frame import node_field
+
+
+class ShmPortTest(unittest.TestCase):
+
+	def setUp(self):
+		self.channel = 'its-test-{}-{}'.format(os.getpid(), self.id().rsplit('.', 1)[-1])
+		self.ports = []
+
+	def tearDown(self):
+		for port in self.ports:
+			port.close()
+		shared_memory.SharedMemory(name=self.channel).unlink()
+
+	def port(self, node, ring_size=4096):
+		port = ShmPort(node, self.channel, ring_size)
+		self.ports.append(port)
+		return port
+
+	def attach(self):
+		# readers attach the rings of the other ports at their current head
+		for port in self.ports:
+			port.scan()
+
+	def test_broadcast(self):
+		a, b, c = self.port('1'), self.port('2'), self.port('3')
+		self.assertEqual([a.slot, b.slot, c.slot], [0, 1, 2])
+		self.attach()
+		a.send(b'from a')
+		b.send(memoryview(b'from b'))
+		self.assertEqual(sorted(b.receive_batch()), [(b'from a', '1')])
+		self.assertEqual(sorted(c.receive_batch()), [(b'from a', '1'), (b'from b', '2')])
+		self.assertEqual(a.receive_batch(), [(b'from b', '2')])
+		self.assertEqual((a.counters['txd'], c.counters['rxd']), (1, 2))
+
+	def test_long_node_ids(self):
+		# node ids sharing their first 8 bytes must be told apart
+		a, b, r = self.port('vehicle-000000001'), self.port('vehicle-000000002'), self.port(12)
+		self.attach()
+		a.send(b'a')
+		b.send(b'b')
+		senders = dict((datagram, sender) for datagram, sender in r.receive_batch())
+		self.assertNotEqual(senders[b'a'], senders[b'b'])
+		self.assertEqual(senders[b'a'], node_field('vehicle-000000001')[0])
+
+	def test_overrun(self):
+		a, b = self.port('1', ring_size=64), self.port('2')
+		self.attach()
+		for i in range(20):
+			a.send(bytes([i])*12)
+		# the reader was lapped: the frames are lost and it resumes from the current head
+		self.assertEqual(b.poll(), [])
+		self.assertEqual(b.counters['overruns'], 1)
+		a.send(b'next')
+		self.assertEqual(b.receive_batch(), [(b'next', '1')])
+
+	def test_slot_released_on_close(self):
+		a = self.port('1')
+		b = ShmPort('2', self.channel)
+		b.close()
+		c = self.port('3')
+		self.assertEqual(c.slot, 1)
+		self.attach()
+		a.send(b'x')
+		self.assertEqual(c.receive_batch(), [(b'x', '1')])
+
+
+if __name__ == '__main__':
+	unittest.main()
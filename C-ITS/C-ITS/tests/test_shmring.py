@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - shared-memory rings and records of the split node mode (shmring.py, ITS_split.py)
+#################################################
+import threading
+import unittest
+import multiprocessing
+from Queue import Empty, Full
+from data_link.shmring import *
+from data_link.frame import encode_frame, decode_frame
+from data_link.freshness import message_age
+from ITS_split import SharedRecord, COORDINATES_FIELDS
+
+WALL_TIMEOUT = 5
+
+
+def produce(ring, count):
+	for i in range(count):
+		ring.put(i.to_bytes(4, 'big')*(1 + i % 7))
+
+def consume(ring, count, results):
+	received = []
+	while len(received) < count:
+		received += ring.get_many(timeout=WALL_TIMEOUT)
+	results.put([int.from_bytes(record[:4], 'big') for record in received])
+
+
+class ShmRingTest(unittest.TestCase):
+
+	def setUp(self):
+		self.rings = []
+
+	def tearDown(self):
+		for ring in self.rings:
+			ring.close()
+
+	def ring(self, size, overflow='block', cls=ShmRing):
+		ring = cls(size, overflow)
+		self.rings.append(ring)
+		return ring
+
+	def test_records_in_order(self):
+		ring = self.ring(64)
+		ring.put_many([b'a', b'', b'ccc'])
+		ring.put(b'dd')
+		self.assertEqual(ring.get_many(max_items=2), [b'a', b''])
+		self.assertEqual(ring.get_many(), [b'ccc', b'dd'])
+		self.assertTrue(ring.empty())
+		self.assertRaises(Empty, ring.get_many, block=False)
+		self.assertRaises(Empty, ring.get, timeout=0.01)
+
+	def test_wrap_around(self):
+		ring = self.ring(32)
+		for i in range(50):
+			record = bytes([i])*(i % 11)
+			ring.put(record)
+			self.assertEqual(ring.get(), record)
+
+	def test_block(self):
+		ring = self.ring(16)
+		ring.put(b'x'*8)
+		self.assertRaises(Full, ring.put, b'y'*8, False)
+		self.assertRaises(Full, ring.put, b'y'*8, timeout=0.01)
+		self.assertRaises(ValueError, ring.put, b'z'*16)
+		ring.put_or_drop(b'y'*8)
+		self.assertEqual(ring.dropped, 1)
+		producer = threading.Thread(target=ring.put, args=(b'y'*8,), daemon=True)
+		producer.start()
+		self.assertEqual(ring.get(), b'x'*8)
+		producer.join(WALL_TIMEOUT)
+		self.assertFalse(producer.is_alive())
+		self.assertEqual(ring.get(), b'y'*8)
+
+	def test_drop_newest(self):
+		ring = self.ring(24, 'drop_newest')
+		ring.put_many([b'a'*8, b'b'*8, b'c'*8])
+		self.assertEqual(ring.get_many(), [b'a'*8, b'b'*8])
+		self.assertEqual(ring.dropped, 1)
+		self.assertRaises(ValueError, ShmRing, 16, 'drop_oldest')
+
+	def test_processes(self):
+		# one producer and one consumer process, with a ring smaller than the data exchanged
+		ring = self.ring(256)
+		results = multiprocessing.Queue()
+		consumer = multiprocessing.Process(target=consume, args=(ring, 500, results))
+		producer = multiprocessing.Process(target=produce, args=(ring, 500))
+		consumer.start()
+		producer.start()
+		received = results.get(timeout=WALL_TIMEOUT*4)
+		producer.join(WALL_TIMEOUT)
+		consumer.join(WALL_TIMEOUT)
+		self.assertEqual(received, list(range(500)))
+
+	def test_message_ring(self):
+		ring = self.ring(4096, cls=MessageRing)
+		received = decode_frame(encode_frame({'msg_type': 'CA', 'node': '1', 'msg_id': 3, 'info': []}))
+		received.header['rx_time'] = 100.0
+		ring.put_many([received, {'msg_type': 'DEN', 'node': '2', 'msg_id': 4}])
+		ca, den = ring.get_many()
+		# received frames keep their reception time and are handed over undecoded
+		self.assertFalse(ca.decoded())
+		self.assertEqual(message_age(ca, 101.0), 1.0)
+		self.assertEqual(ca, {'msg_type': 'CA', 'node': '1', 'msg_id': 3, 'info': []})
+		self.assertIsNone(message_age(den))
+		self.assertEqual(den['msg_id'], 4)
+
+
+class SharedRecordTest(unittest.TestCase):
+
+	def test_dictionary_operations(self):
+		record = SharedRecord(COORDINATES_FIELDS)
+		self.assertFalse(record)
+		self.assertEqual(record.copy(), {})
+		self.assertIsNone(record.get('x'))
+		self.assertRaises(KeyError, record.__getitem__, 'x')
+		record.update(x=10, y=-5, t=1.5)
+		record['x'] = 11
+		self.assertTrue(record)
+		self.assertIn('y', record)
+		self.assertEqual((record['x'], record['y'], record.get('t'), record.get('z', 0)), (11, -5, 1.5, 0))
+		self.assertEqual(dict(record.items()), {'x': 11, 'y': -5, 't': 1.5})
+
+	def test_shared_with_a_child_process(self):
+		record = SharedRecord(COORDINATES_FIELDS, {'x': 1, 'y': 2, 't': 0.0})
+		child = multiprocessing.Process(target=record.update, args=({'x': 7, 't': 3.0},))
+		child.start()
+		child.join(WALL_TIMEOUT)
+		self.assertEqual(record.copy(), {'x': 7, 'y': 2, 't': 3.0})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# #################################################
+## TESTS - spatial index of the loc_table (spatial.py): queries against a linear scan, expiry and the cache
+# of routing decisions
+#################################################
+import math
+import random
+import unittest
+from transport_network.spatial import LocTable
+
+
+def entry(x, y, timeout=None):
+	return {'pos_x': x, 'pos_y': y, 'timeout': timeout}
+
+def scan(table, x, y):
+	return sorted((math.hypot(e['pos_x'] - x, e['pos_y'] - y), node) for node, e in table.items())
+
+
+class LocTableQueryTest(unittest.TestCase):
+
+	def setUp(self):
+		rand = random.Random(1)
+		self.table = LocTable(cell_size=50)
+		for node in range(200):
+			self.table[node] = entry(rand.uniform(-500, 500), rand.uniform(-300, 700))
+		self.rand = rand
+
+	def test_within(self):
+		for i in range(50):
+			x, y, r = self.rand.uniform(-600, 600), self.rand.uniform(-400, 800), self.rand.uniform(0, 200)
+			self.assertEqual(self.table.within(x, y, r), [(d, n) for d, n in scan(self.table, x, y) if d <= r])
+
+	def test_in_rect(self):
+		for i in range(50):
+			x1, x2 = self.rand.uniform(-600, 600), self.rand.uniform(-600, 600)
+			y1, y2 = self.rand.uniform(-400, 800), self.rand.uniform(-400, 800)
+			expected = [n for n, e in self.table.items() if min(x1, x2) <= e['pos_x'] <= max(x1, x2) and min(y1, y2) <= e['pos_y'] <= max(y1, y2)]
+			self.assertEqual(sorted(self.table.in_rect(x1, y1, x2, y2)), sorted(expected))
+
+	def test_nearest(self):
+		# query points inside the table and far away from it
+		for i in range(100):
+			spread = 600 if i % 2 else 5000
+			x, y, k = self.rand.uniform(-spread, spread), self.rand.uniform(-spread, spread), self.rand.randint(1, 5)
+			self.assertEqual(self.table.nearest(x, y, k), scan(self.table, x, y)[:k])
+
+	def test_nearest_exclude(self):
+		closest = self.table.nearest(0, 0, 3)
+		excluded = set(node for d, node in closest[:2])
+		self.assertEqual(self.table.nearest(0, 0, 1, exclude=excluded), closest[2:])
+
+	def test_nearest_after_updates(self):
+		# the bounding box shrinks when edge cells empty and grows with new entries
+		for i in range(2000):
+			node = self.rand.randrange(250)
+			if node in self.table and self.rand.random() < 0.4:
+				del self.table[node]
+			else:
+				self.table[node] = entry(self.rand.uniform(-800, 800), self.rand.uniform(-800, 800))
+			x, y = self.rand.uniform(-2000, 2000), self.rand.uniform(-2000, 2000)
+			self.assertEqual(self.table.nearest(x, y, 2), scan(self.table, x, y)[:2])
+		cells = list(self.table.cells)
+		self.assertEqual(self.table.bounds(), (min(c[0] for c in cells), min(c[1] for c in cells),
+			max(c[0] for c in cells), max(c[1] for c in cells)))
+
+	def test_empty(self):
+		table = LocTable()
+		self.assertEqual(table.nearest(0, 0, 1), [])
+		self.assertEqual(table.within(0, 0, 100), [])
+		table['a'] = entry(1, 1)
+		table.pop('a')
+		self.assertEqual(table.nearest(0, 0, 1), [])
+		self.assertEqual(table.cells, {})
+
+	def test_dictionary_operations_keep_the_index(self):
+		table = LocTable({'a': entry(0, 0), 'b': entry(10, 0)}, cell_size=50)
+		table.update(c=entry(200, 0))
+		table.setdefault('d', entry(400, 0))
+		self.assertEqual(table.within(0, 0, 20), [(0, 'a'), (10, 'b')])
+		table['a'] = entry(300, 0)
+		self.assertEqual(table.nearest(310, 0, 1), [(10, 'a')])
+		node, e = table.popitem()
+		self.assertNotIn(node, table.where)
+		table.clear()
+		self.assertEqual((table.cells, table.where, table.nearest(0, 0)), ({}, {}, []))
+
+
+class LocTableExpiryTest(unittest.TestCase):
+
+	def test_expire(self):
+		table = LocTable()
+		for node in range(10):
+			table[node] = entry(node, 0, timeout=node)
+		table['static'] = entry(0, 0)
+		self.assertEqual(table.next_expiry(), 0)
+		self.assertEqual(sorted(table.expire(5)), [0, 1, 2, 3, 4])
+		self.assertEqual(set(table), {5, 6, 7, 8, 9, 'static'})
+		self.assertEqual(table.within(0, 0, 4), [(0, 'static')])
+
+	def test_refreshed_entry_is_kept(self):
+		table = LocTable()
+		table['a'] = entry(0, 0, timeout=1)
+		table['a'] = entry(0, 0, timeout=10)
+		self.assertEqual(table.expire(5), [])
+		self.assertIn('a', table)
+		self.assertEqual(table.expire(11), ['a'])
+		self.assertEqual(table.expiries, [])
+
+	def test_deleted_entry_is_skipped(self):
+		table = LocTable()
+		table['a'] = entry(0, 0, timeout=1)
+		del table['a']
+		table['a'] = entry(0, 0)
+		self.assertEqual(table.expire(5), [])
+		self.assertIn('a', table)
+
+	def test_heap_is_compacted(self):
+		table = LocTable()
+		for t in range(1000):
+			table['a'] = entry(0, 0, timeout=t)
+		self.assertLessEqual(len(table.expiries), 2*len(table) + 64)
+		self.assertEqual(table.expire(998), [])
+		self.assertEqual(table.expire(1000), ['a'])
+
+
+class NextHopCacheTest(unittest.TestCase):
+
+	def test_cache_cleared_on_topology_change(self):
+		table = LocTable({'a': entry(0, 0)}, cell_size=50)
+		table.next_hops['dest'] = 'a'
+		table['a'] = entry(0, 0)
+		self.assertEqual(table.next_hops, {'dest': 'a'}, 'beacons from a neighbour that did not move keep the cache')
+		table['a'] = entry(10, 10)
+		self.assertEqual(table.next_hops, {}, 'moves inside a cell clear the cache')
+		table.next_hops['dest'] = 'a'
+		table['a'] = entry(100, 10)
+		self.assertEqual(table.next_hops, {})
+		table.next_hops['dest'] = 'a'
+		table['b'] = entry(0, 0)
+		self.assertEqual(table.next_hops, {})
+		table.next_hops['dest'] = 'a'
+		del table['b']
+		self.assertEqual(table.next_hops, {})
+
+
+if __name__ == '__main__':
+	unittest.main()
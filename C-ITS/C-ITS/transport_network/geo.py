@@ -2,8 +2,11 @@
 # #################################################
 ## FUNCTIONS USED BY GEONETWORK LAYER
 #################################################
-import time
+import math
+from ITS_clock import now
 from Queue import Empty
+from in_vehicle_network.location_functions import position_read
+from transport_network.spatial import LocTable
 
 #------------------------------------------------------------------------------------------------
 # create_beacon - a beacon is a keep-alive packet used to maintain up-to-date information of neighnour nodes
@@ -22,13 +25,14 @@ def update_node_info(node, x, y, t):
 #------------------------------------------------------------------------------------------------
 # update_loc_table_entry - node's neighbourhood is maintained on a table - the loc_table. 
 # 					This table ia update upon reception of a beacon from a neighbour node
+#					A LocTable also re-hashes the entry on its grid index (see spatial.py)
 #------------------------------------------------------------------------------------------------
 def update_loc_table_entry(node,loc_table, beacon, lock, validity):
 	neighbour_node=beacon['node']
 	if (neighbour_node==node):
 		return -1
 	lock.acquire()
-	timer = time.time()+validity
+	timer = now()+validity
 	loc_table.update({beacon['node']:{'node': beacon['node'], 'pos_x':beacon['pos_x'],'pos_y':beacon['pos_y'],'timeout':timer}})
 	lock.release()
 	return node
@@ -36,26 +40,262 @@ def update_loc_table_entry(node,loc_table, beacon, lock, validity):
 #------------------------------------------------------------------------------------------------
 # delete_loc_table_entry - loc_table entries are removed after a timeout period without receiving a beacon 
 # 				from the correspodent node. This function checks for invalid entries.
+#				A LocTable only pops the expired deadlines of its heap, all of them under one lock 
+#				acquisition; other tables are scanned.
 #------------------------------------------------------------------------------------------------
 def delete_loc_table_entry(loc_table, node, lock):
+	if isinstance(loc_table, LocTable):
+		t = now()
+		next_expiry = loc_table.next_expiry()
+		if next_expiry is not None and next_expiry < t:
+			with lock:
+				loc_table.expire(t)
+		return
 	if loc_table is not Empty:
 		for neighbour in list(loc_table):
-			if (node!=neighbour) and (time.time()>loc_table[neighbour]['timeout']):
+			if (node!=neighbour) and (now()>loc_table[neighbour]['timeout']):
 				lock.acquire()
 				del (loc_table[neighbour])
 				lock.release()
 	return
 
 #------------------------------------------------------------------------------------------------
-# to be done, if needed
+# geo unicast - messages addressed to one node carry a geonetworking header, the 'gn' field:
+#		type: 'unicast', src: originator, dest: destination node, dest_x/dest_y: destination position,
+#		hops/hop_limit: hops made and maximum number of hops, next_hop: node that must forward the
+#		message (0 - none), mode: 'greedy' or 'perimeter' (recovery), lp_x/lp_y: position where the perimeter
+#		mode started, lf_x/lf_y: point where the line from lp to the destination was last crossed, e0: first
+#		edge (node, next hop) of the face being walked, prev_x/prev_y: position of the last forwarder
+#		Facilities set type, dest, dest_x and dest_y; the remaining fields are set by the geonetworking layer.
+#------------------------------------------------------------------------------------------------
+GN_HOP_LIMIT = 10
+
+def _distance(x1, y1, x2, y2):
+	return math.hypot(x2 - x1, y2 - y1)
+
+def _bearing(x1, y1, x2, y2):
+	return math.atan2(y2 - y1, x2 - x1)
+
+# _crossing - point where the segments (x1,y1)-(x2,y2) and (x3,y3)-(x4,y4) cross, or None
+def _crossing(x1, y1, x2, y2, x3, y3, x4, y4):
+	d = (x2 - x1)*(y4 - y3) - (y2 - y1)*(x4 - x3)
+	if d == 0:
+		return None
+	t = ((x3 - x1)*(y4 - y3) - (y3 - y1)*(x4 - x3))/d
+	u = ((x3 - x1)*(y2 - y1) - (y3 - y1)*(x2 - x1))/d
+	if not (0 <= t <= 1 and 0 <= u <= 1):
+		return None
+	return x1 + t*(x2 - x1), y1 + t*(y2 - y1)
+
+#------------------------------------------------------------------------------------------------
+# planar_neighbours - neighbours kept by the Gabriel graph planarization: v is kept if no other neighbour
+#		lies inside the circle whose diameter is the edge to v. Perimeter forwarding on a planar graph
+#		walks the faces crossed by the line towards the destination.
+#------------------------------------------------------------------------------------------------
+def planar_neighbours(node_info, loc_table):
+	x, y = node_info['pos_x'], node_info['pos_y']
+	planar = []
+	for neighbour, entry in list(loc_table.items()):
+		vx, vy = entry['pos_x'], entry['pos_y']
+		mx, my, r = (x + vx)/2, (y + vy)/2, _distance(x, y, vx, vy)/2
+		if all(w == neighbour or d >= r for d, w in loc_table.within(mx, my, r)):
+			planar.append((neighbour, vx, vy))
+	return planar
+
+#------------------------------------------------------------------------------------------------
+# right_hand_neighbour - planar neighbour that comes first counterclockwise from bearing (right-hand rule).
+#		A neighbour exactly on bearing comes last.
+#------------------------------------------------------------------------------------------------
+def right_hand_neighbour(node_info, loc_table, bearing):
+	x, y = node_info['pos_x'], node_info['pos_y']
+	best, best_angle = 0, None
+	for neighbour, vx, vy in planar_neighbours(node_info, loc_table):
+		angle = (_bearing(x, y, vx, vy) - bearing) % (2*math.pi)
+		if angle == 0:
+			angle = 2*math.pi
+		if best_angle is None or angle < best_angle:
+			best, best_angle = neighbour, angle
+	return best
+
+#------------------------------------------------------------------------------------------------
+# find_next_hop - greedy position-based forwarding with perimeter recovery (GPSR)
+#		node_info: forwarding node, as built by update_node_info
+#		loc_table: node's LocTable
+#		dest_node: destination node
+#		gn: geonetworking header of the message - destination position and perimeter state, updated here
+#		(out) - next hop node, or 0 if there is none
+#		Greedy: the destination itself, if it is a neighbour, or the neighbour closest to the destination,
+#		if it is closer than this node. Greedy decisions are cached on the loc_table per destination cell.
+#		Otherwise the message goes around the void in perimeter mode, until it reaches a node closer to
+#		the destination than the one where the perimeter mode started, or comes back to its first edge.
+#		Perimeter mode walks the faces of the planar graph crossed by the line from lp to the destination:
+#		an edge that crosses the line closer to the destination than the last crossing leaves the face,
+#		and the walk goes on in the next face (face change).
+#------------------------------------------------------------------------------------------------
+def find_next_hop(node_info, loc_table, dest_node, gn=None):
+	next_hop=0
+	dest_node = str(dest_node)
+	if dest_node in loc_table:
+		return dest_node
+	if gn is None or gn.get('dest_x') is None or gn.get('dest_y') is None:
+		return next_hop
+	x, y = node_info['pos_x'], node_info['pos_y']
+	dx, dy = gn['dest_x'], gn['dest_y']
+	distance = _distance(x, y, dx, dy)
+	if gn.get('mode') == 'perimeter' and distance < _distance(gn['lp_x'], gn['lp_y'], dx, dy):
+		gn['mode'] = 'greedy'
+	if gn.get('mode', 'greedy') == 'greedy':
+		cache = getattr(loc_table, 'next_hops', None)
+		key = (dest_node, int(dx), int(dy), int(x), int(y))
+		if cache is not None and key in cache:
+			return cache[key]
+		closest = loc_table.nearest(dx, dy, 1)
+		if closest and closest[0][0] < distance:
+			next_hop = closest[0][1]
+			if cache is not None:
+				cache[key] = next_hop
+			return next_hop
+		# local maximum - recovery in perimeter mode, starting with the first edge counterclockwise
+		# from the line towards the destination
+		gn['mode'] = 'perimeter'
+		gn['lp_x'], gn['lp_y'] = x, y
+		gn['lf_x'], gn['lf_y'] = x, y
+		next_hop = right_hand_neighbour(node_info, loc_table, _bearing(x, y, dx, dy))
+		gn['e0'] = [str(node_info['node']), next_hop]
+		return next_hop
+	# next edge counterclockwise from the edge the message came from (taken back only if it is the only one)
+	next_hop = right_hand_neighbour(node_info, loc_table, _bearing(x, y, gn['prev_x'], gn['prev_y']))
+	node = str(node_info['node'])
+	lf_x, lf_y = gn.get('lf_x', gn['lp_x']), gn.get('lf_y', gn['lp_y'])
+	# face change - while the edge crosses the line from lp to the destination closer to the destination
+	# than lf, the next edge counterclockwise is taken and becomes the first edge of the new face
+	face_change = False
+	for i in range(len(loc_table)):
+		entry = loc_table.get(next_hop)
+		if entry is None:
+			break
+		crossing = _crossing(x, y, entry['pos_x'], entry['pos_y'], gn['lp_x'], gn['lp_y'], dx, dy)
+		if crossing is None or _distance(crossing[0], crossing[1], dx, dy) >= _distance(lf_x, lf_y, dx, dy):
+			break
+		lf_x, lf_y = gn['lf_x'], gn['lf_y'] = crossing
+		next_hop = right_hand_neighbour(node_info, loc_table, _bearing(x, y, entry['pos_x'], entry['pos_y']))
+		gn['e0'] = [node, next_hop]
+		face_change = True
+	if not face_change and [node, next_hop] == gn.get('e0'):
+		# the whole face was walked around: the destination is unreachable
+		return 0
+	return next_hop
+
+#------------------------------------------------------------------------------------------------
+# route_unicast - set the next hop of a geo unicast message sent or forwarded by this node
+#		(out) - next hop node, or 0 if there is none (or the hop limit was reached)
+#------------------------------------------------------------------------------------------------
+def route_unicast(node, gn, coordinates, loc_table):
+	x, y, t = position_read(coordinates)
+	gn.setdefault('src', str(node))
+	gn.setdefault('hops', 0)
+	gn.setdefault('hop_limit', GN_HOP_LIMIT)
+	next_hop = 0
+	if gn['hops'] < gn['hop_limit']:
+		next_hop = find_next_hop(update_node_info(node, x, y, t), loc_table, gn['dest'], gn)
+	gn['next_hop'] = next_hop
+	gn['prev_x'], gn['prev_y'] = x, y
+	return next_hop
+
+#------------------------------------------------------------------------------------------------
+# geocast - messages for the nodes of a region of interest (roi) carry a geonetworking header with:
+#		type: 'geocast', area: {'shape': 'circle', 'x', 'y', 'r'} or {'shape': 'rect', 'x1', 'y1', 'x2', 'y2'},
+#		hops/hop_limit, next_hop and prev_x/prev_y (as in geo unicast). next_hop is GN_BROADCAST when the
+#		message is broadcast in the area, or the node that must carry it towards the area (line forwarding).
+#------------------------------------------------------------------------------------------------
+GN_BROADCAST = '*'
+
+def circle_area(x, y, r):
+	return {'shape': 'circle', 'x': x, 'y': y, 'r': r}
+
+def rect_area(x1, y1, x2, y2):
+	return {'shape': 'rect', 'x1': min(x1, x2), 'y1': min(y1, y2), 'x2': max(x1, x2), 'y2': max(y1, y2)}
+
+def area_center(area):
+	if area['shape'] == 'circle':
+		return area['x'], area['y']
+	return (area['x1'] + area['x2'])/2, (area['y1'] + area['y2'])/2
+
+#------------------------------------------------------------------------------------------------
+# area_distance - distance from (x,y) to the area (0 inside)
+#------------------------------------------------------------------------------------------------
+def area_distance(area, x, y):
+	if area['shape'] == 'circle':
+		return max(0.0, _distance(x, y, area['x'], area['y']) - area['r'])
+	dx = max(area['x1'] - x, 0, x - area['x2'])
+	dy = max(area['y1'] - y, 0, y - area['y2'])
+	return math.hypot(dx, dy)
+
+#------------------------------------------------------------------------------------------------
+# check_roi - True if pos (x,y) - or the node position, if pos is None - is inside the region of interest
+#		roi: area of a geocast header (None - everywhere)
 #------------------------------------------------------------------------------------------------
 def check_roi(node_info, pos, roi):
-	in_roi=True
+	if roi is None:
+		return True
+	x, y = (node_info['pos_x'], node_info['pos_y']) if pos is None else pos
+	in_roi = area_distance(roi, x, y) == 0
 	return in_roi
 
 #------------------------------------------------------------------------------------------------
-# to be done, if needed
+# neighbours_in_area - neighbours of the loc_table inside the area, found on its spatial index
 #------------------------------------------------------------------------------------------------
-def find_next_hop(node_info, loc_table, dest_node):
-	next_hop=0
+def neighbours_in_area(loc_table, area):
+	if area['shape'] == 'circle':
+		return [neighbour for d, neighbour in loc_table.within(area['x'], area['y'], area['r'])]
+	return loc_table.in_rect(area['x1'], area['y1'], area['x2'], area['y2'])
+
+#------------------------------------------------------------------------------------------------
+# geocast_next_hop - how a geocast message leaves this node
+#		(out) - GN_BROADCAST if the node or one of its neighbours is inside the area, the neighbour closest
+#		        to the area if it is closer than this node, or 0 if no neighbour is inside or towards the area
+#------------------------------------------------------------------------------------------------
+def geocast_next_hop(node_info, loc_table, area):
+	x, y = node_info['pos_x'], node_info['pos_y']
+	if check_roi(node_info, None, area):
+		return GN_BROADCAST
+	if not loc_table:
+		return 0
+	if neighbours_in_area(loc_table, area):
+		return GN_BROADCAST
+	cx, cy = area_center(area)
+	closest = loc_table.nearest(cx, cy, 1)
+	if closest:
+		entry = loc_table.get(closest[0][1])
+		if entry is not None and area_distance(area, entry['pos_x'], entry['pos_y']) < area_distance(area, x, y):
+			return closest[0][1]
+	return 0
+
+#------------------------------------------------------------------------------------------------
+# route_geocast - set the next hop of a geocast message sent or forwarded by this node
+#		(out) - next hop (GN_BROADCAST or node), or 0 if the message must not be transmitted
+#------------------------------------------------------------------------------------------------
+def route_geocast(node, gn, coordinates, loc_table):
+	x, y, t = position_read(coordinates)
+	gn.setdefault('src', str(node))
+	gn.setdefault('hops', 0)
+	gn.setdefault('hop_limit', GN_HOP_LIMIT)
+	next_hop = 0
+	if gn['hops'] < gn['hop_limit']:
+		next_hop = geocast_next_hop(update_node_info(node, x, y, t), loc_table, gn['area'])
+	gn['next_hop'] = next_hop
+	gn['prev_x'], gn['prev_y'] = x, y
 	return next_hop
+
+#------------------------------------------------------------------------------------------------
+# topologically-scoped broadcast (tsb) - messages for every node up to hop_limit hops away, relayed by the
+#		facilities layer (see DenRelay in services.py). The header carries src, hops, hop_limit and the
+#		position of the last transmitter (prev_x/prev_y).
+#------------------------------------------------------------------------------------------------
+def route_tsb(node, gn, coordinates):
+	x, y, t = position_read(coordinates)
+	gn.setdefault('src', str(node))
+	gn.setdefault('hops', 0)
+	gn.setdefault('hop_limit', GN_HOP_LIMIT)
+	gn['prev_x'], gn['prev_y'] = x, y
+	return GN_BROADCAST
@@ -3,68 +3,141 @@
 ##SENDING/RECEIVING GEONETWORK - here we add the geonetworking information - ROI and neighbour management.
 # You may need to add a common data structure with the neighbous table.
 #################################################
-import time
+from ITS_clock import sleep
 from transport_network.geo import *
 from in_vehicle_network.car_control import *
 import threading
+import asyncio
+from data_link.freshness import FreshnessFilter, MAX_AGE
+from data_link.frame import gn_header
 
-loc_table=dict()
+loc_table=LocTable()
 pkt_beacon=dict()
 
 lock_loc_table = threading.Lock()
 
+# beacon interval, loc_table entry validity and loc_table check period (seconds)
+#		Note: - entry_validity defines the timeout value. The value used is very high to avoid removing entries for the table
+TXD_BEACON_INTERVAL = 5
+ENTRY_VALIDITY = 2000
+LOC_TABLE_CHECK_INTERVAL = 1
+
+#------------------------------------------------------------------------------------------------
+# route_txd - set the geonetworking header of the geo unicast, geocast and tsb messages sent by this node
+#		(see geo.py). Geo unicast messages with no next hop are still sent, to reach the destination if
+#		it is in range; geocast messages are suppressed when no neighbour is inside or towards their area.
+#		(out) - messages to be transmitted
+#------------------------------------------------------------------------------------------------
+def route_txd(node, msgs, coordinates, table):
+	msgs_txd = []
+	for msg in msgs:
+		gn = msg.get('gn')
+		if gn is not None and gn.get('type') == 'unicast':
+			route_unicast(node, gn, coordinates, table)
+		elif gn is not None and gn.get('type') == 'geocast':
+			if not route_geocast(node, gn, coordinates, table):
+				continue
+		elif gn is not None and gn.get('type') == 'tsb':
+			route_tsb(node, gn, coordinates)
+		msgs_txd.append(msg)
+	return msgs_txd
+
+#------------------------------------------------------------------------------------------------
+# route_rxd - reception of messages with a geonetworking header
+#		geo unicast - the destination delivers the message, the next hop forwards it, other nodes drop it
+#		geocast     - nodes inside the area deliver the message, the next hop towards the area forwards it,
+#		              other nodes drop it
+#		tsb         - every node delivers the message (relayed by the facilities layer)
+#		Forwarding never blocks reception: a message that does not fit multicast_txd_queue is dropped and counted
+#		(out) - True if the message must be delivered to the facilities layer
+#------------------------------------------------------------------------------------------------
+def route_rxd(node, msg_rxd, gn, coordinates, table, multicast_txd_queue):
+	if gn.get('type') == 'unicast':
+		deliver = str(gn['dest']) == str(node)
+		route = route_unicast
+	elif gn.get('type') == 'geocast':
+		x, y, t = position_read(coordinates)
+		deliver = check_roi(None, (x, y), gn['area'])
+		route = route_geocast
+	else:
+		return True
+	if not deliver and str(gn.get('next_hop')) == str(node) and multicast_txd_queue is not None:
+		msg_fwd = msg_rxd.copy()
+		gn_fwd = dict(gn)
+		gn_fwd['hops'] = gn.get('hops', 0) + 1
+		if route(node, gn_fwd, coordinates, table):
+			msg_fwd['gn'] = gn_fwd
+			multicast_txd_queue.put_or_drop(msg_fwd)
+	return deliver
+
 #------------------------------------------------------------------------------------------------
 # Thread - geonetwork_txd - message transmission in geocast mode. 
-#		Note: current version is just a place holder. Future versions must include support for:
-# 			1) geocast communication - messsages are trasmitted only it the node has, at least, one neigbour
-#			2) unicast communication - location-based routing and a location service
+#		Geocast communication: messages are transmitted only if a neighbour is inside or towards their area
+#		Unicast communication: location-based routing of the messages with a geo unicast header (see geo.py)
+#		coordinates, table: node's coordinates and loc_table, used to route geocast and geo unicast messages
+#		Messages are relayed in batches: each wakeup drains geonetwork_txd_queue with get_many
 #------------------------------------------------------------------------------------------------
-def geonetwork_txd(node, start_flag, geonetwork_txd_queue, multicast_txd_queue):
+def geonetwork_txd(node, start_flag, geonetwork_txd_queue, multicast_txd_queue, coordinates=None, table=None):
+	table = loc_table if table is None else table
 
-	while not start_flag.isSet():
-		time.sleep(1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: geonetwork_txd - NODE: {}\n'.format(node),'\n')
 
 	while True :
-		msg_rxd=geonetwork_txd_queue.get()
-	#	print('STATUS: Message received/send - THREAD: geonetwork_txd - NODE: {}'.format(node),' - MSG: {}'.format(msg_rxd),'\n')
-		multicast_txd_queue.put(msg_rxd)
+		msgs_rxd=geonetwork_txd_queue.get_many()
+	#	print('STATUS: Message received/send - THREAD: geonetwork_txd - NODE: {}'.format(node),' - MSG: {}'.format(msgs_rxd),'\n')
+		if coordinates is not None:
+			msgs_rxd = route_txd(node, msgs_rxd, coordinates, table)
+		if msgs_rxd:
+			multicast_txd_queue.put_many(msgs_rxd)
 	return
 #------------------------------------------------------------------------------------------------
 # Thread - geonetwork_rxd - message transmission in geocast mode. 
-#	Note: current version is just a place holder. Future versions must include support for:
-#		1) geocast communication - including region-of-interest (roi) processing
-#		2) unicast communication - location-based routing and a location service
+#	Geocast communication: messages are only delivered inside their region of interest (roi)
+#	Unicast communication: geo unicast messages are only delivered by their destination
+#	Messages are forwarded by their next hop (see route_rxd)
+#	coordinates, table, multicast_txd_queue: node's coordinates, loc_table and the queue where geocast and 
+#		geo unicast messages are forwarded - None to deliver every message
+#	Messages are relayed in batches: each wakeup drains multicast_rxd_queue with get_many
+#	Messages older than their max-age budget are discarded and counted on stale_stats (see freshness.py)
+#	max_age: max-age budget per msg_type (see MAX_AGE)
 #------------------------------------------------------------------------------------------------
-def geonetwork_rxd(node, start_flag, multicast_rxd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue,):
-
-	global loc_table
+def geonetwork_rxd(node, start_flag, multicast_rxd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue, stale_stats=None,
+		coordinates=None, table=None, multicast_txd_queue=None, max_age=MAX_AGE):
+	table = loc_table if table is None else table
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: geonetwork_rxd - NODE: {}'.format(node),'\n')
 
+	freshness = FreshnessFilter('geonetwork_rxd', stale_stats, max_age)
 	while True :
-		msg_rxd=multicast_rxd_queue.get()
-	#	print('STATUS: Message received/send - THREAD: geonetwork_rxd - NODE: {}'.format(node),' - MSG: {}'.format(msg_rxd),'\n')
-		if (msg_rxd['msg_type']=='CA'):
-			geonetwork_rxd_ca_queue.put(msg_rxd)
-		else:
-			geonetwork_rxd_den_queue.put(msg_rxd)
+		ca_msgs=[]
+		den_msgs=[]
+		for msg_rxd in freshness.filter(multicast_rxd_queue.get_many()):
+		#	print('STATUS: Message received/send - THREAD: geonetwork_rxd - NODE: {}'.format(node),' - MSG: {}'.format(msg_rxd),'\n')
+			gn = gn_header(msg_rxd) if coordinates is not None else None
+			if gn is not None and not route_rxd(node, msg_rxd, gn, coordinates, table, multicast_txd_queue):
+				continue
+			if (msg_rxd['msg_type']=='CA'):
+				ca_msgs.append(msg_rxd)
+			else:
+				den_msgs.append(msg_rxd)
+		if ca_msgs:
+			geonetwork_rxd_ca_queue.put_many(ca_msgs)
+		if den_msgs:
+			geonetwork_rxd_den_queue.put_many(den_msgs)
 	return
 #------------------------------------------------------------------------------------------------
 # Thread - beacon_rxd - periodical transmission of beacon packets
 #------------------------------------------------------------------------------------------------
 def beacon_txd(node, start_flag, coordinates, multicast_txd_queue):
-	TXD_BEACON_INTERVAL = 5
 	global loc_table
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: beacon_txd - NODE: {}\n'.format(node),'\n')
 
 	while True :
-		time.sleep(TXD_BEACON_INTERVAL)
+		sleep(TXD_BEACON_INTERVAL)
 		x,y,t=position_read(coordinates)
 		update_node_info(node, x, y, t)
 		beacon_pkt_txd=create_beacon(node, x, y, t)
@@ -74,35 +147,145 @@ def beacon_txd(node, start_flag, coordinates, multicast_txd_queue):
 #------------------------------------------------------------------------------------------------
 # Thread -- beacon_rxd - reception of beacon packets and loc_table update
 #		Note: - entry_validity defines the timeout value. The value used is very high to avoid removing entries for the table
+#		table, lock: node's loc_table and its lock - default: module loc_table, used when there is one node per process
 #------------------------------------------------------------------------------------------------
-def beacon_rxd(node, start_flag, beacon_rxd_queue):
-	ENTRY_VALIDITY = 2000
-	global loc_table
+def beacon_rxd(node, start_flag, beacon_rxd_queue, table=None, lock=None):
+	table = loc_table if table is None else table
+	lock = lock_loc_table if lock is None else lock
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: beacon_rxd - NODE: {}'.format(node),'\n')
 
 	while True :
 		beacon_pkt_rxd=beacon_rxd_queue.get()
 #		print('STATUS: Message received/send - THREAD:  beacon_rxd - NODE: {}'.format(node),' - MSG: {}'.format(beacon_pkt_rxd),'\n')
-		neighbour_node=update_loc_table_entry (node, loc_table, beacon_pkt_rxd, lock_loc_table, ENTRY_VALIDITY)
+		neighbour_node=update_loc_table_entry (node, table, beacon_pkt_rxd, lock, ENTRY_VALIDITY)
 #		print('STATUS: Loc_table_updated - THREAD:  beacon_rxd - NODE: {}'.format(node),' - MSG: {}'.format(loc_table),'\n')
 	return
 
+#------------------------------------------------------------------------------------------------
+# geonetwork_on_receive - synchronous version of geonetwork_rxd, for the fused reception pipeline
+#		ca_on_receive, den_on_receive: handlers of the facilities layer
+#		coordinates, table, multicast_txd_queue, stale_stats, max_age: see geonetwork_rxd
+#		(out) - on_receive(msg) function
+#------------------------------------------------------------------------------------------------
+def geonetwork_on_receive(node, ca_on_receive, den_on_receive, coordinates=None, table=None, multicast_txd_queue=None, 
+		stale_stats=None, max_age=MAX_AGE):
+	table = loc_table if table is None else table
+	freshness = FreshnessFilter('geonetwork_rxd', stale_stats, max_age)
+	def on_receive(msg_rxd):
+		if not freshness.fresh(msg_rxd):
+			return
+		gn = gn_header(msg_rxd) if coordinates is not None else None
+		if gn is not None and not route_rxd(node, msg_rxd, gn, coordinates, table, multicast_txd_queue):
+			return
+		if (msg_rxd['msg_type']=='CA'):
+			ca_on_receive(msg_rxd)
+		else:
+			den_on_receive(msg_rxd)
+	return on_receive
+
+#------------------------------------------------------------------------------------------------
+# beacon_on_receive - synchronous version of beacon_rxd, for the fused reception pipeline
+#		(out) - on_receive(beacon) function, that updates the loc_table
+#------------------------------------------------------------------------------------------------
+def beacon_on_receive(node, table=None, lock=None):
+	table = loc_table if table is None else table
+	lock = lock_loc_table if lock is None else lock
+	def on_receive(beacon_pkt_rxd):
+		update_loc_table_entry(node, table, beacon_pkt_rxd, lock, ENTRY_VALIDITY)
+	return on_receive
+
 #------------------------------------------------------------------------------------------------
 # Thread -- check_loc_table - verification of the loc_table status and remove unused entries
 #		Note: - entry_validity defines the timeout value. The value used is very high to avoid removing entries for the table
+#		table, lock: node's loc_table and its lock - default: module loc_table
 #------------------------------------------------------------------------------------------------
-def check_loc_table(node, start_flag):
-	global loc_table
+def check_loc_table(node, start_flag, table=None, lock=None):
+	table = loc_table if table is None else table
+	lock = lock_loc_table if lock is None else lock
 
-	while not start_flag.isSet():
-		time.sleep (1)
+	start_flag.wait()
 	print('STATUS: Ready to start - THREAD: check_loc_table - NODE: {}'.format(node),'\n')
 
 	while True :
-		time.sleep (1)
-		delete_loc_table_entry(loc_table, node, lock_loc_table)
+		sleep (LOC_TABLE_CHECK_INTERVAL)
+		delete_loc_table_entry(table, node, lock)
 #		print('STATUS: Loc_table_updated - THREAD:  check_loc_table - NODE: {}'.format(node),' - MSG: {}'.format(loc_table),'\n')
 	return
+
+
+# #####################################################################################################
+# asyncio runtime - coroutine versions of the threads above. All of them run on the same event loop.
+# Queues read by these coroutines must be LoopQueue objects. loc_table and lock default to the module ones.
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - geonetwork_txd_async - same as geonetwork_txd thread
+#------------------------------------------------------------------------------------------------
+async def geonetwork_txd_async(node, geonetwork_txd_queue, multicast_txd_queue, coordinates=None, table=None):
+	table = loc_table if table is None else table
+	print('STATUS: Ready to start - COROUTINE: geonetwork_txd - NODE: {}'.format(node),'\n')
+	while True :
+		msg_rxd = await geonetwork_txd_queue.get_async()
+		if coordinates is not None and not route_txd(node, [msg_rxd], coordinates, table):
+			continue
+		await multicast_txd_queue.put_async(msg_rxd)
+	return
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - geonetwork_rxd_async - same as geonetwork_rxd thread
+#		The facilities queues are read by threads: a full queue would stall the loop, and every node and
+#		coroutine on it, so messages that do not fit are dropped and counted (see put_or_drop)
+#------------------------------------------------------------------------------------------------
+async def geonetwork_rxd_async(node, multicast_rxd_queue, geonetwork_rxd_ca_queue, geonetwork_rxd_den_queue, stale_stats=None,
+		coordinates=None, table=None, multicast_txd_queue=None, max_age=MAX_AGE):
+	table = loc_table if table is None else table
+	print('STATUS: Ready to start - COROUTINE: geonetwork_rxd - NODE: {}'.format(node),'\n')
+	freshness = FreshnessFilter('geonetwork_rxd', stale_stats, max_age)
+	while True :
+		msg_rxd = await multicast_rxd_queue.get_async()
+		if not freshness.fresh(msg_rxd):
+			continue
+		gn = gn_header(msg_rxd) if coordinates is not None else None
+		if gn is not None and not route_rxd(node, msg_rxd, gn, coordinates, table, multicast_txd_queue):
+			continue
+		if (msg_rxd['msg_type']=='CA'):
+			geonetwork_rxd_ca_queue.put_or_drop(msg_rxd)
+		else:
+			geonetwork_rxd_den_queue.put_or_drop(msg_rxd)
+	return
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - beacon_txd_async - same as beacon_txd thread
+#------------------------------------------------------------------------------------------------
+async def beacon_txd_async(node, coordinates, multicast_txd_queue):
+	print('STATUS: Ready to start - COROUTINE: beacon_txd - NODE: {}'.format(node),'\n')
+	while True :
+		await asyncio.sleep(TXD_BEACON_INTERVAL)
+		x,y,t=position_read(coordinates)
+		await multicast_txd_queue.put_async(create_beacon(node, x, y, t))
+	return
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - beacon_rxd_async - same as beacon_rxd thread
+#------------------------------------------------------------------------------------------------
+async def beacon_rxd_async(node, beacon_rxd_queue, table=None, lock=None):
+	table = loc_table if table is None else table
+	lock = lock_loc_table if lock is None else lock
+	print('STATUS: Ready to start - COROUTINE: beacon_rxd - NODE: {}'.format(node),'\n')
+	while True :
+		beacon_pkt_rxd = await beacon_rxd_queue.get_async()
+		update_loc_table_entry(node, table, beacon_pkt_rxd, lock, ENTRY_VALIDITY)
+	return
+
+#------------------------------------------------------------------------------------------------
+# Coroutine - check_loc_table_async - same as check_loc_table thread
+#------------------------------------------------------------------------------------------------
+async def check_loc_table_async(node, table=None, lock=None):
+	table = loc_table if table is None else table
+	lock = lock_loc_table if lock is None else lock
+	print('STATUS: Ready to start - COROUTINE: check_loc_table - NODE: {}'.format(node),'\n')
+	while True :
+		await asyncio.sleep(LOC_TABLE_CHECK_INTERVAL)
+		delete_loc_table_entry(table, node, lock)
+	return
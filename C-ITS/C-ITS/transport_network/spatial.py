@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# #################################################
+## SPATIAL INDEX OF THE LOC_TABLE - the loc_table is a dictionary of neighbours keyed by node that also keeps
+# its entries hashed on a uniform grid of square cells (cell_size, in coordinate units). Entries are
+# re-hashed when they are added, updated or deleted, so the queries below only visit the cells around the
+# queried area instead of the whole table:
+#	within(x, y, r)             - neighbours within distance r of (x,y)
+#	nearest(x, y, k)            - the k neighbours closest to (x,y)
+#	in_rect(x1, y1, x2, y2)     - neighbours inside the rectangle
+# The cell size should be close to the radio range, so that a radius query visits 3x3 cells.
+# Entries with a 'timeout' are also kept on a min-heap of expiry deadlines: expire(t) removes the entries whose
+# timeout passed by popping the heap, so its cost depends on the expired entries, not on the table size.
+# A refreshed entry is not searched on the heap: its old deadline is skipped when popped (lazy invalidation).
+# The bounding box of the occupied cells is kept with the grid, so nearest() only visits the rings of cells that
+# overlap it. It grows on insert; when an edge cell empties it is marked stale and recomputed by the next nearest().
+# Note: updates are made under lock_loc_table (see geo.py); queries may run concurrently with them.
+#################################################
+import math
+import heapq
+
+LOC_CELL_SIZE = 50
+
+
+#------------------------------------------------------------------------------------------------
+# LocTable - loc_table with a grid index. Entries are dictionaries with, at least, pos_x and pos_y.
+#		cells - dictionary (cx, cy) -> set of nodes in the cell
+#		where - dictionary node -> cell of the node
+#		next_hops - routing decisions cached by find_next_hop (see geo.py), cleared whenever a neighbour
+#		        joins, leaves or moves (also within its cell: a greedy decision depends on its exact position)
+#		expiries - heap of (timeout, node), one item per update of an entry
+#		bbox - (cx1, cy1, cx2, cy2) bounding box of the occupied cells, None when empty or stale
+#------------------------------------------------------------------------------------------------
+class LocTable(dict):
+
+	def __init__(self, *args, cell_size=LOC_CELL_SIZE, **kwargs):
+		super().__init__()
+		self.cell_size = cell_size
+		self.cells = dict()
+		self.where = dict()
+		self.next_hops = dict()
+		self.expiries = []
+		self.bbox = None
+		self.update(*args, **kwargs)
+
+	def cell_of(self, x, y):
+		return int(x // self.cell_size), int(y // self.cell_size)
+
+	def _index(self, node, entry):
+		cell = self.cell_of(entry['pos_x'], entry['pos_y'])
+		old = self.where.get(node)
+		if old == cell:
+			return
+		if old is not None:
+			self._unindex(node)
+		if cell not in self.cells:
+			self.cells[cell] = set()
+			if self.bbox is not None:
+				cx1, cy1, cx2, cy2 = self.bbox
+				self.bbox = (min(cx1, cell[0]), min(cy1, cell[1]), max(cx2, cell[0]), max(cy2, cell[1]))
+			elif len(self.cells) == 1:
+				self.bbox = cell + cell
+		self.cells[cell].add(node)
+		self.where[node] = cell
+		self.next_hops.clear()
+
+	def _unindex(self, node):
+		cell = self.where.pop(node, None)
+		if cell is None:
+			return
+		nodes = self.cells[cell]
+		nodes.discard(node)
+		if not nodes:
+			del self.cells[cell]
+			if self.bbox is not None:
+				cx1, cy1, cx2, cy2 = self.bbox
+				if cell[0] in (cx1, cx2) or cell[1] in (cy1, cy2):
+					self.bbox = None
+		self.next_hops.clear()
+
+	# dictionary operations that change entries
+	def __setitem__(self, node, entry):
+		old = self.get(node)
+		super().__setitem__(node, entry)
+		self._index(node, entry)
+		if old is not None and (old['pos_x'], old['pos_y']) != (entry['pos_x'], entry['pos_y']):
+			self.next_hops.clear()
+		if entry.get('timeout') is not None:
+			self._schedule(node, entry['timeout'])
+
+	def __delitem__(self, node):
+		super().__delitem__(node)
+		self._unindex(node)
+
+	def update(self, *args, **kwargs):
+		for node, entry in dict(*args, **kwargs).items():
+			self[node] = entry
+
+	def pop(self, node, *default):
+		self._unindex(node)
+		return super().pop(node, *default)
+
+	def popitem(self):
+		node, entry = super().popitem()
+		self._unindex(node)
+		return node, entry
+
+	def setdefault(self, node, entry=None):
+		if node not in self:
+			self[node] = entry
+		return self[node]
+
+	def clear(self):
+		super().clear()
+		self.cells.clear()
+		self.where.clear()
+		self.next_hops.clear()
+		self.expiries = []
+		self.bbox = None
+
+	def copy(self):
+		return LocTable(self, cell_size=self.cell_size)
+
+	# expiry
+	def _schedule(self, node, timeout):
+		heapq.heappush(self.expiries, (timeout, node))
+		# drop the deadlines of refreshed entries when they outnumber the live ones
+		if len(self.expiries) > 2*len(self) + 64:
+			self.expiries = [(entry['timeout'], n) for n, entry in self.items() if entry.get('timeout') is not None]
+			heapq.heapify(self.expiries)
+
+	def next_expiry(self):
+		# (out) - earliest deadline on the heap (it may belong to a refreshed entry), None if there is none
+		expiries = self.expiries
+		return expiries[0][0] if expiries else None
+
+	def expire(self, t):
+		# remove the entries whose timeout is earlier than t - (out) list of removed nodes
+		removed = []
+		while self.expiries and self.expiries[0][0] < t:
+			timeout, node = heapq.heappop(self.expiries)
+			entry = self.get(node)
+			if entry is not None and entry.get('timeout') == timeout:
+				del self[node]
+				removed.append(node)
+		return removed
+
+	# queries
+	def _cells_in(self, cx1, cy1, cx2, cy2):
+		# nodes of the cells of a block of cells - the occupied cells are visited when they are fewer
+		if (cx2 - cx1 + 1)*(cy2 - cy1 + 1) > len(self.cells):
+			for (cx, cy), nodes in list(self.cells.items()):
+				if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+					yield from list(nodes)
+		else:
+			for cx in range(cx1, cx2 + 1):
+				for cy in range(cy1, cy2 + 1):
+					yield from list(self.cells.get((cx, cy), ()))
+
+	def _entries(self, nodes):
+		for node in nodes:
+			entry = self.get(node)
+			if entry is not None:
+				yield node, entry
+
+	def distance(self, entry, x, y):
+		return math.hypot(entry['pos_x'] - x, entry['pos_y'] - y)
+
+	def within(self, x, y, r):
+		# (out) - list of (distance, node) of the neighbours within distance r of (x,y), closest first
+		cx1, cy1 = self.cell_of(x - r, y - r)
+		cx2, cy2 = self.cell_of(x + r, y + r)
+		found = []
+		for node, entry in self._entries(self._cells_in(cx1, cy1, cx2, cy2)):
+			d = self.distance(entry, x, y)
+			if d <= r:
+				found.append((d, node))
+		found.sort()
+		return found
+
+	def in_rect(self, x1, y1, x2, y2):
+		# (out) - list of the nodes inside the rectangle with corners (x1,y1) and (x2,y2)
+		x1, x2 = min(x1, x2), max(x1, x2)
+		y1, y2 = min(y1, y2), max(y1, y2)
+		cx1, cy1 = self.cell_of(x1, y1)
+		cx2, cy2 = self.cell_of(x2, y2)
+		return [node for node, entry in self._entries(self._cells_in(cx1, cy1, cx2, cy2))
+			if x1 <= entry['pos_x'] <= x2 and y1 <= entry['pos_y'] <= y2]
+
+	def bounds(self):
+		# (out) - bounding box of the occupied cells, recomputed if an edge cell was emptied; None if empty
+		if self.bbox is None and self.cells:
+			cells = list(self.cells)
+			self.bbox = (min(c[0] for c in cells), min(c[1] for c in cells), max(c[0] for c in cells), max(c[1] for c in cells))
+		return self.bbox
+
+	def _ring(self, cx, cy, ring, bbox):
+		# cells at Chebyshev distance ring from cell (cx,cy) that lie inside the bounding box
+		bx1, by1, bx2, by2 = bbox
+		x1, x2 = max(cx - ring, bx1), min(cx + ring, bx2)
+		y1, y2 = max(cy - ring + 1, by1), min(cy + ring - 1, by2)
+		cells = []
+		for y in ((cy - ring, cy + ring) if ring else (cy,)):
+			if by1 <= y <= by2:
+				cells += [(x, y) for x in range(x1, x2 + 1)]
+		for x in ((cx - ring, cx + ring) if ring else ()):
+			if bx1 <= x <= bx2:
+				cells += [(x, y) for y in range(y1, y2 + 1)]
+		return cells
+
+	def nearest(self, x, y, k=1, exclude=()):
+		# (out) - list of (distance, node) of the k neighbours closest to (x,y), closest first
+		#		Rings of cells around (x,y) are visited, clipped to the bounding box, until the k-th closest
+		#		node is nearer than the next ring.
+		bbox = self.bounds()
+		if k <= 0 or bbox is None:
+			return []
+		cx, cy = self.cell_of(x, y)
+		bx1, by1, bx2, by2 = bbox
+		min_ring = max(0, bx1 - cx, cx - bx2, by1 - cy, cy - by2)
+		max_ring = max(abs(cx - bx1), abs(cx - bx2), abs(cy - by1), abs(cy - by2))
+		best = []
+		for ring in range(min_ring, max_ring + 1):
+			cells = self._ring(cx, cy, ring, bbox)
+			for node, entry in self._entries(n for cell in cells for n in list(self.cells.get(cell, ()))):
+				if node in exclude:
+					continue
+				item = (-self.distance(entry, x, y), node)
+				if len(best) < k:
+					heapq.heappush(best, item)
+				elif item > best[0]:
+					heapq.heapreplace(best, item)
+			# any node beyond this ring is at least ring*cell_size away from (x,y)
+			if len(best) == k and -best[0][0] <= ring*self.cell_size:
+				break
+		return sorted((-d, node) for d, node in best)